@@ -1,15 +1,21 @@
 import dash
 from dash import dcc, html
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import polars as pl
-import os
 from datetime import datetime, timedelta
 
+from src.utils.rollup_cache import RollupCache, clasificar
+from src.utils.downsampling import reducir_minmax, reducir_marcadores
+
 # --- CONFIGURACIÓN ---
-FILE_PATH = os.path.join("data", "raw", "sesion_ballenas.csv")
+SESION = "sesion_ballenas" # Segmentos Parquet (data/raw/sesion_ballenas/) o CSV heredado
+
+# Agregados 1m/5m/15m/1h materializados; cada refresco solo incorpora filas nuevas
+rollups = RollupCache(SESION)
 UPDATE_INTERVAL_MS = 60 * 1000  # 1 minuto
+ANCHO_DEFECTO_PX = 1600         # Si el navegador aún no reportó su ancho
 
 REGIMEN_COLORS = {
     0: "gray",    1: "#90EE90", 2: "#FFCCCC",
@@ -66,90 +72,50 @@ app.layout = html.Div(style={'backgroundColor': '#000000', 'color': '#00F0FF', '
     ], style={'display': 'flex', 'alignItems': 'center', 'marginBottom': '5px', 'borderBottom': '1px solid #333', 'paddingBottom': '10px'}),
 
     dcc.Graph(id='history-graph', style={'height': '85vh'}),
-    dcc.Interval(id='interval-history', interval=UPDATE_INTERVAL_MS, n_intervals=0)
+    dcc.Interval(id='interval-history', interval=UPDATE_INTERVAL_MS, n_intervals=0),
+    dcc.Store(id='store-ancho-px')
 ])
 
-def procesar_logica_estrategia(df, timeframe_val, umbral):
-    # Agrupación dinámica con Polars
-    q = (
-        df.sort("datetime")
-        .group_by_dynamic("datetime", every=timeframe_val)
-        .agg([
-            pl.col("Close_Price").first().alias("open_seg"),
-            pl.col("Close_Price").last().alias("close_seg"),
-            pl.col("EMA_Princ").last().alias("ema_last"),
-            pl.col("Micro_Score").mean().alias("score_avg"),
-            pl.col("Regimen_Actual").mode().first().alias("regimen_mode")
-        ])
-    )
-    df_agg = q
-    
-    # Delta de precio
-    df_agg = df_agg.with_columns(
-        (pl.col("close_seg") - pl.col("open_seg")).alias("price_delta")
-    )
-
-    # LÓGICA DE DETECCIÓN (Usando el umbral dinámico)
-    # Absorción: Score muy negativo (< -umbral) PERO Precio >= 0
-    # Distribución: Score muy positivo (> umbral) PERO Precio <= 0
-    df_agg = df_agg.with_columns(
-        pl.when((pl.col("score_avg") < -umbral) & (pl.col("price_delta") >= 0))
-          .then(pl.lit("ABSORCION"))
-          .when((pl.col("score_avg") > umbral) & (pl.col("price_delta") <= 0))
-          .then(pl.lit("DISTRIBUCION"))
-          .otherwise(pl.lit("NORMAL"))
-          .alias("estrategia")
-    )
-
-    return df_agg
+# Ancho real del gráfico en píxeles (lo mide el navegador) para ajustar la reducción de puntos
+app.clientside_callback(
+    """
+    function(n) {
+        var g = document.getElementById('history-graph');
+        return g ? g.clientWidth : window.innerWidth;
+    }
+    """,
+    Output('store-ancho-px', 'data'),
+    Input('interval-history', 'n_intervals')
+)
 
 @app.callback(
     Output('history-graph', 'figure'),
     [Input('interval-history', 'n_intervals'),
      Input('dropdown-timeframe', 'value'),
      Input('dropdown-history', 'value'),
-     Input('slider-umbral', 'value')] # <--- Nuevo Input
+     Input('slider-umbral', 'value')], # <--- Nuevo Input
+    [State('store-ancho-px', 'data')]
 )
-def update_history(n, timeframe_val, history_val, umbral_val):
-    if not os.path.exists(FILE_PATH): return dash.no_update
-    
+def update_history(n, timeframe_val, history_val, umbral_val, ancho_px):
     try:
-        df = pl.read_csv(FILE_PATH, ignore_errors=True)
-        cols_check = ["Close_Price", "EMA_Princ", "Micro_Score", "Regimen_Actual"]
-        for c in cols_check:
-            if c in df.columns: df = df.with_columns(pl.col(c).cast(pl.Float64, strict=False).fill_null(0))
-
-        if "Timestamp" in df.columns:
-            try: df = df.with_columns(pl.col("Timestamp").str.to_datetime(strict=False).alias("datetime"))
-            except: return dash.no_update
-        
-        df = df.drop_nulls(subset=["datetime"]).sort("datetime")
+        if not rollups.sincronizar(): return dash.no_update
 
-        if history_val > 0:
-            cutoff = datetime.now() - timedelta(hours=history_val)
-            df = df.filter(pl.col("datetime") >= cutoff)
+        cutoff = datetime.now() - timedelta(hours=history_val) if history_val > 0 else None
+        df = rollups.obtener(timeframe_val, desde=cutoff)
         
-        if df.height == 0: return dash.no_update
+        if df is None or df.height == 0: return dash.no_update
 
         # --- PROCESAMIENTO ---
-        if timeframe_val == '1m':
-            # Lógica cruda para 1m
-            df = df.with_columns([
-                (pl.col("Close_Price") - pl.col("Close_Price").shift(1).fill_null(pl.col("Close_Price"))).alias("price_delta"),
-                pl.col("Micro_Score").alias("score_avg"),
-                pl.col("Close_Price").alias("close_seg"),
-                pl.col("EMA_Princ").alias("ema_last"),
-                pl.col("Regimen_Actual").alias("regimen_mode")
-            ])
-            # Usamos el umbral del slider
-            df = df.with_columns(
-                pl.when((pl.col("score_avg") < -umbral_val) & (pl.col("price_delta") >= 0)).then(pl.lit("ABSORCION"))
-                  .when((pl.col("score_avg") > umbral_val) & (pl.col("price_delta") <= 0)).then(pl.lit("DISTRIBUCION"))
-                  .otherwise(pl.lit("NORMAL")).alias("estrategia")
-            )
-        else:
-            # Lógica agrupada pasando el umbral
-            df = procesar_logica_estrategia(df, timeframe_val, umbral_val)
+        # Solo la clasificación depende del slider: corre sobre el frame ya agregado
+        df = clasificar(df, umbral_val)
+
+        # Reducción visual ligada al ancho en píxeles. Los marcadores salen del frame completo
+        # (ningún píxel con trampa queda sin triángulo) pero a lo sumo uno por píxel: con el
+        # slider al mínimo casi toda fila es marcador y el payload volvería a crecer con la historia
+        ancho = int(ancho_px or ANCHO_DEFECTO_PX)
+        df_abs = reducir_marcadores(df, ancho, pl.col("estrategia") == "ABSORCION")
+        df_dist = reducir_marcadores(df, ancho, pl.col("estrategia") == "DISTRIBUCION")
+        df = reducir_minmax(df, ancho, cols_y=["close_seg", "ema_last", "score_avg"])
 
         # --- GRÁFICO ---
         fig = make_subplots(
@@ -164,7 +130,6 @@ def update_history(n, timeframe_val, history_val, umbral_val):
             fig.add_trace(go.Scatter(x=df["datetime"], y=df["ema_last"], mode='lines', name='EMA', line=dict(color='#FFD700', dash='dot', width=1)), row=1, col=1)
 
         # TRIÁNGULOS DE ESTRATEGIA
-        df_abs = df.filter(pl.col("estrategia") == "ABSORCION")
         if df_abs.height > 0:
             fig.add_trace(go.Scatter(
                 x=df_abs["datetime"], y=df_abs["close_seg"],
@@ -172,7 +137,6 @@ def update_history(n, timeframe_val, history_val, umbral_val):
                 marker=dict(symbol='triangle-up', size=14, color='cyan', line=dict(width=2, color='white'))
             ), row=1, col=1)
 
-        df_dist = df.filter(pl.col("estrategia") == "DISTRIBUCION")
         if df_dist.height > 0:
             fig.add_trace(go.Scatter(
                 x=df_dist["datetime"], y=df_dist["close_seg"],
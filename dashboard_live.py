@@ -6,9 +6,26 @@ from plotly.subplots import make_subplots
 import polars as pl
 import os
 
+from src.utils.file_follower import SeguidorCSV
+
 # --- CONFIGURACIÓN ---
 FILE_PATH = os.path.join("data", "raw", "live_lite.csv")
 UPDATE_INTERVAL_MS = 1000  # 1 segundo
+VENTANA_PUNTOS = 100       # Últimos puntos para zoom táctico
+
+# Lector incremental: cada refresco solo parsea las líneas nuevas del archivo
+# Lectura Forzada de Tipos (Esto soluciona el gráfico vacío)
+seguidor = SeguidorCSV(
+    FILE_PATH,
+    ventana=VENTANA_PUNTOS,
+    schema_overrides={
+        "Timestamp": pl.Int64,       # Importante: Entero para milisegundos
+        "Close_Price": pl.Float64,
+        "EMA_Princ": pl.Float64,
+        "Micro_Score": pl.Float64,
+        "Regimen_Actual": pl.Int64
+    }
+)
 
 # Colores IA
 REGIMEN_COLORS = {
@@ -39,26 +56,13 @@ def update_live(n):
         }
 
     try:
-        # 2. Lectura Forzada de Tipos (Esto soluciona el gráfico vacío)
-        # Le decimos explícitamente qué es cada columna para que no se confunda
-        df = pl.read_csv(
-            FILE_PATH, 
-            ignore_errors=True,
-            schema_overrides={
-                "Timestamp": pl.Int64,       # Importante: Entero para milisegundos
-                "Close_Price": pl.Float64,
-                "EMA_Princ": pl.Float64,
-                "Micro_Score": pl.Float64,
-                "Regimen_Actual": pl.Int64
-            }
-        )
+        # 2. Lectura incremental (ventana acotada, trabajo constante por refresco)
+        df = seguidor.leer()
         
         # Si está vacío, esperar
-        if df.height < 1:
+        if df is None or df.height < 1:
             return dash.no_update
 
-        print(f"[DEBUG] Leyendo {df.height} filas para el Live...")
-
         # 3. Conversión de Fecha (Maneja Int o String)
         if df["Timestamp"].dtype == pl.Int64:
             # Caso ideal: viene del live_lite como milisegundos
@@ -67,10 +71,6 @@ def update_live(n):
             # Fallback por si acaso
             df = df.with_columns(pl.int_range(0, df.height).alias("datetime"))
 
-        # Recorte visual (últimos 100 puntos para zoom táctico)
-        if df.height > 100:
-            df = df.tail(100)
-
     except Exception as e:
         print(f"[ERROR DASH] {e}")
         return dash.no_update
@@ -4,21 +4,39 @@ import time
 import csv
 from datetime import datetime
 from colorama import init, Fore, Back, Style
-import polars as pl
-import MetaTrader5 as mt5_lib 
 
 # --- 1. CONFIGURACIÓN DE RUTAS ---
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(current_dir)
 
+# --- 1.b MODO REPLAY (Sin terminal MT5) ---
+# BALLENAS_REPLAY_TICKS=ruta.parquet  [BALLENAS_REPLAY_VELAS=ruta.parquet]  [BALLENAS_REPLAY_VELOCIDAD=1 | N | 0]
+# Debe instalarse ANTES de que cualquier módulo importe MetaTrader5.
+REPLAY = None
+if os.environ.get("BALLENAS_REPLAY_TICKS"):
+    from src.connection import mt5_simulado
+    REPLAY = mt5_simulado.instalar(
+        os.environ["BALLENAS_REPLAY_TICKS"],
+        velas_path=os.environ.get("BALLENAS_REPLAY_VELAS"),
+        velocidad=float(os.environ.get("BALLENAS_REPLAY_VELOCIDAD", "1"))
+    )
+
+import MetaTrader5 as mt5_lib 
+
 # --- 2. IMPORTACIONES ---
 from src.connection.mt5_connector import MT5Connector
-from src.features.microstructure import MicrostructureAnalyzer 
-from src.features.indicators import TechnicalIndicators 
+from src.connection.tick_feed import AlimentadorTicks
+from src.features.microstructure import MicrostructureStream
+from src.features.indicators import IndicadoresIncrementales
+from src.features.tick_buffer import TickRingBuffer
 from src.utils.logger import DataLogger
-from src.models.predictor import MarketPredictor
+from src.utils.tick_recorder import TickRecorder
+from src.utils.terminal_render import RenderizadorTerminal
+from src.utils.latency_metrics import MetricasLatencia, DesfaseServidor
+from src.models.predictor import MarketPredictor, PredictorConCache
 from src.strategies.whale_detector import WhaleDetector
 from src.execution.trader import MT5Trader
+from src.execution.execution_worker import EjecutorOrdenes
 
 init(autoreset=True)
 
@@ -42,20 +60,19 @@ REGIMEN_MAP = {
 }
 
 # --- VISUALIZACIÓN ---
-def limpiar_consola():
-    os.system('cls' if os.name == 'nt' else 'clear')
+def componer_dashboard(snapshot):
+    """Arma las líneas del dashboard a partir de un snapshot (lo llama el hilo de render)."""
+    micro, macro, grabando, ia_data, estado_trading = snapshot
+    lineas = []
 
-def render_dashboard(micro, macro, grabando, ia_data, estado_trading):
-    limpiar_consola()
-    
     # 1. HEADER (Estado del Sistema)
     tics = micro.get('intensidad', 0)
     estatus_bot = f"{Back.GREEN}{Fore.WHITE} BOT ACTIVO {Style.RESET_ALL}" if estado_trading else f"{Back.YELLOW}{Fore.BLACK} SOLO MONITOR {Style.RESET_ALL}"
     rec_icon = f"{Back.RED}{Fore.WHITE} ● REC {Style.RESET_ALL}" if grabando else f"{Fore.BLACK}{Back.WHITE} PAUSA {Style.RESET_ALL}"
     
     titulo = f" BALLENAS IA | {SYMBOL} | Tics: {tics} "
-    print(Fore.WHITE + Back.BLUE + Style.BRIGHT + titulo.ljust(60) + Style.RESET_ALL + " " + estatus_bot + " " + rec_icon)
-    print("-" * 80)
+    lineas.append(Fore.WHITE + Back.BLUE + Style.BRIGHT + titulo.ljust(60) + Style.RESET_ALL + " " + estatus_bot + " " + rec_icon)
+    lineas.append("-" * 80)
     
     # 2. SECCIÓN IA (Cerebro Completo)
     if ia_data and "regimen" in ia_data:
@@ -71,9 +88,9 @@ def render_dashboard(micro, macro, grabando, ia_data, estado_trading):
         
         reg_nombre = REGIMEN_MAP.get(reg_id, "Desconocido")
         
-        print(f"🧠 {Style.BRIGHT}CEREBRO IA:{Style.RESET_ALL}")
-        print(f"   Decisión Final: {color_ia}{Style.BRIGHT}{reg_nombre}{Style.RESET_ALL} (Confianza: {confianza:.1f}%)")
-        print(f"   {Fore.BLACK}{Back.WHITE} DEBATE INTERNO (Probabilidades): {Style.RESET_ALL}")
+        lineas.append(f"🧠 {Style.BRIGHT}CEREBRO IA:{Style.RESET_ALL}")
+        lineas.append(f"   Decisión Final: {color_ia}{Style.BRIGHT}{reg_nombre}{Style.RESET_ALL} (Confianza: {confianza:.1f}%)")
+        lineas.append(f"   {Fore.BLACK}{Back.WHITE} DEBATE INTERNO (Probabilidades): {Style.RESET_ALL}")
         
         # Barra de probabilidad visual
         def fmt_prob(idx, nombre, color_base):
@@ -83,19 +100,19 @@ def render_dashboard(micro, macro, grabando, ia_data, estado_trading):
             barra = "█" * int(p / 5) 
             return f"{color_base}{estilo}[{idx}] {nombre:<11}: {p:5.1f}% {barra} {marcador}{Style.RESET_ALL}"
 
-        print(fmt_prob(0, "LATERAL", Fore.YELLOW))
-        print("-" * 40)
-        print(fmt_prob(1, "ALCISTA (D)", Fore.GREEN))
-        print(fmt_prob(3, "ALCISTA (V)", Fore.GREEN))
-        print(fmt_prob(5, "ALCISTA (F)", Fore.GREEN))
-        print("-" * 40)
-        print(fmt_prob(2, "BAJISTA (D)", Fore.RED))
-        print(fmt_prob(4, "BAJISTA (V)", Fore.RED))
-        print(fmt_prob(6, "BAJISTA (F)", Fore.RED))
+        lineas.append(fmt_prob(0, "LATERAL", Fore.YELLOW))
+        lineas.append("-" * 40)
+        lineas.append(fmt_prob(1, "ALCISTA (D)", Fore.GREEN))
+        lineas.append(fmt_prob(3, "ALCISTA (V)", Fore.GREEN))
+        lineas.append(fmt_prob(5, "ALCISTA (F)", Fore.GREEN))
+        lineas.append("-" * 40)
+        lineas.append(fmt_prob(2, "BAJISTA (D)", Fore.RED))
+        lineas.append(fmt_prob(4, "BAJISTA (V)", Fore.RED))
+        lineas.append(fmt_prob(6, "BAJISTA (F)", Fore.RED))
     else:
-        print(Fore.YELLOW + "🧠 IA: Recopilando datos para inferencia...")
+        lineas.append(Fore.YELLOW + "🧠 IA: Recopilando datos para inferencia...")
 
-    print("-" * 80)
+    lineas.append("-" * 80)
 
     # 3. SECCIÓN MACRO (Indicadores Técnicos)
     precio_actual = 0.0
@@ -109,20 +126,20 @@ def render_dashboard(micro, macro, grabando, ia_data, estado_trading):
         c_rsi = Fore.RED if rsi > 70 else Fore.GREEN if rsi < 30 else Fore.WHITE
         c_adx = Fore.GREEN if adx > 25 else Fore.YELLOW
         
-        print(f"📊 {Style.BRIGHT}MACRO (M1):{Style.RESET_ALL}")
-        print(f"   Precio    : {Fore.CYAN}{precio_actual:.2f}{Style.RESET_ALL}")
-        print(f"   EMA Trend : {Fore.YELLOW}{ema:.2f}{Style.RESET_ALL}")
-        print(f"   RSI (14)  : {c_rsi}{rsi:.1f}{Style.RESET_ALL}") 
-        print(f"   ADX (14)  : {c_adx}{adx:.1f}{Style.RESET_ALL}") 
+        lineas.append(f"📊 {Style.BRIGHT}MACRO (M1):{Style.RESET_ALL}")
+        lineas.append(f"   Precio    : {Fore.CYAN}{precio_actual:.2f}{Style.RESET_ALL}")
+        lineas.append(f"   EMA Trend : {Fore.YELLOW}{ema:.2f}{Style.RESET_ALL}")
+        lineas.append(f"   RSI (14)  : {c_rsi}{rsi:.1f}{Style.RESET_ALL}") 
+        lineas.append(f"   ADX (14)  : {c_adx}{adx:.1f}{Style.RESET_ALL}") 
     else:
-        print("Cargando indicadores macro...")
+        lineas.append("Cargando indicadores macro...")
 
-    print("-" * 80)
+    lineas.append("-" * 80)
     
     # 4. SECCIÓN MICRO (Estrategia y Flow)
     if micro.get("status") == "EMPTY":
-        print(Fore.RED + "Esperando flujo de ticks...")
-        return
+        lineas.append(Fore.RED + "Esperando flujo de ticks...")
+        return lineas
 
     # A. Datos Instantáneos
     desbalance = micro.get('desbalance', 0.0)
@@ -184,10 +201,11 @@ def render_dashboard(micro, macro, grabando, ia_data, estado_trading):
         elif evento == "RANGO_NEUTRAL":
             msg_texto = f"⏸️  NEUTRAL (Sin dirección clara)"
 
-    print(f"🐋 {Style.BRIGHT}MICRO (Estrategia 5m):{Style.RESET_ALL}")
-    print(f"   Estado      : {msg_color}{msg_texto}{Style.RESET_ALL} {targets_txt}")
-    print(f"   Flow (Inst) : [{color_state}{barra_str}{Style.RESET_ALL}] {desbalance:.2f}")
-    print("-" * 80)
+    lineas.append(f"🐋 {Style.BRIGHT}MICRO (Estrategia 5m):{Style.RESET_ALL}")
+    lineas.append(f"   Estado      : {msg_color}{msg_texto}{Style.RESET_ALL} {targets_txt}")
+    lineas.append(f"   Flow (Inst) : [{color_state}{barra_str}{Style.RESET_ALL}] {desbalance:.2f}")
+    lineas.append("-" * 80)
+    return lineas
 
 # --- BUCLE PRINCIPAL ---
 def main():
@@ -197,14 +215,17 @@ def main():
     mt5_con = MT5Connector() 
     if not mt5_con.conectar(): return
 
-    micro_analyzer = MicrostructureAnalyzer() 
+    micro_analyzer = MicrostructureStream(ventana_ticks=1000)
     whale_strategy = WhaleDetector(ventana_segundos=300) 
-    technical_calc = TechnicalIndicators() 
+    technical_calc = IndicadoresIncrementales()
     logger = DataLogger() 
-    predictor = MarketPredictor() 
+    tick_recorder = TickRecorder() # Archivo de tics crudos por día (para backtest de order flow)
+    # Cache por (vela, features): si nada cambió desde el último segundo, no se vuelve a inferir
+    predictor = PredictorConCache(MarketPredictor())
     
     # BRAZO ROBÓTICO
-    trader = MT5Trader(SYMBOL, LOT_SIZE, MAGIC_NUMBER)
+    # Libro de posiciones en memoria; positions_get solo cada 2 s para detectar cierres externos
+    trader = MT5Trader(SYMBOL, LOT_SIZE, MAGIC_NUMBER, intervalo_reconciliacion=2.0)
     
     print("Sincronizando histórico...")
     df_raw_pl = mt5_con.obtener_velas_recientes(SYMBOL, timeframe=TIMEFRAME, num_velas=HISTORY_BARS)
@@ -213,46 +234,93 @@ def main():
     print(Fore.GREEN + "Sistema EN LÍNEA. Escuchando mercado...")
     time.sleep(1)
 
+    feed = None
+    # Dashboard en su propio hilo: el bucle de trading solo publica snapshots
+    render = RenderizadorTerminal(componer_dashboard, hz=4)
+    # Latencias por etapa -> data/metrics/latencias_*.jsonl (BALLENAS_METRICS_PORT=9100 -> GET /metrics)
+    metricas = MetricasLatencia(puerto=int(os.environ.get("BALLENAS_METRICS_PORT", "0")) or None)
+    # Órdenes en su propio hilo (comparte la conexión bajo MT5_LOCK): la detección no espera a order_send
+    ejecutor = EjecutorOrdenes(trader, max_reintentos=3, metricas=metricas)
+
     try:
         grabando = False
         ultimo_segundo = 0
-        df_ticks_acumulado = pl.DataFrame()
+        buffer_ticks = TickRingBuffer(capacidad=1000)
+        # Ingesta en su propio hilo: solo tics nuevos, cola acotada.
+        # En replay se espera al consumidor en vez de descartar (el reloj virtual no corre solo a velocidad 0).
+        feed = AlimentadorTicks(
+            SYMBOL,
+            intervalo_poll=0.0 if REPLAY is not None and REPLAY.velocidad <= 0 else 0.01,
+            espera_max_seg=None if REPLAY is not None else 0.05,
+            fin_datos=REPLAY.terminado if REPLAY is not None else None,
+            metricas=metricas
+        )
+        # time_msc está en hora del servidor: el huso se estima con los primeros tics
+        desfase_servidor = DesfaseServidor()
         
         # Control de disparo (Cooldown)
         ultimo_disparo_ts = 0 
         COOLDOWN_SEG = 300 # 5 min entre operaciones
 
+        feed.iniciar()
+        render.iniciar()
+        metricas.iniciar()
+        ejecutor.iniciar()
+
         while True:
-            tick_raw = mt5_lib.symbol_info_tick(SYMBOL)
-            
-            if tick_raw:
-                tick = tick_raw._asdict()
-                ts_actual_sec = int(time.time())
+            # Despierta apenas hay un tic nuevo (sin sleep fijo)
+            tick = feed.obtener(timeout=1.0)
+            if tick is None and feed.error is not None:
+                raise RuntimeError(f"El hilo de ingesta de tics se detuvo: {feed.error}")
+            if tick is None and feed.terminado():
+                render.detener()
+                if REPLAY is not None: print(f"\n[REPLAY] Fin de datos: {REPLAY.estadisticas()}")
+                break
+
+            if tick:
+                t_tick = metricas.inicio()
+                # En replay manda el reloj virtual (ventana de 300 s, cooldown y bloque macro como en vivo)
+                ts_actual_sec = tick['time_msc'] // 1000 if REPLAY is not None else int(time.time())
+                # Antigüedad del dato: reloj local vs. time_msc sin el huso del servidor (en replay no aplica)
+                if REPLAY is None:
+                    ahora_ms = time.time() * 1000
+                    desfase_ms = desfase_servidor.observar(ahora_ms, tick['time_msc'])
+                    if desfase_ms is not None:
+                        metricas.registrar_valor("staleness_feed", (ahora_ms - tick['time_msc'] - desfase_ms) * 1000)
+                metricas.registrar("cola_feed", tick['t_ingesta_ns'])
                 
-                # 1. Acumular Tick
-                nuevo_tick = pl.DataFrame({
-                    "time": [tick['time']], "bid": [tick['bid']], "ask": [tick['ask']], 
-                    "flags": [tick['flags']], "timestamp_ms": [int(time.time() * 1000)]
-                })
-                try:
-                    df_ticks_acumulado = pl.concat([df_ticks_acumulado, nuevo_tick])
-                    if df_ticks_acumulado.height > 1000: df_ticks_acumulado = df_ticks_acumulado.tail(1000)
-                except: df_ticks_acumulado = nuevo_tick
-
-                # 2. Análisis Micro
-                metrics_micro = micro_analyzer.analizar_flujo(df_ticks_acumulado)
+                # 1. Acumular Tick (Ring buffer preasignado, sin DataFrame nuevo por tick)
+                buffer_ticks.agregar(tick['time_msc'], tick['bid'], tick['ask'], tick['flags'])
+                tick_recorder.registrar(tick['time_msc'], tick['bid'], tick['ask'], tick['flags'])
+
+                # 2. Análisis Micro (Incremental O(1), misma ventana que el buffer)
+                t0 = metricas.inicio()
+                metrics_micro = micro_analyzer.actualizar(tick['bid'], tick['ask'])
+                metricas.registrar("micro", t0)
                 precio_ask = tick['ask'] # Para comprar
                 precio_bid = tick['bid'] # Para vender
 
                 # 3. Estrategia
+                t0 = metricas.inicio()
                 tipo_evento, avg_pressure = whale_strategy.detectar_estrategia(ts_actual_sec, metrics_micro.get('desbalance',0), precio_bid)
+                metricas.registrar("estrategia", t0)
                 metrics_micro['evento'] = tipo_evento
                 metrics_micro['presion_acumulada'] = avg_pressure
 
                 # ---------------------------------------------------------
                 # 🔥 AUTO-TRADING 🔥
                 # ---------------------------------------------------------
-                ya_operando = trader.tengo_posicion_abierta()
+                # Resultados de órdenes enviadas en ticks anteriores
+                for res in ejecutor.resultados():
+                    if res["ok"]:
+                        render.aviso(f"✅ ORDEN EJECUTADA: {res['tipo']} @ {res['precio_ejecutado']} | slippage: {res['slippage']} | {res['latencia_envio_ms']:.1f} ms")
+                    else:
+                        render.aviso(f"❌ ERROR EJECUCIÓN: {res['comentario']} (Código: {res['retcode']})")
+                        ultimo_disparo_ts = 0  # Sin posición abierta: no aplica el cooldown
+
+                t0 = metricas.inicio()
+                ya_operando = trader.tengo_posicion_abierta() or ejecutor.en_vuelo > 0
+                metricas.registrar("posicion", t0)
                 
                 if not ya_operando and (ts_actual_sec - ultimo_disparo_ts > COOLDOWN_SEG):
                     
@@ -261,8 +329,12 @@ def main():
                         tp = precio_ask * (1 + OPTUNA_TAKE_PROFIT)
                         sl = precio_ask * (1 - OPTUNA_STOP_LOSS)
                         
-                        print(f"\n🚀 DETECTADO: {tipo_evento}. DISPARANDO COMPRA...")
-                        if trader.enviar_orden(mt5_lib.ORDER_TYPE_BUY, precio_ask, sl, tp):
+                        render.aviso(f"🚀 DETECTADO: {tipo_evento}. DISPARANDO COMPRA...")
+                        t0 = metricas.inicio()
+                        encolada = ejecutor.enviar(mt5_lib.ORDER_TYPE_BUY, precio_ask, sl, tp)
+                        metricas.registrar("orden", t0)
+                        metricas.registrar("tick_a_orden", t_tick)
+                        if encolada is not None:
                             ultimo_disparo_ts = ts_actual_sec
 
                     # VENTA
@@ -270,8 +342,12 @@ def main():
                         tp = precio_bid * (1 - OPTUNA_TAKE_PROFIT)
                         sl = precio_bid * (1 + OPTUNA_STOP_LOSS)
                         
-                        print(f"\n📉 DETECTADO: {tipo_evento}. DISPARANDO VENTA...")
-                        if trader.enviar_orden(mt5_lib.ORDER_TYPE_SELL, precio_bid, sl, tp):
+                        render.aviso(f"📉 DETECTADO: {tipo_evento}. DISPARANDO VENTA...")
+                        t0 = metricas.inicio()
+                        encolada = ejecutor.enviar(mt5_lib.ORDER_TYPE_SELL, precio_bid, sl, tp)
+                        metricas.registrar("orden", t0)
+                        metricas.registrar("tick_a_orden", t_tick)
+                        if encolada is not None:
                             ultimo_disparo_ts = ts_actual_sec
                 # ---------------------------------------------------------
 
@@ -281,30 +357,51 @@ def main():
                 ia_result = {}
                 
                 if ts_candle > ultimo_segundo:
+                    t0 = metricas.inicio()
                     df_candles = mt5_con.obtener_velas_recientes(SYMBOL, timeframe=TIMEFRAME, num_velas=1000)
                     if df_candles is not None and df_candles.height > 300:
-                        metrics_macro = technical_calc.calcular_features(df_candles)
+                        metrics_macro = technical_calc.actualizar(df_candles)
                         if predictor.loaded and metrics_macro:
                             reg, probs = predictor.predecir(metrics_macro)
                             ia_result = {"regimen": reg, "probs": probs}
                             metrics_macro["Regimen_Actual"] = reg
                             for i, p in enumerate(probs): metrics_macro[f"prob_regimen_{i}"] = p
                     
+                    metricas.registrar("macro_ia", t0)
                     ultimo_segundo = ts_candle
-                    render_dashboard(metrics_micro, metrics_macro, grabando, ia_result, ya_operando)
+                    # Copias propias: el hilo de render nunca ve dicts que el bucle siga modificando
+                    render.publicar((dict(metrics_micro), dict(metrics_macro), grabando, dict(ia_result), ya_operando))
 
                     if metrics_macro:
-                        logger.guardar_snapshot(ts_actual_sec*1000, metrics_micro, metrics_macro, df_ticks_acumulado)
+                        logger.guardar_snapshot(ts_actual_sec*1000, metrics_micro, metrics_macro)
                         grabando = True
 
-            time.sleep(0.01)
+                metricas.registrar("tick_total", t_tick)
 
     except KeyboardInterrupt:
+        render.detener()
+        ejecutor.cerrar() # Órdenes en vuelo antes de cortar la conexión
+        if feed is not None: feed.detener() # Que nadie siga consultando una conexión cerrada
         mt5_con.desconectar()
         print("\nBot detenido.")
+        if REPLAY is not None: print(f"[REPLAY] {REPLAY.estadisticas()}")
+        print(f"[IA CACHE] {predictor.estadisticas()}")
+        if feed is not None: print(f"[FEED] {feed.estadisticas()}")
+        print(f"[TRADER] reconciliaciones: {trader.reconciliaciones} | correcciones: {trader.correcciones}")
+        print(f"[EJECUTOR] {ejecutor.estadisticas()}")
     except Exception as e:
+        render.detener()
         print(f"\nERROR: {e}")
+        ejecutor.cerrar()
+        if feed is not None: feed.detener()
         mt5_con.desconectar()
+    finally:
+        render.detener()
+        ejecutor.cerrar()
+        metricas.detener()
+        if feed is not None: feed.detener()
+        logger.cerrar() # Volcar filas pendientes a disco
+        tick_recorder.cerrar()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
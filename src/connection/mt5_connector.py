@@ -2,6 +2,13 @@ import MetaTrader5 as mt5
 import polars as pl
 from datetime import datetime, timedelta
 import sys
+import threading
+
+# El módulo MetaTrader5 es una única conexión IPC por proceso y no es seguro entre hilos
+# (en replay, dos hilos avanzarían el reloj virtual a la vez). Toda llamada a mt5.* del bot
+# (detección, feed, ejecutor, trader) va bajo este lock. Reentrante: hay métodos que se anidan.
+# Costo: un order_send en curso frena al feed y a la descarga de velas (ver EjecutorOrdenes).
+MT5_LOCK = threading.RLock()
 
 class MT5Connector:
     def __init__(self, login=None, password=None, server=None):
@@ -10,18 +17,59 @@ class MT5Connector:
         self.server = server
         self.connected = False
 
+        # ESTADO DEL MODO STREAMING (por símbolo)
+        # _cursor_ms: último time_msc entregado
+        # _vistos_en_cursor: tics (bid, ask, flags) ya entregados en ese mismo milisegundo
+        # _ventanas: ventana de cola acumulada para el camino barato
+        self._cursor_ms = {}
+        self._vistos_en_cursor = {}
+        self._ventanas = {}
+
+        # CACHÉ DE VELAS por (símbolo, timeframe)
+        self._cache_velas = {}
+        self._cache_pedidas = {}
+
     def conectar(self):
-        if not mt5.initialize():
-            print(f"Error al inicializar MT5: {mt5.last_error()}", file=sys.stderr)
-            self.connected = False
-            return False
+        with MT5_LOCK:
+            if not mt5.initialize():
+                print(f"Error al inicializar MT5: {mt5.last_error()}", file=sys.stderr)
+                self.connected = False
+                return False
         
         self.connected = True
         return True
 
     def desconectar(self):
-        mt5.shutdown()
+        with MT5_LOCK:
+            mt5.shutdown()
         self.connected = False
+        self.reiniciar_stream()
+
+    def reiniciar_stream(self, symbol: str = None):
+        """Olvida el cursor de tics, la ventana acumulada y la caché de velas (de un símbolo o de todos)."""
+        if symbol is None:
+            self._cursor_ms.clear()
+            self._vistos_en_cursor.clear()
+            self._ventanas.clear()
+            self._cache_velas.clear()
+            self._cache_pedidas.clear()
+        else:
+            self._cursor_ms.pop(symbol, None)
+            self._vistos_en_cursor.pop(symbol, None)
+            self._ventanas.pop(symbol, None)
+            for clave in [k for k in self._cache_velas if k[0] == symbol]:
+                del self._cache_velas[clave]
+                self._cache_pedidas.pop(clave, None)
+
+    def _formatear_ticks(self, df: pl.DataFrame) -> pl.DataFrame:
+        """Selección estándar de columnas (Solo Bid/Ask, sin Last ni Volume)."""
+        return df.select([
+            pl.col("time").alias("timestamp_sec"),
+            pl.col("time_msc").alias("timestamp_ms"),
+            pl.col("bid"),
+            pl.col("ask"),
+            pl.col("flags")
+        ])
 
     def obtener_ticks_recientes(self, symbol: str, num_ticks: int = 1000) -> pl.DataFrame:
         if not self.connected:
@@ -29,7 +77,8 @@ class MT5Connector:
                 return pl.DataFrame()
 
         # 1. Obtener la hora del servidor (último tick conocido)
-        last_tick = mt5.symbol_info_tick(symbol)
+        with MT5_LOCK:
+            last_tick = mt5.symbol_info_tick(symbol)
         if last_tick is None:
             # Si no hay datos, retornamos vacío
             return pl.DataFrame()
@@ -42,7 +91,8 @@ class MT5Connector:
         date_from = server_time - timedelta(minutes=30) 
         
         # Usamos copy_ticks_range que es más seguro para "atrás hacia adelante"
-        ticks = mt5.copy_ticks_range(symbol, date_from, date_to, mt5.COPY_TICKS_ALL)
+        with MT5_LOCK:
+            ticks = mt5.copy_ticks_range(symbol, date_from, date_to, mt5.COPY_TICKS_ALL)
 
         if ticks is None or len(ticks) == 0:
             return pl.DataFrame()
@@ -54,29 +104,91 @@ class MT5Connector:
         df = df.tail(num_ticks)
 
         # Selección de columnas
-        df_clean = df.select([
-            pl.col("time").alias("timestamp_sec"),
-            pl.col("time_msc").alias("timestamp_ms"),
-            pl.col("bid"),
-            pl.col("ask")
-        ])
+        return self._formatear_ticks(df)
 
-        return df_clean
+    def obtener_ticks_nuevos(self, symbol: str, num_ticks_inicial: int = 1000, max_ticks: int = 100000) -> pl.DataFrame:
+        """
+        MODO STREAMING: devuelve SOLO los tics posteriores al último entregado (delta).
 
-    def obtener_velas_recientes(self, symbol: str, timeframe=mt5.TIMEFRAME_M1, num_velas: int = 500) -> pl.DataFrame:
+        - La primera llamada arranca con los últimos `num_ticks_inicial` tics.
+        - Las siguientes piden a MT5 desde el segundo del cursor en adelante y
+          descartan lo ya entregado (incluidos tics que comparten milisegundo).
+        - Si no hay nada nuevo retorna un DataFrame vacío.
+        """
         if not self.connected:
             if not self.conectar():
                 return pl.DataFrame()
 
-        # copy_rates_from_pos trae las últimas N velas desde la posición 0 (actual) hacia atrás
-        rates = mt5.copy_rates_from_pos(symbol, timeframe, 0, num_velas)
-        
-        if rates is None:
+        cursor_ms = self._cursor_ms.get(symbol)
+
+        # 1. Arranque: sin cursor usamos la ruta clásica una sola vez
+        if cursor_ms is None:
+            df = self.obtener_ticks_recientes(symbol, num_ticks=num_ticks_inicial)
+            if df.is_empty():
+                return df
+            df = df.unique(subset=["timestamp_ms", "bid", "ask", "flags"], keep="first", maintain_order=True)
+            self._avanzar_cursor(symbol, df)
+            return df
+
+        # 2. Incremental: copy_ticks_from trabaja en segundos, el filtro fino es por time_msc
+        date_from = datetime.fromtimestamp(cursor_ms // 1000)
+        with MT5_LOCK:
+            ticks = mt5.copy_ticks_from(symbol, date_from, max_ticks, mt5.COPY_TICKS_ALL)
+
+        if ticks is None or len(ticks) == 0:
             return pl.DataFrame()
 
-        df = pl.from_numpy(rates)
-        
-        df = df.select([
+        df = self._formatear_ticks(pl.from_numpy(ticks))
+        df = df.filter(pl.col("timestamp_ms") >= cursor_ms)
+
+        # 3. Deduplicación: mismo milisegundo del cursor ya entregado + repetidos dentro del lote
+        vistos = self._vistos_en_cursor.get(symbol, set())
+        if vistos:
+            df_vistos = pl.DataFrame(list(vistos), schema=["bid", "ask", "flags"], orient="row").with_columns(
+                pl.lit(cursor_ms).cast(df["timestamp_ms"].dtype).alias("timestamp_ms"),
+                pl.col("flags").cast(df["flags"].dtype)
+            )
+            df = df.join(df_vistos, on=["timestamp_ms", "bid", "ask", "flags"], how="anti")
+        df = df.unique(subset=["timestamp_ms", "bid", "ask", "flags"], keep="first", maintain_order=True)
+
+        if df.is_empty():
+            return df
+
+        self._avanzar_cursor(symbol, df)
+        return df
+
+    def _avanzar_cursor(self, symbol: str, df: pl.DataFrame):
+        """Mueve el cursor al último milisegundo entregado y recuerda sus tics."""
+        ultimo_ms = df["timestamp_ms"].max()
+        en_cursor = df.filter(pl.col("timestamp_ms") == ultimo_ms).select(["bid", "ask", "flags"]).rows()
+
+        if self._cursor_ms.get(symbol) == ultimo_ms:
+            self._vistos_en_cursor[symbol].update(en_cursor)
+        else:
+            self._vistos_en_cursor[symbol] = set(en_cursor)
+        self._cursor_ms[symbol] = ultimo_ms
+
+    def obtener_ventana_ticks(self, symbol: str, num_ticks: int = 1000) -> pl.DataFrame:
+        """
+        Camino barato para quien necesita la ventana de cola completa:
+        solo se descarga el delta y se anexa a la ventana guardada.
+        """
+        nuevos = self.obtener_ticks_nuevos(symbol, num_ticks_inicial=num_ticks)
+        ventana = self._ventanas.get(symbol)
+
+        if ventana is None or ventana.is_empty():
+            ventana = nuevos
+        elif not nuevos.is_empty():
+            ventana = pl.concat([ventana, nuevos])
+
+        if ventana.height > num_ticks:
+            ventana = ventana.tail(num_ticks)
+
+        self._ventanas[symbol] = ventana
+        return ventana
+
+    def _formatear_velas(self, rates) -> pl.DataFrame:
+        return pl.from_numpy(rates).select([
             pl.col("time").alias("timestamp"),
             pl.col("open"),
             pl.col("high"),
@@ -84,5 +196,63 @@ class MT5Connector:
             pl.col("close"),
             pl.col("tick_volume"),
         ])
+
+    def obtener_velas_recientes(self, symbol: str, timeframe=mt5.TIMEFRAME_M1, num_velas: int = 500, usar_cache: bool = True) -> pl.DataFrame:
+        """
+        Últimas `num_velas` velas. Con caché solo se piden a MT5 las velas nuevas
+        desde la cola guardada (y se sobrescribe la vela en formación), así el coste
+        es proporcional a las velas que cambiaron y no al largo del histórico.
+        """
+        if not self.connected:
+            if not self.conectar():
+                return pl.DataFrame()
+
+        clave = (symbol, timeframe)
+        cache = self._cache_velas.get(clave) if usar_cache else None
+
+        # Caché vacía (primera descarga sin datos): no hay cola contra la cual solapar
+        if cache is None or cache.height == 0 or self._cache_pedidas.get(clave, 0) < num_velas:
+            return self._descargar_velas_completas(symbol, timeframe, num_velas, usar_cache)
+
+        ultimo_ts = cache["timestamp"][-1]
+
+        # 1. Pedir pocas velas y duplicar hasta solapar con la cola de la caché
+        pedir = 2
+        while True:
+            with MT5_LOCK:
+                rates = mt5.copy_rates_from_pos(symbol, timeframe, 0, pedir)
+            if rates is None or len(rates) == 0:
+                return cache.tail(num_velas)
+
+            nuevas = self._formatear_velas(rates)
+            if nuevas["timestamp"][0] <= ultimo_ts:
+                break
+            if pedir >= num_velas:
+                # El hueco es mayor que la ventana: recarga completa
+                return self._descargar_velas_completas(symbol, timeframe, num_velas, usar_cache)
+            pedir = min(pedir * 2, num_velas)
+
+        # 2. Fusionar: caché anterior a las nuevas + nuevas (la vela en formación queda sobrescrita)
+        df = pl.concat([
+            cache.filter(pl.col("timestamp") < nuevas["timestamp"][0]),
+            nuevas.cast(cache.schema)
+        ]).tail(self._cache_pedidas[clave])
+
+        self._cache_velas[clave] = df
+        return df if df.height <= num_velas else df.tail(num_velas)
+
+    def _descargar_velas_completas(self, symbol, timeframe, num_velas, usar_cache=True) -> pl.DataFrame:
+        # copy_rates_from_pos trae las últimas N velas desde la posición 0 (actual) hacia atrás
+        with MT5_LOCK:
+            rates = mt5.copy_rates_from_pos(symbol, timeframe, 0, num_velas)
         
-        return df
\ No newline at end of file
+        if rates is None:
+            return pl.DataFrame()
+
+        df = self._formatear_velas(rates)
+
+        if usar_cache:
+            self._cache_velas[(symbol, timeframe)] = df
+            self._cache_pedidas[(symbol, timeframe)] = num_velas
+
+        return df
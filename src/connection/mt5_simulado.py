@@ -0,0 +1,404 @@
+"""
+MT5 SIMULADO (Replay Offline)
+
+Sustituto del módulo `MetaTrader5` que reproduce tics y velas grabadas en Parquet
+a través de la MISMA API que usan el conector, el trader y el monitor.
+Sirve para hacer pruebas de carga y perfilar el bucle en vivo sin terminal.
+
+Uso:
+    from src.connection import mt5_simulado
+    mt5_simulado.instalar("data/raw/ticks.parquet", velocidad=10)   # ANTES de importar MetaTrader5
+    import MetaTrader5 as mt5   # -> este módulo
+
+velocidad:
+    1.0  -> tiempo real
+    N    -> N veces más rápido
+    0    -> lo más rápido posible (cada symbol_info_tick avanza un tic)
+"""
+
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+import polars as pl
+
+# --- CONSTANTES (mismos valores que MetaTrader5) ---
+TIMEFRAME_M1 = 1
+TIMEFRAME_M5 = 5
+TIMEFRAME_M15 = 15
+TIMEFRAME_M30 = 30
+TIMEFRAME_H1 = 16385
+TIMEFRAME_H4 = 16388
+TIMEFRAME_D1 = 16408
+
+COPY_TICKS_ALL = -1
+COPY_TICKS_INFO = 1
+COPY_TICKS_TRADE = 2
+
+ORDER_TYPE_BUY = 0
+ORDER_TYPE_SELL = 1
+TRADE_ACTION_DEAL = 1
+ORDER_TIME_GTC = 0
+ORDER_FILLING_FOK = 0
+ORDER_FILLING_IOC = 1
+
+TRADE_RETCODE_REQUOTE = 10004
+TRADE_RETCODE_DONE = 10009
+TRADE_RETCODE_INVALID = 10013
+TRADE_RETCODE_NO_MONEY = 10019
+TRADE_RETCODE_MARKET_CLOSED = 10018
+TRADE_RETCODE_PRICE_CHANGED = 10020
+TRADE_RETCODE_PRICE_OFF = 10021
+
+_MINUTOS_POR_TIMEFRAME = {
+    TIMEFRAME_M1: 1, TIMEFRAME_M5: 5, TIMEFRAME_M15: 15, TIMEFRAME_M30: 30,
+    TIMEFRAME_H1: 60, TIMEFRAME_H4: 240, TIMEFRAME_D1: 1440,
+}
+
+# --- ESTRUCTURAS (mismos campos que las de MetaTrader5) ---
+Tick = namedtuple("Tick", ["time", "bid", "ask", "last", "volume", "time_msc", "flags", "volume_real"])
+TradePosition = namedtuple("TradePosition", [
+    "ticket", "time", "time_msc", "type", "magic", "volume", "price_open",
+    "sl", "tp", "price_current", "profit", "symbol", "comment"
+])
+OrderSendResult = namedtuple("OrderSendResult", [
+    "retcode", "deal", "order", "volume", "price", "bid", "ask", "comment", "request_id"
+])
+
+
+class ReplayMT5:
+    def __init__(self, ticks_path, velas_path=None, velocidad=1.0, symbol=None):
+        """
+        ticks_path: Parquet con columnas time_msc, bid, ask, flags (y `time`, que si falta se
+                    deriva de time_msc). Acepta el archivo de TickRecorder, ej.
+                    "data/raw/ticks/fecha=*/*.parquet".
+        velas_path: Parquet M1 (time, open, high, low, close, tick_volume). Si no
+                    se entrega, las velas se construyen desde el Bid de los tics.
+        symbol: si se indica, solo se sirven datos para ese símbolo.
+        """
+        self.symbol = symbol
+        self.velocidad = float(velocidad or 0)
+
+        df_ticks = pl.read_parquet(ticks_path)
+        if "time" not in df_ticks.columns:
+            # Archivo de TickRecorder (time_msc, bid, ask, flags): el segundo sale del milisegundo
+            df_ticks = df_ticks.with_columns((pl.col("time_msc") // 1000).alias("time"))
+        self.df_ticks = (
+            df_ticks
+            .select(["time", "time_msc", "bid", "ask", "flags"])
+            .with_columns([
+                pl.col("time").cast(pl.Int64),
+                pl.col("time_msc").cast(pl.Int64),
+                pl.col("bid").cast(pl.Float64),
+                pl.col("ask").cast(pl.Float64),
+                pl.col("flags").cast(pl.UInt32),
+            ])
+            .sort("time_msc")
+        )
+        # Vista NumPy para búsquedas binarias sin tocar Polars en el camino caliente
+        self._msc = self.df_ticks["time_msc"].to_numpy()
+        self._bid = self.df_ticks["bid"].to_numpy()
+        self._ask = self.df_ticks["ask"].to_numpy()
+        self._flags = self.df_ticks["flags"].to_numpy()
+
+        if velas_path:
+            df_m1 = pl.read_parquet(velas_path).with_columns(pl.col("time").cast(pl.Int64)).sort("time")
+        else:
+            df_m1 = self._velas_desde_ticks(self.df_ticks, 1)
+        self._velas = {TIMEFRAME_M1: df_m1}
+
+        # Estado de la reproducción
+        self._idx = -1
+        self._inicio_real = None
+        self._inicio_datos_ms = int(self._msc[0]) if len(self._msc) else 0
+
+        # Estado de trading
+        self._posiciones = {}
+        self._siguiente_ticket = 1
+
+        # Métricas (ticks/s y latencia tic -> decisión)
+        self._ticks_servidos = 0
+        self._entrega_tick_real = None
+        self.latencias_decision_ms = []
+
+    # ------------------------------------------------------------------
+    # RELOJ VIRTUAL
+    # ------------------------------------------------------------------
+    def _avanzar(self):
+        """Mueve el índice del tic actual según la velocidad configurada."""
+        if len(self._msc) == 0:
+            return
+        if self._inicio_real is None:
+            self._inicio_real = time.perf_counter()
+
+        if self.velocidad <= 0:
+            nuevo_idx = min(self._idx + 1, len(self._msc) - 1)
+        else:
+            transcurrido_ms = (time.perf_counter() - self._inicio_real) * 1000.0 * self.velocidad
+            ahora_ms = self._inicio_datos_ms + transcurrido_ms
+            nuevo_idx = int(np.searchsorted(self._msc, ahora_ms, side="right")) - 1
+            nuevo_idx = max(nuevo_idx, 0)
+
+        if nuevo_idx != self._idx:
+            self._idx = nuevo_idx
+            self._ticks_servidos += 1
+            self._entrega_tick_real = time.perf_counter()
+            self._revisar_sl_tp()
+
+    def _ahora_ms(self):
+        return int(self._msc[self._idx]) if self._idx >= 0 else self._inicio_datos_ms - 1
+
+    def terminado(self):
+        """True cuando ya se sirvió el último tic grabado."""
+        return self._idx >= len(self._msc) - 1
+
+    def _simbolo_valido(self, symbol):
+        return self.symbol is None or symbol == self.symbol
+
+    # ------------------------------------------------------------------
+    # API DE DATOS
+    # ------------------------------------------------------------------
+    def symbol_info_tick(self, symbol):
+        if not self._simbolo_valido(symbol):
+            return None
+        self._avanzar()
+        if self._idx < 0:
+            return None
+        i = self._idx
+        return Tick(
+            int(self._msc[i] // 1000), float(self._bid[i]), float(self._ask[i]), 0.0, 0,
+            int(self._msc[i]), int(self._flags[i]), 0.0
+        )
+
+    def _a_ms(self, fecha):
+        # El conector construye fechas con datetime.fromtimestamp (hora local)
+        if isinstance(fecha, datetime):
+            return int(fecha.timestamp() * 1000)
+        return int(fecha) * 1000
+
+    def copy_ticks_range(self, symbol, date_from, date_to, flags=COPY_TICKS_ALL):
+        if not self._simbolo_valido(symbol):
+            return None
+        desde = int(np.searchsorted(self._msc, self._a_ms(date_from), side="left"))
+        hasta_ms = min(self._a_ms(date_to), self._ahora_ms())
+        hasta = int(np.searchsorted(self._msc, hasta_ms, side="right"))
+        return self.df_ticks.slice(desde, max(hasta - desde, 0)).to_numpy(structured=True)
+
+    def copy_ticks_from(self, symbol, date_from, count, flags=COPY_TICKS_ALL):
+        if not self._simbolo_valido(symbol):
+            return None
+        desde = int(np.searchsorted(self._msc, self._a_ms(date_from), side="left"))
+        hasta = min(desde + int(count), self._idx + 1)
+        return self.df_ticks.slice(desde, max(hasta - desde, 0)).to_numpy(structured=True)
+
+    def _velas_desde_ticks(self, df_ticks, minutos):
+        """Velas OHLC sobre el BID (como las construye MT5) y conteo propio de tics."""
+        return (
+            df_ticks
+            .with_columns(pl.from_epoch("time_msc", time_unit="ms").alias("dt"))
+            .group_by_dynamic("dt", every=f"{minutos}m")
+            .agg([
+                pl.col("bid").first().alias("open"),
+                pl.col("bid").max().alias("high"),
+                pl.col("bid").min().alias("low"),
+                pl.col("bid").last().alias("close"),
+                pl.col("bid").count().cast(pl.UInt64).alias("tick_volume"),
+            ])
+            .with_columns((pl.col("dt").dt.epoch(time_unit="s")).cast(pl.Int64).alias("time"))
+            .select(["time", "open", "high", "low", "close", "tick_volume"])
+        )
+
+    def _velas_timeframe(self, timeframe):
+        if timeframe not in self._velas:
+            minutos = _MINUTOS_POR_TIMEFRAME[timeframe]
+            self._velas[timeframe] = (
+                self._velas[TIMEFRAME_M1]
+                .with_columns(pl.from_epoch("time", time_unit="s").alias("dt"))
+                .group_by_dynamic("dt", every=f"{minutos}m")
+                .agg([
+                    pl.col("time").first(),
+                    pl.col("open").first(),
+                    pl.col("high").max(),
+                    pl.col("low").min(),
+                    pl.col("close").last(),
+                    pl.col("tick_volume").sum(),
+                ])
+                .drop("dt")
+            )
+        return self._velas[timeframe]
+
+    def copy_rates_from_pos(self, symbol, timeframe, start_pos, count):
+        if not self._simbolo_valido(symbol) or timeframe not in _MINUTOS_POR_TIMEFRAME:
+            return None
+        df = self._velas_timeframe(timeframe)
+        # Solo velas ya abiertas según el reloj virtual (la última puede estar formándose)
+        ahora_sec = self._ahora_ms() // 1000
+        fin = int(np.searchsorted(df["time"].to_numpy(), ahora_sec, side="right")) - int(start_pos)
+        inicio = max(fin - int(count), 0)
+        if fin <= 0:
+            return None
+        velas = df.slice(inicio, fin - inicio).to_numpy(structured=True)
+
+        # La vela en formación se arma SOLO con los tics ya servidos (sin ver su high/low/close final)
+        minutos = _MINUTOS_POR_TIMEFRAME[timeframe]
+        apertura = int(velas[-1]["time"])
+        if apertura + minutos * 60 > ahora_sec:
+            desde = int(np.searchsorted(self._msc, apertura * 1000, side="left"))
+            bids = self._bid[desde:self._idx + 1]
+            if len(bids) == 0:
+                return velas[:-1] if len(velas) > 1 else None
+            velas[-1]["open"] = bids[0]
+            velas[-1]["high"] = bids.max()
+            velas[-1]["low"] = bids.min()
+            velas[-1]["close"] = bids[-1]
+            velas[-1]["tick_volume"] = len(bids)
+        return velas
+
+    # ------------------------------------------------------------------
+    # API DE TRADING
+    # ------------------------------------------------------------------
+    def positions_get(self, symbol=None, ticket=None):
+        posiciones = list(self._posiciones.values())
+        if symbol is not None:
+            posiciones = [p for p in posiciones if p.symbol == symbol]
+        if ticket is not None:
+            posiciones = [p for p in posiciones if p.ticket == ticket]
+        return tuple(posiciones)
+
+    def order_send(self, request):
+        # Latencia desde que se entregó el tic actual hasta la decisión de operar
+        t_entrega, self._entrega_tick_real = self._entrega_tick_real, None
+        if t_entrega is not None:
+            self.latencias_decision_ms.append((time.perf_counter() - t_entrega) * 1000.0)
+
+        if self._idx < 0:
+            return OrderSendResult(TRADE_RETCODE_MARKET_CLOSED, 0, 0, 0.0, 0.0, 0.0, 0.0, "Sin datos", 0)
+
+        bid, ask = float(self._bid[self._idx]), float(self._ask[self._idx])
+        tipo = request.get("type")
+        precio = ask if tipo == ORDER_TYPE_BUY else bid
+        ticket = self._siguiente_ticket
+        self._siguiente_ticket += 1
+
+        # Cierre de una posición existente
+        if request.get("position"):
+            pos = self._posiciones.pop(request["position"], None)
+            if pos is None:
+                return OrderSendResult(TRADE_RETCODE_INVALID, 0, 0, 0.0, 0.0, bid, ask, "Posicion inexistente", 0)
+            return OrderSendResult(TRADE_RETCODE_DONE, ticket, ticket, pos.volume, precio, bid, ask, "Request executed", 0)
+
+        if tipo not in (ORDER_TYPE_BUY, ORDER_TYPE_SELL):
+            return OrderSendResult(TRADE_RETCODE_INVALID, 0, 0, 0.0, 0.0, bid, ask, "Tipo invalido", 0)
+
+        ahora_ms = self._ahora_ms()
+        self._posiciones[ticket] = TradePosition(
+            ticket, ahora_ms // 1000, ahora_ms, tipo, request.get("magic", 0), request.get("volume", 0.0),
+            precio, float(request.get("sl", 0.0)), float(request.get("tp", 0.0)), precio, 0.0,
+            request.get("symbol", self.symbol), request.get("comment", "")
+        )
+        return OrderSendResult(TRADE_RETCODE_DONE, ticket, ticket, request.get("volume", 0.0), precio, bid, ask, "Request executed", 0)
+
+    def _revisar_sl_tp(self):
+        """Cierra posiciones cuyo SL/TP fue tocado por el tic actual (Bid cierra largos, Ask cierra cortos)."""
+        if not self._posiciones:
+            return
+        bid, ask = self._bid[self._idx], self._ask[self._idx]
+        for ticket, pos in list(self._posiciones.items()):
+            if pos.type == ORDER_TYPE_BUY:
+                tocado = (pos.sl > 0 and bid <= pos.sl) or (pos.tp > 0 and bid >= pos.tp)
+            else:
+                tocado = (pos.sl > 0 and ask >= pos.sl) or (pos.tp > 0 and ask <= pos.tp)
+            if tocado:
+                self._posiciones.pop(ticket, None)  # pop: el hilo de ingesta y el de trading pueden cruzarse
+
+    # ------------------------------------------------------------------
+    # MÉTRICAS
+    # ------------------------------------------------------------------
+    def estadisticas(self):
+        """Ticks/s servidos (techo del monitor) y latencia tic -> decisión (ms)."""
+        transcurrido = time.perf_counter() - self._inicio_real if self._inicio_real else 0.0
+        stats = {
+            "ticks_servidos": self._ticks_servidos,
+            "segundos_reales": transcurrido,
+            "ticks_por_seg": self._ticks_servidos / transcurrido if transcurrido > 0 else 0.0,
+            "ordenes": len(self.latencias_decision_ms),
+        }
+        if self.latencias_decision_ms:
+            lat = np.array(self.latencias_decision_ms)
+            stats["latencia_p50_ms"] = float(np.percentile(lat, 50))
+            stats["latencia_p99_ms"] = float(np.percentile(lat, 99))
+        return stats
+
+
+# ----------------------------------------------------------------------
+# API A NIVEL DE MÓDULO (lo que ven quienes hacen `import MetaTrader5 as mt5`)
+# ----------------------------------------------------------------------
+_replay = None
+_ultimo_error = (1, "Success")
+
+
+def configurar(ticks_path, velas_path=None, velocidad=1.0, symbol=None):
+    global _replay
+    _replay = ReplayMT5(ticks_path, velas_path=velas_path, velocidad=velocidad, symbol=symbol)
+    return _replay
+
+
+def instalar(ticks_path, velas_path=None, velocidad=1.0, symbol=None):
+    """Configura el replay y lo registra como `MetaTrader5` en sys.modules."""
+    configurar(ticks_path, velas_path=velas_path, velocidad=velocidad, symbol=symbol)
+    sys.modules["MetaTrader5"] = sys.modules[__name__]
+    return _replay
+
+
+def replay_actual():
+    return _replay
+
+
+def initialize(*args, **kwargs):
+    if _replay is None:
+        _replay_error("Replay no configurado")
+        return False
+    return True
+
+
+def _replay_error(msg):
+    global _ultimo_error
+    _ultimo_error = (-1, msg)
+
+
+def last_error():
+    return _ultimo_error
+
+
+def shutdown():
+    return True
+
+
+def symbol_select(symbol, enable=True):
+    return _replay is not None and _replay._simbolo_valido(symbol)
+
+
+def symbol_info_tick(symbol):
+    return _replay.symbol_info_tick(symbol) if _replay else None
+
+
+def copy_ticks_range(symbol, date_from, date_to, flags=COPY_TICKS_ALL):
+    return _replay.copy_ticks_range(symbol, date_from, date_to, flags) if _replay else None
+
+
+def copy_ticks_from(symbol, date_from, count, flags=COPY_TICKS_ALL):
+    return _replay.copy_ticks_from(symbol, date_from, count, flags) if _replay else None
+
+
+def copy_rates_from_pos(symbol, timeframe, start_pos, count):
+    return _replay.copy_rates_from_pos(symbol, timeframe, start_pos, count) if _replay else None
+
+
+def positions_get(symbol=None, ticket=None, **kwargs):
+    return _replay.positions_get(symbol=symbol, ticket=ticket) if _replay else None
+
+
+def order_send(request):
+    return _replay.order_send(request) if _replay else None
@@ -0,0 +1,168 @@
+import MetaTrader5 as mt5
+import queue
+import threading
+import time
+from src.connection.mt5_connector import MT5_LOCK
+
+class AlimentadorTicks:
+    def __init__(self, symbol, capacidad=10000, intervalo_poll=0.01, intervalo_min=0.001, espera_max_seg=0.05, fin_datos=None, metricas=None):
+        """
+        Hilo de ingesta: consulta `symbol_info_tick` y publica SOLO tics nuevos en una cola acotada.
+
+        - Nuevo = time_msc mayor al último, o mismo time_msc con bid/ask distinto.
+          Las consultas que devuelven la misma cotización se cuentan como duplicados y no salen.
+          Si time_msc retrocede (corrección de reloj del servidor, reconexión) el tic se acepta
+          y pasa a ser la nueva referencia (cuenta `retrocesos`).
+        - Sondeo adaptativo: tras un tic nuevo se vuelve a consultar a `intervalo_min`; cada
+          duplicado duplica la espera hasta `intervalo_poll` (mercado quieto = ~1 consulta cada 10 ms).
+          intervalo_poll=0 -> sin espera (replay a máxima velocidad).
+        - Contrapresión: con la cola llena el hilo espera hasta `espera_max_seg` a que el consumidor
+          libere lugar; si no alcanza, descarta el tic MÁS VIEJO de la cola (cuenta `descartados`).
+          espera_max_seg=None -> espera sin descartes, cortable con `detener()` (replay: el reloj no avanza solo).
+        - El consumidor se bloquea en `obtener()` y despierta apenas llega un tic, sin sleep fijo.
+        - fin_datos: callable opcional (ej. REPLAY.terminado) que detiene la ingesta.
+        - Si el hilo muere por una excepción queda en `error` y `terminado()` pasa a True.
+        - metricas: MetricasLatencia opcional; registra la etapa "symbol_info_tick" (la consulta en sí,
+          incluida la espera del lock compartido de MT5).
+        """
+        self.symbol = symbol
+        self.intervalo_poll = intervalo_poll
+        self.intervalo_min = min(intervalo_min, intervalo_poll)
+        self.espera_max_seg = espera_max_seg
+        self.fin_datos = fin_datos
+        self.metricas = metricas
+        self.cola = queue.Queue(maxsize=capacidad)
+
+        self._ultimo = None      # (time_msc, bid, ask) del último tic emitido
+        self._activo = threading.Event()
+        self._hilo = None
+        self.error = None        # Excepción que mató al hilo de ingesta (None = sano)
+
+        # Contadores (solo los escribe el hilo de ingesta)
+        self.consultas = 0
+        self.duplicados = 0
+        self.emitidos = 0
+        self.descartados = 0
+        self.errores = 0
+        self.retrocesos = 0
+        self.max_en_cola = 0
+
+    # ------------------------------------------------------------------
+    # CICLO DE VIDA
+    # ------------------------------------------------------------------
+    def iniciar(self):
+        if self._hilo is not None and self._hilo.is_alive():
+            return
+        self.error = None
+        self._activo.set()
+        self._hilo = threading.Thread(target=self._bucle_ingesta, name="TickFeed", daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        self._activo.clear()
+        if self._hilo is not None:
+            self._hilo.join(timeout=5)
+
+    def terminado(self):
+        """True cuando la ingesta se detuvo y ya no quedan tics por consumir."""
+        return not self._activo.is_set() and self.cola.empty()
+
+    # ------------------------------------------------------------------
+    # HILO DE INGESTA
+    # ------------------------------------------------------------------
+    def _es_nuevo(self, tick):
+        if self._ultimo is None:
+            return True
+        msc, bid, ask = self._ultimo
+        if tick.time_msc > msc:
+            return True
+        if tick.time_msc < msc:
+            # Reloj hacia atrás: sin esto todo tic sería "duplicado" hasta volver a alcanzar `msc`
+            self.retrocesos += 1
+            return True
+        return tick.time_msc == msc and (tick.bid != bid or tick.ask != ask)
+
+    def _publicar(self, tick):
+        if self.espera_max_seg is None:
+            # Sin descartes, pero de a poco: si el consumidor ya no lee, `detener()` igual corta
+            while True:
+                if not self._activo.is_set():
+                    return
+                try:
+                    self.cola.put(tick, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+        else:
+            try:
+                self.cola.put(tick, timeout=self.espera_max_seg)
+            except queue.Full:
+                # El consumidor no da abasto: se pierde el más viejo, nunca el más reciente
+                try:
+                    self.cola.get_nowait()
+                    self.descartados += 1
+                except queue.Empty:
+                    pass
+                self.cola.put_nowait(tick)
+        self.emitidos += 1
+        self.max_en_cola = max(self.max_en_cola, self.cola.qsize())
+
+    def _bucle_ingesta(self):
+        espera = self.intervalo_min
+        try:
+            while self._activo.is_set():
+                t0 = time.perf_counter_ns()
+                try:
+                    with MT5_LOCK:
+                        tick_raw = mt5.symbol_info_tick(self.symbol)
+                except Exception as e:
+                    print(f"[FEED ERROR] symbol_info_tick: {e}")
+                    tick_raw = None
+                if self.metricas is not None:
+                    self.metricas.registrar("symbol_info_tick", t0)
+                self.consultas += 1
+
+                if tick_raw is None:
+                    self.errores += 1
+                    espera = self.intervalo_poll
+                elif self._es_nuevo(tick_raw):
+                    self._ultimo = (tick_raw.time_msc, tick_raw.bid, tick_raw.ask)
+                    tick = tick_raw._asdict()
+                    tick["t_ingesta_ns"] = time.perf_counter_ns()  # Para medir la espera en cola
+                    self._publicar(tick)
+                    espera = self.intervalo_min
+                else:
+                    self.duplicados += 1
+                    espera = min(espera * 2, self.intervalo_poll)
+
+                if self.fin_datos is not None and self.fin_datos():
+                    break
+                if self.intervalo_poll > 0:
+                    time.sleep(espera)
+        except Exception as e:
+            print(f"[FEED ERROR] Hilo de ingesta detenido: {e}")
+            self.error = e
+        finally:
+            self._activo.clear()
+
+    # ------------------------------------------------------------------
+    # CONSUMIDOR
+    # ------------------------------------------------------------------
+    def obtener(self, timeout=1.0):
+        """Siguiente tic nuevo (dict como `Tick._asdict()` + "t_ingesta_ns"), o None si no llegó nada en `timeout`."""
+        try:
+            return self.cola.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def estadisticas(self):
+        return {
+            "consultas": self.consultas,
+            "duplicados": self.duplicados,
+            "emitidos": self.emitidos,
+            "descartados": self.descartados,
+            "errores": self.errores,
+            "retrocesos": self.retrocesos,
+            "en_cola": self.cola.qsize(),
+            "max_en_cola": self.max_en_cola
+        }
@@ -0,0 +1,238 @@
+import MetaTrader5 as mt5
+import csv
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+from src.connection.mt5_connector import MT5_LOCK
+
+# Intención de orden: lo que decide el bucle de detección (el ejecutor se encarga del resto)
+IntencionOrden = namedtuple("IntencionOrden", ["id", "tipo", "precio", "sl", "tp", "comentario", "t_decision_ns"])
+
+# Respuestas del servidor que merecen reintento con la cotización actual
+_RECOTIZACION = {
+    getattr(mt5, "TRADE_RETCODE_REQUOTE", 10004),
+    getattr(mt5, "TRADE_RETCODE_PRICE_CHANGED", 10020),
+    getattr(mt5, "TRADE_RETCODE_PRICE_OFF", 10021),
+}
+
+class EjecutorOrdenes:
+    COLUMNAS_JOURNAL = [
+        "Timestamp", "id", "tipo", "precio_solicitado", "precio_ejecutado", "slippage",
+        "sl", "tp", "volumen", "ticket", "retcode", "comentario", "intentos",
+        "latencia_envio_ms", "latencia_decision_ms"
+    ]
+    _FIN = object() # Señal de apagado para el hilo ejecutor
+
+    def __init__(self, trader, max_reintentos=3, capacidad=100,
+                 journal_path=os.path.join("data", "raw", "trade_journal.csv"), metricas=None):
+        """
+        Ejecución asíncrona: el bucle de detección encola intenciones y sigue analizando.
+
+        - Un único hilo envía las órdenes en orden y reconcilia el libro de posiciones del trader
+          en los ratos libres. La conexión es la del proceso (la abre MT5Connector) y se comparte
+          con el feed y la detección: cada llamada a mt5.* va bajo MT5_LOCK.
+        - Compromiso del lock: mientras dura el ida y vuelta de `order_send` (decenas de ms, más
+          con recotizaciones) el `symbol_info_tick` del feed y las velas de la detección esperan;
+          los tics de ese rato no se pierden del todo (el feed retoma con la última cotización)
+          pero llegan tarde. La detección solo se frena si necesita MT5: el análisis de los tics
+          ya encolados sigue corriendo. Con el cooldown entre operaciones pasa una vez por orden;
+          a cambio, ninguna llamada se solapa con otra en la conexión IPC (ni avanza el replay dos veces).
+        - Recotización (REQUOTE / PRICE_CHANGED / PRICE_OFF): reintenta hasta `max_reintentos`
+          con la cotización actual, corriendo SL/TP la misma distancia.
+        - Sin respuesta (order_send -> None): la orden NO se reenvía (el servidor pudo haberla
+          ejecutado). Falla la intención y se reconcilia en el acto: si hubo fill, la posición
+          entra al libro y la estrategia no abre otra (cuenta `sin_respuesta`).
+        - Cada orden (ejecutada o no) queda en el journal CSV con latencia envío->fill,
+          latencia decisión->fill y slippage (positivo = en contra nuestra).
+        - `resultados()` devuelve lo resuelto desde la última consulta (para el dashboard/cooldown).
+        """
+        self.trader = trader
+        self.max_reintentos = max_reintentos
+        self.journal_path = journal_path
+        self.metricas = metricas
+
+        self._cola = queue.Queue(maxsize=capacidad)
+        self._resultados = queue.Queue()
+        self._siguiente_id = 1
+        # Un escritor por contador (encoladas: detección, resueltas: ejecutor) -> sin locks
+        self._encoladas = 0
+        self._resueltas = 0
+        self.rechazadas = 0      # No entraron a la cola (llena)
+        self.ejecutadas = 0
+        self.fallidas = 0
+        self.recotizaciones = 0
+        self.sin_respuesta = 0
+
+        self._hilo = None
+        self._cerrado = False
+        os.makedirs(os.path.dirname(self.journal_path) or ".", exist_ok=True)
+
+    # ------------------------------------------------------------------
+    # HILO DE DETECCIÓN (O(1), sin I/O)
+    # ------------------------------------------------------------------
+    def enviar(self, tipo, precio, sl, tp, comentario="BallenasIA"):
+        """Encola una intención. Retorna su id, o None si la cola está llena."""
+        intencion = IntencionOrden(self._siguiente_id, tipo, float(precio), float(sl), float(tp),
+                                   comentario, time.perf_counter_ns())
+        try:
+            self._cola.put_nowait(intencion)
+        except queue.Full:
+            self.rechazadas += 1
+            return None
+        self._siguiente_id += 1
+        self._encoladas += 1
+        return intencion.id
+
+    @property
+    def en_vuelo(self):
+        """Intenciones encoladas o enviándose (0 = nada pendiente)."""
+        return self._encoladas - self._resueltas
+
+    def resultados(self):
+        """Filas del journal resueltas desde la última llamada (no bloquea)."""
+        nuevos = []
+        while True:
+            try:
+                nuevos.append(self._resultados.get_nowait())
+            except queue.Empty:
+                return nuevos
+
+    # ------------------------------------------------------------------
+    # CICLO DE VIDA
+    # ------------------------------------------------------------------
+    def iniciar(self):
+        if self._hilo is not None and self._hilo.is_alive():
+            return
+        self._cerrado = False
+        self._hilo = threading.Thread(target=self._bucle_ejecutor, name="OrderExecutor", daemon=True)
+        self._hilo.start()
+
+    def cerrar(self):
+        """Termina las órdenes ya encoladas y detiene el hilo."""
+        if self._cerrado or self._hilo is None:
+            return
+        self._cerrado = True
+        self._cola.put(self._FIN)
+        self._hilo.join(timeout=30)
+
+    # ------------------------------------------------------------------
+    # HILO EJECUTOR
+    # ------------------------------------------------------------------
+    def _bucle_ejecutor(self):
+        # Reconciliar antes de que venza el timer del trader: la consulta nunca cae en el hilo de detección
+        espera = max(0.1, self.trader.intervalo_reconciliacion / 2)
+        while True:
+            try:
+                intencion = self._cola.get(timeout=espera)
+            except queue.Empty:
+                self._reconciliar()
+                continue
+
+            if intencion is self._FIN:
+                break
+            try:
+                self._procesar(intencion)
+            except Exception as e:
+                print(f"[EJECUTOR ERROR] Orden {intencion.id}: {e}")
+                self.fallidas += 1
+            finally:
+                self._resueltas += 1
+
+    def _reconciliar(self):
+        try:
+            self.trader.reconciliar()
+        except Exception as e:
+            print(f"[EJECUTOR ERROR] Reconciliación: {e}")
+
+    def _procesar(self, intencion):
+        precio, sl, tp = intencion.precio, intencion.sl, intencion.tp
+        result, error, intentos, latencia_envio_ms = None, None, 0, 0.0
+
+        while intentos <= self.max_reintentos:
+            intentos += 1
+            request = self.trader.armar_request(intencion.tipo, precio, sl, tp, intencion.comentario)
+            t0 = time.perf_counter_ns()
+            with MT5_LOCK:
+                result = mt5.order_send(request)
+                error = mt5.last_error() if result is None else None
+            latencia_envio_ms = (time.perf_counter_ns() - t0) / 1e6
+
+            if result is None:
+                # Falló la llamada IPC, no necesariamente la orden: reenviar podría duplicar la
+                # posición. Se reabre la conexión y la reconciliación decide si hubo fill.
+                self.sin_respuesta += 1
+                print(f"🔴 Orden {intencion.id} sin respuesta de MT5 ({error}): no se reenvía, se reconcilia")
+                with MT5_LOCK:
+                    mt5.initialize()
+                self._reconciliar()
+                break
+            if result.retcode not in _RECOTIZACION:
+                break
+
+            # Recotización: mismo trade con el precio vigente
+            self.recotizaciones += 1
+            with MT5_LOCK:
+                tick = mt5.symbol_info_tick(self.trader.symbol)
+            if tick is None:
+                continue
+            nuevo = tick.ask if intencion.tipo == mt5.ORDER_TYPE_BUY else tick.bid
+            sl, tp = sl + (nuevo - precio), tp + (nuevo - precio)
+            precio = nuevo
+
+        ok = result is not None and result.retcode == mt5.TRADE_RETCODE_DONE
+        if ok:
+            self.trader.registrar_apertura(result, intencion.tipo, sl, tp)
+            self.ejecutadas += 1
+        else:
+            self.fallidas += 1
+
+        latencia_decision_ms = (time.perf_counter_ns() - intencion.t_decision_ns) / 1e6
+        if self.metricas is not None:
+            self.metricas.registrar_valor("envio_a_fill", latencia_envio_ms * 1000)
+
+        ejecutado = result.price if ok else 0.0
+        signo = 1 if intencion.tipo == mt5.ORDER_TYPE_BUY else -1
+        fila = {
+            "Timestamp": datetime.now().isoformat(timespec="milliseconds"),
+            "id": intencion.id,
+            "tipo": "COMPRA" if intencion.tipo == mt5.ORDER_TYPE_BUY else "VENTA",
+            "precio_solicitado": intencion.precio,
+            "precio_ejecutado": ejecutado,
+            # Contra el precio que pidió la estrategia (incluye lo movido por recotizaciones)
+            "slippage": round(signo * (ejecutado - intencion.precio), 8) if ok else 0.0,
+            "sl": sl,
+            "tp": tp,
+            "volumen": result.volume if ok else 0.0,
+            "ticket": result.order if ok else 0,
+            "retcode": result.retcode if result is not None else -1,
+            "comentario": result.comment if result is not None else f"SIN RESPUESTA {error}",
+            "intentos": intentos,
+            "latencia_envio_ms": round(latencia_envio_ms, 3),
+            "latencia_decision_ms": round(latencia_decision_ms, 3),
+        }
+        self._escribir_journal(fila)
+        self._resultados.put({**fila, "ok": ok})
+
+    def _escribir_journal(self, fila):
+        try:
+            nuevo = not os.path.exists(self.journal_path)
+            with open(self.journal_path, "a", newline="", encoding="utf-8") as f:
+                writer = csv.DictWriter(f, fieldnames=self.COLUMNAS_JOURNAL)
+                if nuevo:
+                    writer.writeheader()
+                writer.writerow(fila)
+        except OSError as e:
+            print(f"[EJECUTOR ERROR] No se pudo escribir el journal: {e}")
+
+    def estadisticas(self):
+        return {
+            "ejecutadas": self.ejecutadas,
+            "fallidas": self.fallidas,
+            "recotizaciones": self.recotizaciones,
+            "sin_respuesta": self.sin_respuesta,
+            "rechazadas": self.rechazadas,
+            "en_vuelo": self.en_vuelo
+        }
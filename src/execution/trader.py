@@ -1,25 +1,53 @@
 import MetaTrader5 as mt5
+import threading
 import time
+from src.connection.mt5_connector import MT5_LOCK
 
 class MT5Trader:
-    def __init__(self, symbol, lot_size=0.01, magic_number=999000):
+    def __init__(self, symbol, lot_size=0.01, magic_number=999000, intervalo_reconciliacion=2.0):
         self.symbol = symbol
         self.lot = lot_size
         self.magic = magic_number
         self.verbose = True
 
+        # Libro local de posiciones de ESTE bot (ticket -> dict). Se actualiza con los resultados
+        # de nuestras órdenes y se reconcilia con positions_get cada `intervalo_reconciliacion` s
+        # (cierres por SL/TP o manuales desde el terminal). Lo tocan el hilo ejecutor y el de
+        # detección (reconciliación perezosa): las escrituras del libro van bajo `_lock_libro`.
+        self.posiciones = {}
+        self._lock_libro = threading.Lock()
+        self.intervalo_reconciliacion = intervalo_reconciliacion
+        self._ultima_reconciliacion = 0.0
+        self.reconciliaciones = 0
+        # Veces que el terminal no coincidía con el libro local. Limitación: si el resultado de la
+        # orden no trae `position` (API estándar) el libro usa el ticket de la orden, que solo es el
+        # de la posición en cuentas hedging; en netting cada apertura cuenta como una corrección.
+        self.correcciones = 0
+
     def enviar_orden(self, tipo_orden, precio_entrada, sl, tp, comentario="BallenasIA"):
         """
         Envía una orden al mercado con protección SL/TP.
         tipo_orden: 0 = COMPRA (ORDER_TYPE_BUY), 1 = VENTA (ORDER_TYPE_SELL)
         """
-        # Asegurar conexión
-        if not mt5.initialize():
-            print("🔴 Error: No hay conexión con MT5 para operar.")
+        # Enviar (la conexión la abre quien crea el trader, no cada orden)
+        with MT5_LOCK:
+            result = mt5.order_send(self.armar_request(tipo_orden, precio_entrada, sl, tp, comentario))
+
+        if result is None:
+            print(f"🔴 Error: No hay conexión con MT5 para operar. {mt5.last_error()}")
+            return False
+        if result.retcode != mt5.TRADE_RETCODE_DONE:
+            print(f"❌ ERROR EJECUCIÓN: {result.comment} (Código: {result.retcode})")
             return False
+        else:
+            tipo_txt = "COMPRA" if tipo_orden == mt5.ORDER_TYPE_BUY else "VENTA"
+            print(f"✅ ORDEN EJECUTADA: {tipo_txt} @ {precio_entrada} | SL: {sl} | TP: {tp}")
+            self.registrar_apertura(result, tipo_orden, sl, tp)
+            return True
 
-        # Rellenar estructura de la orden
-        request = {
+    def armar_request(self, tipo_orden, precio_entrada, sl, tp, comentario="BallenasIA"):
+        """Estructura de la orden de mercado (la usan enviar_orden y el ejecutor asíncrono)."""
+        return {
             "action": mt5.TRADE_ACTION_DEAL,
             "symbol": self.symbol,
             "volume": self.lot,
@@ -34,26 +62,33 @@ class MT5Trader:
             "type_filling": mt5.ORDER_FILLING_IOC, # O FOK, depende del broker
         }
 
-        # Enviar
-        result = mt5.order_send(request)
-        
-        if result.retcode != mt5.TRADE_RETCODE_DONE:
-            print(f"❌ ERROR EJECUCIÓN: {result.comment} (Código: {result.retcode})")
-            return False
-        else:
-            tipo_txt = "COMPRA" if tipo_orden == mt5.ORDER_TYPE_BUY else "VENTA"
-            print(f"✅ ORDEN EJECUTADA: {tipo_txt} @ {precio_entrada} | SL: {sl} | TP: {tp}")
-            return True
+    def registrar_apertura(self, result, tipo_orden, sl, tp):
+        """Anota en el libro local una posición abierta por nosotros (result = OrderSendResult DONE)."""
+        # Ticket de la posición si el resultado lo trae; si no, el de la orden (igual en hedging)
+        ticket = getattr(result, "position", 0) or result.order
+        with self._lock_libro:
+            self.posiciones[ticket] = {
+                "ticket": ticket, "type": tipo_orden, "volume": result.volume,
+                "price_open": result.price, "sl": float(sl), "tp": float(tp),
+                "_registrada": time.monotonic()  # Para no perderla ante una reconciliación en curso
+            }
 
     def cerrar_posiciones_existentes(self):
         """Cierra todas las posiciones abiertas por ESTE bot (Magic Number)"""
-        positions = mt5.positions_get(symbol=self.symbol)
+        with MT5_LOCK:
+            positions = mt5.positions_get(symbol=self.symbol)
         if positions:
+            # Una sola cotización para todo el barrido (antes: dos consultas por posición)
+            with MT5_LOCK:
+                tick = mt5.symbol_info_tick(self.symbol)
+            if tick is None:
+                print(f"🔴 Error: Sin cotización para cerrar posiciones. {mt5.last_error()}")
+                return
             for pos in positions:
                 if pos.magic == self.magic:
                     # Crear orden opuesta para cerrar
                     tipo_cierre = mt5.ORDER_TYPE_SELL if pos.type == mt5.ORDER_TYPE_BUY else mt5.ORDER_TYPE_BUY
-                    precio_cierre = mt5.symbol_info_tick(self.symbol).bid if tipo_cierre == mt5.ORDER_TYPE_SELL else mt5.symbol_info_tick(self.symbol).ask
+                    precio_cierre = tick.bid if tipo_cierre == mt5.ORDER_TYPE_SELL else tick.ask
                     
                     req = {
                         "action": mt5.TRADE_ACTION_DEAL,
@@ -65,14 +100,41 @@ class MT5Trader:
                         "magic": self.magic,
                         "comment": "Cierre Auto",
                     }
-                    mt5.order_send(req)
+                    with MT5_LOCK:
+                        result = mt5.order_send(req)
+                    if result is not None and result.retcode == mt5.TRADE_RETCODE_DONE:
+                        with self._lock_libro:
+                            self.posiciones.pop(pos.ticket, None)
             print("🗑️ Posiciones anteriores cerradas.")
             
+    def reconciliar(self):
+        """
+        Fusiona el libro local con lo que reporta el terminal (solo posiciones con nuestro magic).
+        Las aperturas registradas después de iniciar la consulta se conservan: la foto del
+        terminal puede ser anterior a su fill.
+        """
+        inicio = time.monotonic()
+        with MT5_LOCK:
+            positions = mt5.positions_get(symbol=self.symbol)
+        self._ultima_reconciliacion = time.monotonic()
+        if positions is None:
+            # Error de comunicación: mejor conservar el libro que vaciarlo
+            return False
+
+        reales = {pos.ticket: pos._asdict() for pos in positions if pos.magic == self.magic}
+        with self._lock_libro:
+            recientes = {t: p for t, p in self.posiciones.items()
+                         if t not in reales and p.get("_registrada", 0.0) >= inicio}
+            previas = self.posiciones.keys() - recientes.keys()
+            if reales.keys() != previas:
+                self.correcciones += 1
+            reales.update(recientes)
+            self.posiciones = reales
+        self.reconciliaciones += 1
+        return True
+
     def tengo_posicion_abierta(self):
-        """Revisa si ya estamos dentro del mercado"""
-        positions = mt5.positions_get(symbol=self.symbol)
-        if positions:
-            for pos in positions:
-                if pos.magic == self.magic:
-                    return True
-        return False
\ No newline at end of file
+        """Revisa si ya estamos dentro del mercado (libro local; consulta al terminal solo al vencer el intervalo)"""
+        if time.monotonic() - self._ultima_reconciliacion >= self.intervalo_reconciliacion:
+            self.reconciliar()
+        return bool(self.posiciones)
@@ -31,13 +31,13 @@ class DataCleaner:
         
         # A. Eliminar duplicados exactos (si hay timestamp)
         if "Timestamp" in df.columns:
-            df = df.unique(subset=["Timestamp"], keep="first")
-            # Intentar ordenar por fecha si es posible parsearla, si no, confiamos en el orden del CSV
+            df = df.unique(subset=["Timestamp"], keep="first", maintain_order=True)
+            # Timestamp tipado (Datetime) y ordenado: los filtros por rango usan las estadísticas del Parquet
             try:
-                # Si es string fecha
-                df = df.with_columns(pl.col("Timestamp").str.to_datetime(strict=False).alias("ts_temp"))
-                df = df.sort("ts_temp").drop("ts_temp")
-            except:
+                if df["Timestamp"].dtype == pl.Utf8:
+                    df = df.with_columns(_parsear_timestamp(pl.col("Timestamp")))
+                df = df.sort("Timestamp", maintain_order=True)
+            except Exception:
                 pass # Si falla el ordenamiento por fecha, seguimos igual
         
         # B. Eliminar filas con Nulos en precios (Basura)
@@ -72,7 +72,99 @@ class DataCleaner:
             print(f"ERROR AL GUARDAR: {e}")
             return False
 
+    def ejecutar_limpieza_streaming(self, row_group_size=100_000):
+        """
+        Versión lazy: escaneo del CSV y volcado directo a Parquet (sink), sin DataFrame
+        intermedio del CSV completo ni copias entre pasos.
+
+        - Mismo resultado y mismo schema que `ejecutar_limpieza`: duplicados por Timestamp
+          (se queda la primera aparición del CSV) y `Timestamp` escrito como Datetime,
+          ordenado y con estadísticas por row group: un filtro por rango de fechas con
+          `pl.scan_parquet(...)` salta los row groups que no aplican.
+        - Memoria: lectura, filtros y casts van por lotes, pero la deduplicación y el orden
+          global necesitan ver todas las filas; el pico NO es acotado (menor que el modo
+          batch, del orden del dataset). Por eso se reporta el pico de RSS.
+        - Reporta filas de entrada/salida y el pico de RSS del proceso.
+        """
+        print("--- LIMPIEZA STREAMING (LAZY + SINK) ---")
+        print(f"[1] Escaneando archivo raw: {self.input_path}")
+
+        if not os.path.exists(self.input_path):
+            print(f"ERROR: No se encuentra {self.input_path}")
+            return False
+
+        lf = pl.scan_csv(self.input_path, infer_schema_length=10000, ignore_errors=True)
+        schema = lf.collect_schema() if hasattr(lf, "collect_schema") else lf.schema
+
+        # A. Duplicados y orden por fecha
+        if "Timestamp" in schema:
+            # keep="first" como el modo batch: determinista aunque dos filas difieran en contenido
+            lf = lf.unique(subset=["Timestamp"], keep="first", maintain_order=True)
+            if schema["Timestamp"] == pl.Utf8:
+                lf = lf.with_columns(_parsear_timestamp(pl.col("Timestamp")))
+            lf = lf.sort("Timestamp", maintain_order=True)
+
+        # B. Nulos en precios (Basura)
+        cols_presentes = [c for c in ["Close_Price", "EMA_Princ"] if c in schema]
+        if cols_presentes:
+            lf = lf.drop_nulls(subset=cols_presentes)
+
+        # C. Float32 (MANDAMIENTO DE RENDIMIENTO)
+        float_cols = [c for c, dtype in schema.items() if dtype == pl.Float64]
+        if float_cols:
+            lf = lf.with_columns([pl.col(c).cast(pl.Float32) for c in float_cols])
+
+        # [2] SINK A PARQUET
+        print(f"[2] Volcando en streaming a {self.output_path} ...")
+        try:
+            os.makedirs(os.path.dirname(self.output_path), exist_ok=True)
+            lf.sink_parquet(self.output_path, row_group_size=row_group_size, statistics=True)
+        except Exception as e:
+            print(f"ERROR EN STREAMING: {e}")
+            return False
+
+        # [3] REPORTE (conteos también en streaming)
+        rows_inicial = _contar_filas(pl.scan_csv(self.input_path, infer_schema_length=10000, ignore_errors=True))
+        rows_final = _contar_filas(pl.scan_parquet(self.output_path))
+        pico = _pico_rss_mb()
+        print("[3] Limpieza terminada.")
+        print(f"    -> Filas entrada: {rows_inicial} | salida: {rows_final} | eliminadas: {rows_inicial - rows_final}")
+        print(f"    -> Pico RSS: {pico:.1f} MB" if pico is not None else "    -> Pico RSS: no disponible en esta plataforma")
+        return True
+
+
+def _parsear_timestamp(col: pl.Expr) -> pl.Expr:
+    """Timestamp de texto -> Datetime (formato MT5 "2024.01.31 13:45" o ISO); lo ilegible queda null."""
+    return pl.coalesce([
+        col.str.to_datetime(format="%Y.%m.%d %H:%M", strict=False),
+        col.str.to_datetime(strict=False),
+    ]).alias("Timestamp")
+
+
+def _contar_filas(lf) -> int:
+    return lf.select(pl.first().len()).collect().item()
+
+
+def _pico_rss_mb():
+    """Pico de memoria residente del proceso (MB). `resource` en Unix, psutil si está instalado."""
+    try:
+        import resource
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reporta KB, macOS bytes
+        return pico / (1024 * 1024) if sys.platform == "darwin" else pico / 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / (1024 * 1024)
+    except ImportError:
+        return None
+
 if __name__ == "__main__":
     # Puedes cambiar el nombre del archivo aquí si tu histórico se llama distinto
     cleaner = DataCleaner("Dataset_Con_Regimenes.csv") 
-    cleaner.ejecutar_limpieza()
\ No newline at end of file
+    if "--streaming" in sys.argv:
+        cleaner.ejecutar_limpieza_streaming()
+    else:
+        cleaner.ejecutar_limpieza()
\ No newline at end of file
@@ -1,3 +1,4 @@
+import math
 import polars as pl
 import numpy as np
 
@@ -145,4 +146,203 @@ class TechnicalIndicators:
             "ATR_Act": last_row["ATR_Act"]
         }
 
-        return features_dict
\ No newline at end of file
+        return features_dict
+
+def _div(a, b):
+    """División con la semántica de Polars/NumPy (x/0 -> inf, 0/0 -> NaN) en vez de excepción."""
+    if b == 0:
+        if a == 0 or math.isnan(a):
+            return math.nan
+        return math.copysign(math.inf, a)
+    return a / b
+
+
+def _alpha(span):
+    return 2.0 / (span + 1.0)
+
+
+class IndicadoresIncrementales:
+    # Mismos parámetros que TechnicalIndicators.calcular_features
+    RSI_PERIOD = 14
+    ATR_PERIOD = 14
+    ADX_PERIOD = 14
+    EMA_PRINCIPAL = 80
+    RSI_SPAN = 27
+    VOL_MA = 20
+
+    def __init__(self):
+        """
+        Motor de indicadores con estado (EMA, ATR, RSI, MACD, ADX).
+
+        Arrastra el estado recursivo EWM/Wilder de la última vela CERRADA y actualiza
+        en O(1) cuando cierra una vela nueva. La vela en formación se calcula como
+        actualización provisional SIN tocar el estado.
+        """
+        self.estado = None
+        self.ultimo_ts_cerrado = None
+        self.min_velas = 300
+
+    def reiniciar(self):
+        self.estado = None
+        self.ultimo_ts_cerrado = None
+
+    def _paso(self, est, ts, high, low, close, tick_volume):
+        """Aplica una vela sobre el estado `est` y devuelve (nuevo_estado, features)."""
+        a_ema = _alpha(self.EMA_PRINCIPAL)
+        a_atr = _alpha(self.ATR_PERIOD)
+        a_rsi = _alpha(self.RSI_SPAN)
+        a_adx = _alpha(self.ADX_PERIOD)
+
+        if est is None:
+            # Primera vela: sin cierre previo (igual que los nulls del shift en la versión por lotes)
+            tr = high - low
+            gain = loss = plus_dm = minus_dm = 0.0
+            ema_princ, atr, ema12, ema26 = close, tr, close, close
+            avg_gain, avg_loss = gain, loss
+            smooth_plus, smooth_minus, smooth_tr = plus_dm, minus_dm, tr
+            ema_prev = None
+            volumenes = (tick_volume,)
+        else:
+            prev_close = est["close"]
+            tr = max(high - low, abs(high - prev_close), abs(low - prev_close))
+
+            delta = close - prev_close
+            gain = delta if delta > 0 else 0.0
+            loss = abs(delta) if delta < 0 else 0.0
+
+            up_move = high - est["high"]
+            down_move = est["low"] - low
+            plus_dm = up_move if (up_move > down_move and up_move > 0) else 0.0
+            minus_dm = down_move if (down_move > up_move and down_move > 0) else 0.0
+
+            ema_prev = est["ema_princ"]
+            ema_princ = (1 - a_ema) * ema_prev + a_ema * close
+            atr = (1 - a_atr) * est["atr"] + a_atr * tr
+            avg_gain = (1 - a_rsi) * est["avg_gain"] + a_rsi * gain
+            avg_loss = (1 - a_rsi) * est["avg_loss"] + a_rsi * loss
+            ema12 = (1 - _alpha(12)) * est["ema12"] + _alpha(12) * close
+            ema26 = (1 - _alpha(26)) * est["ema26"] + _alpha(26) * close
+            smooth_plus = (1 - a_adx) * est["smooth_plus"] + a_adx * plus_dm
+            smooth_minus = (1 - a_adx) * est["smooth_minus"] + a_adx * minus_dm
+            smooth_tr = (1 - a_adx) * est["smooth_tr"] + a_adx * tr
+            volumenes = (est["volumenes"] + (tick_volume,))[-self.VOL_MA:]
+
+        # RSI
+        rsi = 100 - _div(100.0, 1 + _div(avg_gain, avg_loss))
+        if math.isnan(rsi):
+            rsi = 50.0
+
+        # ADX
+        plus_di = 100 * _div(smooth_plus, smooth_tr)
+        minus_di = 100 * _div(smooth_minus, smooth_tr)
+        dx = 100 * _div(abs(plus_di - minus_di), plus_di + minus_di)
+        if math.isnan(dx):
+            dx = 0.0
+        adx = dx if est is None else (1 - a_adx) * est["adx"] + a_adx * dx
+
+        # Volumen relativo (media móvil de 20 velas, null hasta completar la ventana)
+        if len(volumenes) < self.VOL_MA:
+            vol_rel = None
+        else:
+            vol_rel = _div(tick_volume, sum(volumenes) / self.VOL_MA)
+            if math.isnan(vol_rel):
+                vol_rel = 0.0
+
+        nuevo = {
+            "close": close, "high": high, "low": low,
+            "ema_princ": ema_princ, "atr": atr,
+            "avg_gain": avg_gain, "avg_loss": avg_loss,
+            "ema12": ema12, "ema26": ema26,
+            "smooth_plus": smooth_plus, "smooth_minus": smooth_minus, "smooth_tr": smooth_tr,
+            "adx": adx, "volumenes": volumenes,
+        }
+
+        features = {
+            "Timestamp": str(ts),
+            "Close_Price": close,
+            "ATR_Rel": atr / close,
+            "RSI_Val": rsi,
+            "MACD_Val": ema12 - ema26,
+            "ADX_Val": adx,
+            "EMA_Princ_Slope": None if ema_prev is None else ema_princ - ema_prev,
+            "Volumen_Relativo": vol_rel,
+            "EMA_Princ": ema_princ,
+            "ATR_Act": atr
+        }
+        return nuevo, features
+
+    def actualizar(self, df_velas: pl.DataFrame) -> dict:
+        """
+        Recibe el mismo DataFrame de velas que `calcular_features` y devuelve el mismo diccionario.
+        - Velas nuevas ya cerradas -> se consolidan en el estado (O(1) cada una).
+        - Última vela (en formación) -> cálculo provisional, el estado no cambia.
+        """
+        if df_velas is None or df_velas.height < self.min_velas:
+            return {}
+
+        df = df_velas
+        if self.ultimo_ts_cerrado is not None:
+            df = df.filter(pl.col("timestamp") > self.ultimo_ts_cerrado)
+            if df.is_empty():
+                return {}
+
+        filas = df.select([
+            pl.col("timestamp"),
+            pl.col("high").cast(pl.Float64),
+            pl.col("low").cast(pl.Float64),
+            pl.col("close").cast(pl.Float64),
+            pl.col("tick_volume").cast(pl.Float64)
+        ]).rows()
+
+        # 1. Consolidar todas las velas cerradas
+        for ts, high, low, close, tick_volume in filas[:-1]:
+            self.estado, _ = self._paso(self.estado, ts, high, low, close, tick_volume)
+            self.ultimo_ts_cerrado = ts
+
+        # 2. Vela en formación: provisional
+        ts, high, low, close, tick_volume = filas[-1]
+        _, features = self._paso(self.estado, ts, high, low, close, tick_volume)
+        return features
+
+
+if __name__ == "__main__":
+    # Paridad: motor incremental vs. recálculo completo sobre un paseo aleatorio de velas M1
+    import random
+
+    random.seed(11)
+    filas = []
+    precio = 50000.0
+    for i in range(1300):
+        apertura = precio
+        precio += random.gauss(0, 20)
+        filas.append({
+            "timestamp": 1700000000 + 60 * i,
+            "open": apertura,
+            "high": max(apertura, precio) + abs(random.gauss(0, 5)),
+            "low": min(apertura, precio) - abs(random.gauss(0, 5)),
+            "close": precio,
+            "tick_volume": random.randint(50, 500)
+        })
+    df_total = pl.DataFrame(filas)
+
+    batch = TechnicalIndicators()
+    stream = IndicadoresIncrementales()
+
+    for k in range(300, df_total.height + 1):
+        df_k = df_total.head(k)
+        # La vela en formación cambia varias veces antes de cerrar
+        for _ in range(3):
+            ultima = df_k.tail(1).with_columns(
+                (pl.col("close") + random.gauss(0, 3)).alias("close"),
+                (pl.col("tick_volume") + 1).alias("tick_volume")
+            )
+            df_k = pl.concat([df_k.head(k - 1), ultima])
+            esperado = batch.calcular_features(df_k)
+            obtenido = stream.actualizar(df_k)
+            for clave, valor in esperado.items():
+                if isinstance(valor, float):
+                    assert math.isclose(valor, obtenido[clave], rel_tol=1e-9, abs_tol=1e-9), (k, clave, valor, obtenido[clave])
+                else:
+                    assert valor == obtenido[clave], (k, clave, valor, obtenido[clave])
+
+    print("Paridad OK: IndicadoresIncrementales == TechnicalIndicators")
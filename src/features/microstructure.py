@@ -1,3 +1,4 @@
+from collections import deque
 import polars as pl
 
 class MicrostructureAnalyzer:
@@ -61,4 +62,95 @@ class MicrostructureAnalyzer:
             
         except Exception as e:
             print(f"[MICRO ERROR] {e}")
-            return {"status": "ERROR", "desbalance": 0.0, "compras": 0, "ventas": 0, "intensidad": 0}
\ No newline at end of file
+            return {"status": "ERROR", "desbalance": 0.0, "compras": 0, "ventas": 0, "intensidad": 0}
+
+class MicrostructureStream:
+    def __init__(self, ventana_ticks=1000):
+        """
+        Versión incremental de `MicrostructureAnalyzer.analizar_flujo`.
+
+        Mantiene contadores corrientes de Ask-arriba (compras) y Bid-abajo (ventas)
+        sobre la misma ventana de N tics. Cada tic nuevo suma su par (anterior, actual)
+        y, si la ventana está llena, resta el par del tic que sale. Todo en O(1).
+        """
+        self.ventana_ticks = ventana_ticks
+        # Un par por cada tic salvo el primero de la ventana: (es_compra, es_venta)
+        self._pares = deque()
+        self._total_ticks = 0
+        self._ultimo_bid = None
+        self._ultimo_ask = None
+        self.compras = 0
+        self.ventas = 0
+
+    def actualizar(self, bid, ask) -> dict:
+        """Registra un tic (Bid/Ask) y devuelve las métricas de la ventana."""
+        if self._ultimo_ask is not None:
+            es_compra = ask > self._ultimo_ask
+            es_venta = bid < self._ultimo_bid
+            self._pares.append((es_compra, es_venta))
+            self.compras += es_compra
+            self.ventas += es_venta
+
+        self._ultimo_bid = bid
+        self._ultimo_ask = ask
+
+        # Salida del tic más viejo: desaparece su par con el siguiente
+        if self._total_ticks < self.ventana_ticks:
+            self._total_ticks += 1
+        else:
+            sale_compra, sale_venta = self._pares.popleft()
+            self.compras -= sale_compra
+            self.ventas -= sale_venta
+
+        return self.resultado()
+
+    def resultado(self) -> dict:
+        """Mismo diccionario que la versión por lotes, sin recorrer la ventana."""
+        if self._total_ticks < 5:
+            return {"status": "EMPTY", "desbalance": 0.0, "compras": 0, "ventas": 0, "intensidad": 0}
+
+        total_eventos = self.compras + self.ventas
+        score = (self.compras - self.ventas) / total_eventos if total_eventos else 0.0
+
+        return {
+            "status": "OK",
+            "desbalance": score,
+            "intensidad": self._total_ticks,
+            "compras": self.compras,
+            "ventas": self.ventas
+        }
+
+    def reiniciar(self):
+        self._pares.clear()
+        self._total_ticks = 0
+        self._ultimo_bid = None
+        self._ultimo_ask = None
+        self.compras = 0
+        self.ventas = 0
+
+
+if __name__ == "__main__":
+    # Paridad rápida: versión incremental vs. versión por lotes sobre un paseo aleatorio
+    import random
+
+    VENTANA = 200
+    random.seed(7)
+    batch = MicrostructureAnalyzer()
+    stream = MicrostructureStream(ventana_ticks=VENTANA)
+
+    bids, asks = [], []
+    bid = 50000.0
+    for i in range(5000):
+        bid = round(bid + random.choice([-1.0, 0.0, 0.0, 1.0]), 2)
+        ask = round(bid + random.choice([5.0, 5.0, 6.0]), 2)
+        bids.append(bid)
+        asks.append(ask)
+
+        res_stream = stream.actualizar(bid, ask)
+        res_batch = batch.analizar_flujo(pl.DataFrame({"bid": bids[-VENTANA:], "ask": asks[-VENTANA:]}))
+
+        for k in ("status", "compras", "ventas", "intensidad"):
+            assert res_stream[k] == res_batch[k], (i, k, res_stream, res_batch)
+        assert abs(res_stream["desbalance"] - res_batch["desbalance"]) < 1e-12, (i, res_stream, res_batch)
+
+    print("Paridad OK: MicrostructureStream == MicrostructureAnalyzer")
@@ -0,0 +1,77 @@
+import numpy as np
+import polars as pl
+
+class TickRingBuffer:
+    def __init__(self, capacidad=1000):
+        """
+        Ventana de tics de capacidad fija, columnar y preasignada (NumPy).
+
+        Cada tic se escribe DOS veces (posición i e i + capacidad). Así la ventana
+        siempre es un bloque contiguo de memoria y se puede entregar como vista
+        sin copiar, en vez de reconstruir un DataFrame en cada iteración.
+        """
+        self.capacidad = capacidad
+        self._time_msc = np.zeros(2 * capacidad, dtype=np.int64)
+        self._bid = np.zeros(2 * capacidad, dtype=np.float64)
+        self._ask = np.zeros(2 * capacidad, dtype=np.float64)
+        self._flags = np.zeros(2 * capacidad, dtype=np.uint32)
+
+        self._cabeza = 0   # Próxima posición de escritura (0 .. capacidad-1)
+        self._total = 0    # Tics válidos en la ventana (máx. capacidad)
+
+    def __len__(self):
+        return self._total
+
+    def agregar(self, time_msc, bid, ask, flags=0):
+        """Inserta un tic en O(1). Si está llena, el más antiguo sale solo."""
+        i = self._cabeza
+        j = i + self.capacidad
+        self._time_msc[i] = self._time_msc[j] = time_msc
+        self._bid[i] = self._bid[j] = bid
+        self._ask[i] = self._ask[j] = ask
+        self._flags[i] = self._flags[j] = flags
+
+        self._cabeza = (i + 1) % self.capacidad
+        if self._total < self.capacidad:
+            self._total += 1
+
+    def _rango(self):
+        # Con la escritura espejo, la ventana [inicio, fin) siempre es contigua
+        fin = self._cabeza + self.capacidad if self._total == self.capacidad else self._cabeza
+        return fin - self._total, fin
+
+    def vista_numpy(self) -> dict:
+        """Vistas (sin copia) de cada columna, del tic más viejo al más nuevo."""
+        inicio, fin = self._rango()
+        return {
+            "time_msc": self._time_msc[inicio:fin],
+            "bid": self._bid[inicio:fin],
+            "ask": self._ask[inicio:fin],
+            "flags": self._flags[inicio:fin],
+        }
+
+    def vista_polars(self, copiar=False) -> pl.DataFrame:
+        """
+        DataFrame sobre las mismas vistas NumPy (Polars no copia buffers numéricos contiguos).
+
+        ⚠️ Sin `copiar` el frame ALIASEA el anillo: el siguiente `agregar` cambia su contenido
+        (ej. [2,3,4,5] pasa a [99,3,4,5]). Usarlo y descartarlo dentro de la misma iteración;
+        si se guarda o se pasa a otro hilo, pedirlo con copiar=True.
+        """
+        if self._total == 0:
+            return pl.DataFrame()
+        columnas = self.vista_numpy()
+        if copiar:
+            columnas = {k: v.copy() for k, v in columnas.items()}
+        return pl.DataFrame(columnas)
+
+    def ultimo(self):
+        """Último tic como tupla (time_msc, bid, ask, flags) o None."""
+        if self._total == 0:
+            return None
+        i = (self._cabeza - 1) % self.capacidad
+        return int(self._time_msc[i]), float(self._bid[i]), float(self._ask[i]), int(self._flags[i])
+
+    def limpiar(self):
+        self._cabeza = 0
+        self._total = 0
@@ -1,5 +1,7 @@
 import polars as pl
 import numpy as np
+import glob
+import json
 import os
 
 class BacktestEngine:
@@ -8,14 +10,21 @@ class BacktestEngine:
         self.capital = initial_capital
         self.spread = spread_cost # Costo aproximado por trade en USD
         self.df = None
+        # Memoización por timeframe: (close, score, delta) como arrays de solo lectura
+        self._cache_arrays = {}
 
     def cargar_datos(self):
         if not os.path.exists(self.data_path):
             print("Error: No hay datos históricos.")
             return False
         
-        # Leemos y limpiamos
-        self.df = pl.read_csv(self.data_path, ignore_errors=True)
+        # Leemos y limpiamos (CSV o carpeta Parquet: segmentos del DataLogger o el
+        # historial particionado anio=/mes= de download_history, por eso la búsqueda recursiva)
+        if os.path.isdir(self.data_path):
+            self.df = pl.scan_parquet(os.path.join(self.data_path, "**", "*.parquet"), hive_partitioning=False).collect()
+        else:
+            self.df = pl.read_csv(self.data_path, ignore_errors=True)
+        self._cache_arrays = {}
         
         # Asegurar tipos numéricos
         cols = ["Close_Price", "Micro_Score"]
@@ -23,8 +32,10 @@ class BacktestEngine:
             if c in self.df.columns:
                 self.df = self.df.with_columns(pl.col(c).cast(pl.Float64))
         
-        # Parsear fecha
-        if "Timestamp" in self.df.columns:
+        # Parsear fecha (los segmentos Parquet ya traen Timestamp tipado)
+        if "Timestamp" in self.df.columns and self.df["Timestamp"].dtype != pl.Utf8:
+            self.df = self.df.with_columns(pl.col("Timestamp").alias("datetime")).sort("datetime")
+        elif "Timestamp" in self.df.columns:
             try:
                 self.df = self.df.with_columns(pl.col("Timestamp").str.to_datetime(strict=False).alias("datetime"))
                 self.df = self.df.sort("datetime")
@@ -32,15 +43,10 @@ class BacktestEngine:
             
         return True
 
-    def ejecutar_simulacion(self, umbral_ballena=0.15, stop_loss_pct=0.005, take_profit_pct=0.015, timeframe_min=5):
-        """
-        Simula la estrategia de Absorción/Distribución
-        """
-        if self.df is None: return 0.0
-
-        # 1. Agrupar datos según timeframe (Simular velas de 5m, 15m, etc)
+    def _resamplear(self, timeframe_min):
+        # Agrupar datos según timeframe (Simular velas de 5m, 15m, etc)
         # Esto es vital: no operamos cada tick, operamos cierres de estructura
-        df_sim = (
+        return (
             self.df.sort("datetime")
             .group_by_dynamic("datetime", every=f"{timeframe_min}m")
             .agg([
@@ -52,15 +58,186 @@ class BacktestEngine:
             (pl.col("close") - pl.col("open")).alias("price_delta")
         ])
 
+    def _arrays_timeframe(self, timeframe_min):
+        """
+        Arrays (close, score, delta) del timeframe, calculados UNA vez y compartidos.
+        Se marcan de solo lectura para que ningún trial los modifique.
+        """
+        if timeframe_min not in self._cache_arrays:
+            # Las filas sin precio o sin score se saltaban en el bucle: las quitamos antes
+            df_sim = self._resamplear(timeframe_min).drop_nulls(subset=["close", "score_avg"])
+            arrays = (
+                df_sim["close"].cast(pl.Float64).to_numpy(),
+                df_sim["score_avg"].cast(pl.Float64).to_numpy(),
+                df_sim["price_delta"].cast(pl.Float64).fill_null(np.nan).to_numpy(),
+            )
+            for arr in arrays:
+                arr.setflags(write=False)
+            self._cache_arrays[timeframe_min] = arrays
+        return self._cache_arrays[timeframe_min]
+
+    def precargar(self, timeframes=(1, 5, 15)):
+        """Prepara los timeframes de antemano (útil antes de lanzar trials en paralelo)."""
+        for tf in timeframes:
+            self._arrays_timeframe(tf)
+
+    # ------------------------------------------------------------------
+    # ARRAYS EN DISCO (compartidos entre procesos también con spawn / Windows)
+    # ------------------------------------------------------------------
+    _COLUMNAS_ARRAYS = ("close", "score", "delta")
+
+    def _firma_datos(self):
+        """Identifica la versión de los datos de origen (tamaño y fecha de modificación)."""
+        if os.path.isdir(self.data_path):
+            archivos = sorted(glob.glob(os.path.join(self.data_path, "**", "*.parquet"), recursive=True))
+        else:
+            archivos = [self.data_path] if os.path.exists(self.data_path) else []
+        return [[os.path.relpath(a, os.path.dirname(self.data_path)).replace(os.sep, "/"), os.path.getsize(a), int(os.path.getmtime(a))] for a in archivos]
+
+    def guardar_arrays(self, carpeta, timeframes=(1, 5, 15)):
+        """Escribe los arrays de cada timeframe como .npy (+ firma de los datos de origen)."""
+        os.makedirs(carpeta, exist_ok=True)
+        for tf in timeframes:
+            for nombre, arr in zip(self._COLUMNAS_ARRAYS, self._arrays_timeframe(tf)):
+                destino = os.path.join(carpeta, f"tf{tf}_{nombre}.npy")
+                with open(destino + ".tmp", "wb") as f:
+                    np.save(f, arr)
+                os.replace(destino + ".tmp", destino)
+        with open(os.path.join(carpeta, "firma.json"), "w") as f:
+            json.dump({"data_path": self.data_path, "timeframes": list(timeframes), "firma": self._firma_datos()}, f)
+
+    def cargar_arrays(self, carpeta, timeframes=(1, 5, 15)):
+        """
+        Abre los .npy con mmap (solo lectura): todos los procesos comparten las páginas del
+        sistema operativo en lugar de releer y resamplear el origen. False si faltan o están viejos.
+        """
+        try:
+            with open(os.path.join(carpeta, "firma.json")) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if meta.get("data_path") != self.data_path or meta.get("firma") != self._firma_datos() \
+                or not set(timeframes) <= set(meta.get("timeframes", [])):
+            return False
+
+        for tf in timeframes:
+            self._cache_arrays[tf] = tuple(
+                np.load(os.path.join(carpeta, f"tf{tf}_{nombre}.npy"), mmap_mode="r")
+                for nombre in self._COLUMNAS_ARRAYS
+            )
+        return True
+
+    def ejecutar_simulacion(self, umbral_ballena=0.15, stop_loss_pct=0.005, take_profit_pct=0.015, timeframe_min=5, reportar=None, n_reportes=10):
+        """
+        Simula la estrategia de Absorción/Distribución
+
+        reportar: callback opcional `reportar(paso, balance)` llamado `n_reportes` veces a lo
+                  largo de los datos con el balance realizado hasta ese punto (para poda en Optuna).
+                  Si lanza una excepción, la simulación se corta ahí.
+        """
+        if self.df is None and timeframe_min not in self._cache_arrays: return 0.0
+
+        # 1. Velas del timeframe pedido (memoizadas)
+        precio, score, delta = self._arrays_timeframe(timeframe_min)
+
+        # 2. Núcleo vectorizado (mismas reglas que la versión fila a fila)
+        balance, trades = self._simular_vectorizado(precio, score, delta, umbral_ballena, stop_loss_pct, take_profit_pct,
+                                                    reportar=reportar, n_reportes=n_reportes)
+
+        return self._metricas(balance, trades)
+
+    def _metricas(self, balance, trades):
+        # Métricas Finales
+        roi = ((balance - self.capital) / self.capital) * 100
+        win_rate = 0
+        if len(trades) > 0:
+            wins = len([t for t in trades if t > 0])
+            win_rate = (wins / len(trades)) * 100
+            
+        return {
+            "balance_final": balance,
+            "roi_pct": roi,
+            "trades_total": len(trades),
+            "win_rate": win_rate,
+            "trades": trades
+        }
+
+    def _simular_vectorizado(self, precio, score, delta, umbral_ballena, stop_loss_pct, take_profit_pct, reportar=None, n_reportes=10):
+        """
+        Motor sobre arrays NumPy.
+        - Las señales de entrada se calculan de una vez para todas las velas.
+        - La máquina de estados solo itera por TRADE (no por vela): desde cada entrada
+          se busca la primera vela que toca SL/TP con operaciones de array.
+        """
+        # 1. Señales: +1 ABSORCIÓN (LONG), -1 DISTRIBUCIÓN (SHORT), 0 nada
+        senal = np.zeros(len(precio), dtype=np.int8)
+        senal[(score > umbral_ballena) & (delta <= 0)] = -1
+        senal[(score < -umbral_ballena) & (delta >= 0)] = 1   # LONG tiene prioridad (era el primer if)
+        entradas = np.flatnonzero(senal)
+
+        balance = self.capital
+        trades = []
+        desde = 0
+
+        # Puntos de control (vela) para los reportes intermedios de equity
+        marcas = [len(precio) * (i + 1) // n_reportes for i in range(n_reportes)] if reportar else []
+        paso = 0
+
+        # 2. Máquina de estados: FLAT -> entrada -> salida por SL/TP -> FLAT (desde la vela siguiente)
+        while True:
+            k = np.searchsorted(entradas, desde)
+            if k == len(entradas):
+                break
+            idx_entrada = entradas[k]
+            lado = senal[idx_entrada]
+            precio_entrada = precio[idx_entrada]
+
+            idx_salida, pnl = self._buscar_salida(precio, idx_entrada + 1, precio_entrada, lado, stop_loss_pct, take_profit_pct)
+            if idx_salida < 0:
+                break  # Posición abierta al final de los datos (no cuenta como trade)
+
+            # Reportar los puntos de control que quedaron atrás antes de esta salida
+            while paso < len(marcas) and marcas[paso] <= idx_salida:
+                reportar(paso, balance)
+                paso += 1
+
+            balance += pnl - self.spread
+            trades.append(pnl)
+            desde = idx_salida + 1  # La vela de salida no puede abrir (era `continue`)
+
+        while paso < len(marcas):
+            reportar(paso, balance)
+            paso += 1
+
+        return balance, trades
+
+    @staticmethod
+    def _buscar_salida(precio, inicio, precio_entrada, lado, stop_loss_pct, take_profit_pct):
+        """Primera vela >= inicio que toca TP o SL. Busca en bloques crecientes para no recorrer todo el array."""
+        n = len(precio)
+        bloque = 256
+        i = inicio
+        while i < n:
+            fin = min(i + bloque, n)
+            p = precio[i:fin]
+            pnl = (p - precio_entrada) if lado == 1 else (precio_entrada - p)
+            pnl_pct = pnl / precio_entrada
+            toques = np.flatnonzero((pnl_pct >= take_profit_pct) | (pnl_pct <= -stop_loss_pct))
+            if toques.size:
+                j = toques[0]
+                return i + j, float(pnl[j])
+            i = fin
+            bloque *= 2
+        return -1, 0.0
+
+    def _simular_por_filas(self, df_sim, umbral_ballena, stop_loss_pct, take_profit_pct):
+        """Versión original fila a fila. Se conserva como referencia de paridad."""
         balance = self.capital
         posicion = None # None, 'LONG', 'SHORT'
         precio_entrada = 0.0
         trades = []
 
-        # Convertir a diccionarios para iterar rápido (Polars es rápido, pero para lógica de estados iteramos)
-        rows = df_sim.to_dicts()
-
-        for row in rows:
+        for row in df_sim.to_dicts():
             precio = row['close']
             score = row['score_avg']
             delta = row['price_delta']
@@ -69,11 +246,9 @@ class BacktestEngine:
 
             # --- GESTIÓN DE SALIDA (SL/TP) ---
             if posicion == 'LONG':
-                # Calcular PnL
                 pnl = (precio - precio_entrada)
                 pnl_pct = pnl / precio_entrada
                 
-                # Salida por TP o SL
                 if pnl_pct >= take_profit_pct or pnl_pct <= -stop_loss_pct:
                     balance += pnl - self.spread
                     posicion = None
@@ -91,37 +266,56 @@ class BacktestEngine:
                     continue
 
             # --- GESTIÓN DE ENTRADA (Lógica de Ballenas) ---
-            if posicion is None:
-                # ESTRATEGIA: ABSORCIÓN (Compra)
-                # Score Rojo (< -umbral) + Precio Sube/Aguanta (delta >= 0)
+            if posicion is None and delta is not None:
                 if score < -umbral_ballena and delta >= 0:
                     posicion = 'LONG'
                     precio_entrada = precio
-                
-                # ESTRATEGIA: DISTRIBUCIÓN (Venta)
-                # Score Verde (> umbral) + Precio Baja/Aguanta (delta <= 0)
                 elif score > umbral_ballena and delta <= 0:
                     posicion = 'SHORT'
                     precio_entrada = precio
 
-        # Métricas Finales
-        roi = ((balance - self.capital) / self.capital) * 100
-        win_rate = 0
-        if len(trades) > 0:
-            wins = len([t for t in trades if t > 0])
-            win_rate = (wins / len(trades)) * 100
-            
-        return {
-            "balance_final": balance,
-            "roi_pct": roi,
-            "trades_total": len(trades),
-            "win_rate": win_rate
-        }
+        return balance, trades
 
 if __name__ == "__main__":
-    # Prueba rápida
-    path = os.path.join("data", "raw", "sesion_ballenas.csv")
-    engine = BacktestEngine(path)
-    if engine.cargar_datos():
-        res = engine.ejecutar_simulacion()
-        print(f"Resultado Simulación Base: {res}")
\ No newline at end of file
+    import sys
+    import time
+
+    if "--benchmark" in sys.argv:
+        # Benchmark: 1.000.000 velas M1 sintéticas, motor vectorizado vs. fila a fila
+        from datetime import datetime, timedelta
+
+        N = 1_000_000
+        rng = np.random.default_rng(42)
+        engine = BacktestEngine(None)
+        engine.df = pl.DataFrame({
+            "datetime": pl.datetime_range(datetime(2024, 1, 1), datetime(2024, 1, 1) + timedelta(minutes=N - 1), "1m", eager=True),
+            "Close_Price": 50000 + np.cumsum(rng.normal(0, 20, N)),
+            "Micro_Score": np.clip(rng.normal(0, 0.3, N), -1, 1),
+        })
+        df_sim = engine._resamplear(1)
+        params = (0.15, 0.005, 0.015)
+
+        t0 = time.perf_counter()
+        bal_ref, trades_ref = engine._simular_por_filas(df_sim, *params)
+        t_ref = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        bal_vec, trades_vec = engine._simular_vectorizado(*engine._arrays_timeframe(1), *params)
+        t_vec = time.perf_counter() - t0
+
+        assert trades_vec == trades_ref and bal_vec == bal_ref, "Las listas de trades difieren"
+        print(f"{N} velas | {len(trades_ref)} trades idénticos")
+        print(f"Fila a fila: {t_ref:.2f}s | Vectorizado: {t_vec:.3f}s | Speedup: {t_ref / t_vec:.1f}x")
+    else:
+        # Prueba rápida: segmentos Parquet del DataLogger (CSV heredado ya migrado), como optimize_strategy
+        sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+        from src.utils.logger import migrar_csv_heredado
+
+        migrar_csv_heredado("sesion_ballenas")
+        path = os.path.join("data", "raw", "sesion_ballenas")
+        if not os.path.isdir(path):
+            path += ".csv"
+        engine = BacktestEngine(path)
+        if engine.cargar_datos():
+            res = engine.ejecutar_simulacion()
+            print(f"Resultado Simulación Base: {res}")
\ No newline at end of file
@@ -0,0 +1,187 @@
+import numpy as np
+
+class BosqueCompilado:
+    def __init__(self, feature, threshold, left, right, proba, roots, max_depth, classes, media, escala, n_regimenes=7):
+        """
+        Random Forest "compilado" a arrays planos para inferencia de una fila.
+
+        - Todos los árboles comparten los mismos arrays de nodos; `roots` indica dónde empieza cada uno.
+        - La fila cruda se escala con las mismas operaciones del StandardScaler ((x - media) / escala,
+          en float64) y se pasa a float32 antes de comparar, igual que sklearn: en los valores
+          exactos de split el resultado coincide (plegar el scaler en umbrales float64 no lo garantiza).
+        - Las hojas apuntan a sí mismas, por lo que basta avanzar `max_depth` pasos a la vez
+          en TODOS los árboles (vectorizado) sin preguntar quién ya llegó.
+        - `proba` ya está expandida a las 7 columnas de régimen (índice = id de régimen).
+        """
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.proba = proba
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.classes = classes
+        self.media = np.asarray(media, dtype=np.float64)
+        self.escala = np.asarray(escala, dtype=np.float64)
+        self.n_regimenes = n_regimenes
+
+    @classmethod
+    def desde_sklearn(cls, model, scaler=None, n_regimenes=7):
+        """Exporta un RandomForestClassifier (y opcionalmente su StandardScaler) a arrays planos."""
+        n_features = model.n_features_in_
+        media = scaler.mean_ if scaler is not None and scaler.with_mean else np.zeros(n_features)
+        escala = scaler.scale_ if scaler is not None and scaler.with_std else np.ones(n_features)
+        clases = np.asarray(model.classes_).astype(np.int64)
+
+        features, thresholds, lefts, rights, probas, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for est in model.estimators_:
+            t = est.tree_
+            n = t.node_count
+            es_hoja = t.children_left == -1
+
+            feat = np.where(es_hoja, 0, t.feature).astype(np.int64)
+            thr = t.threshold.astype(np.float64).copy()
+            thr[es_hoja] = np.inf
+
+            propios = np.arange(n, dtype=np.int64) + offset
+            left = np.where(es_hoja, propios, t.children_left + offset)
+            right = np.where(es_hoja, propios, t.children_right + offset)
+
+            # Probabilidad por hoja normalizada (igual que predict_proba de cada árbol)
+            valores = t.value[:, 0, :].astype(np.float64)
+            sumas = valores.sum(axis=1, keepdims=True)
+            sumas[sumas == 0] = 1.0
+            proba = np.zeros((n, n_regimenes), dtype=np.float64)
+            proba[:, clases] = valores / sumas
+
+            features.append(feat); thresholds.append(thr)
+            lefts.append(left); rights.append(right); probas.append(proba)
+            roots.append(offset)
+            offset += n
+            max_depth = max(max_depth, t.max_depth)
+
+        return cls(
+            np.concatenate(features), np.concatenate(thresholds),
+            np.concatenate(lefts), np.concatenate(rights),
+            np.concatenate(probas), np.asarray(roots, dtype=np.int64),
+            max_depth, clases, media, escala, n_regimenes
+        )
+
+    def guardar(self, path):
+        np.savez(path, feature=self.feature, threshold=self.threshold, left=self.left, right=self.right,
+                 proba=self.proba, roots=self.roots, max_depth=self.max_depth, classes=self.classes,
+                 media=self.media, escala=self.escala, n_regimenes=self.n_regimenes)
+
+    @classmethod
+    def cargar(cls, path):
+        d = np.load(path)
+        if "media" not in d:
+            raise ValueError(f"{path}: formato anterior (scaler plegado en los umbrales), hay que recompilar")
+        return cls(d["feature"], d["threshold"], d["left"], d["right"], d["proba"], d["roots"],
+                   int(d["max_depth"]), d["classes"], d["media"], d["escala"], int(d["n_regimenes"]))
+
+    def _preparar(self, X):
+        """Cruda -> escalada como StandardScaler.transform -> float32 como el árbol de sklearn."""
+        return ((X - self.media) / self.escala).astype(np.float32).astype(np.float64)
+
+    def predecir_fila(self, x):
+        """
+        Una fila cruda (sin escalar) -> (regimen, probs[7]) en una sola pasada por el bosque.
+        """
+        x = self._preparar(x)
+        nodos = self.roots
+        for _ in range(self.max_depth):
+            va_izq = x[self.feature[nodos]] <= self.threshold[nodos]
+            nodos = np.where(va_izq, self.left[nodos], self.right[nodos])
+
+        probs = self.proba[nodos].mean(axis=0)
+        # Empates: el primero en el orden de classes_, como sklearn
+        regimen = int(self.classes[np.argmax(probs[self.classes])])
+        return regimen, probs
+
+    def predecir_lote(self, X, tam_bloque=4096):
+        """
+        Matriz cruda (n, features) -> (regimenes[n], probs[n, 7]), mismo resultado que fila por fila.
+
+        Se procesa por bloques para acotar la memoria temporal (bloque x árboles x 7).
+        Las filas con NaN/inf quedan en régimen 0 y probabilidades 0, igual que `predecir`.
+        """
+        X = np.asarray(X, dtype=np.float64)
+        n = X.shape[0]
+        regimenes = np.zeros(n, dtype=np.int64)
+        probs = np.zeros((n, self.n_regimenes), dtype=np.float64)
+
+        validas = np.flatnonzero(np.isfinite(X).all(axis=1))
+        for i in range(0, len(validas), tam_bloque):
+            filas = validas[i:i + tam_bloque]
+            Xb = self._preparar(X[filas])
+            idx_filas = np.arange(len(filas))[:, None]
+
+            nodos = np.broadcast_to(self.roots, (len(filas), len(self.roots)))
+            for _ in range(self.max_depth):
+                va_izq = Xb[idx_filas, self.feature[nodos]] <= self.threshold[nodos]
+                nodos = np.where(va_izq, self.left[nodos], self.right[nodos])
+
+            # Mismo promedio (eje de árboles) que predecir_fila -> resultados idénticos
+            pb = self.proba[nodos].mean(axis=1)
+            probs[filas] = pb
+            regimenes[filas] = self.classes[np.argmax(pb[:, self.classes], axis=1)]
+
+        return regimenes, probs
+
+
+if __name__ == "__main__":
+    # Verificación contra sklearn (filas al azar y filas justo en los umbrales) + latencia de una fila
+    import time
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.preprocessing import StandardScaler
+
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(20000, 6)) * [0.001, 15, 40, 10, 0.5, 1] + [0.001, 50, 0, 25, 0, 1]
+    y = (np.digitize(X[:, 1], [35, 45, 55, 65]) + (X[:, 3] > 25) * 2) % 7
+
+    scaler = StandardScaler().fit(X)
+    rf = RandomForestClassifier(n_estimators=100, max_depth=20, random_state=42, n_jobs=-1).fit(scaler.transform(X), y)
+    bosque = BosqueCompilado.desde_sklearn(rf, scaler)
+
+    X_test = rng.normal(size=(2000, 6)) * [0.001, 15, 40, 10, 0.5, 1] + [0.001, 50, 0, 25, 0, 1]
+    proba_sk = rf.predict_proba(scaler.transform(X_test))
+    pred_sk = rf.predict(scaler.transform(X_test))
+
+    iguales, max_diff = 0, 0.0
+    for i, x in enumerate(X_test):
+        reg, probs = bosque.predecir_fila(x)
+        iguales += reg == pred_sk[i]
+        max_diff = max(max_diff, float(np.abs(probs[rf.classes_] - proba_sk[i]).max()))
+    print(f"Coincidencia de régimen: {iguales}/{len(X_test)} | Máx. diferencia de probabilidad: {max_diff:.2e}")
+
+    # Sondas en los valores exactos de split (donde un umbral float64 plegado diverge de sklearn)
+    internos = np.flatnonzero(np.isfinite(bosque.threshold))
+    elegidos = rng.choice(internos, size=2000, replace=False)
+    X_sonda = np.repeat(X_test[:1], len(elegidos), axis=0)
+    f_sonda = bosque.feature[elegidos]
+    X_sonda[np.arange(len(elegidos)), f_sonda] = bosque.threshold[elegidos] * scaler.scale_[f_sonda] + scaler.mean_[f_sonda]
+    proba_sonda = rf.predict_proba(scaler.transform(X_sonda))
+    regs_sonda, probs_sonda = bosque.predecir_lote(X_sonda)
+    distintas = int((np.abs(probs_sonda[:, rf.classes_] - proba_sonda).max(axis=1) > 1e-12).sum())
+    print(f"Sondas en umbrales: {len(elegidos) - distintas}/{len(elegidos)} idénticas a sklearn")
+
+    regs_lote, probs_lote = bosque.predecir_lote(X_test)
+    regs_fila = np.array([bosque.predecir_fila(x)[0] for x in X_test])
+    probs_fila = np.array([bosque.predecir_fila(x)[1] for x in X_test])
+    print(f"Lote idéntico a fila por fila: {np.array_equal(regs_lote, regs_fila) and np.array_equal(probs_lote, probs_fila)}")
+
+    x = X_test[0]
+    n = 2000
+    t0 = time.perf_counter()
+    for _ in range(n): bosque.predecir_fila(x)
+    t_comp = (time.perf_counter() - t0) / n * 1e6
+
+    rf.set_params(n_jobs=1)
+    t0 = time.perf_counter()
+    for _ in range(200):
+        xs = scaler.transform(x.reshape(1, -1)); rf.predict(xs); rf.predict_proba(xs)
+    t_sk = (time.perf_counter() - t0) / 200 * 1e6
+    print(f"Latencia por fila: compilado {t_comp:.0f} us | sklearn (transform+predict+predict_proba) {t_sk:.0f} us")
@@ -1,31 +1,72 @@
 import optuna
 import os
 import sys
+import argparse
+import multiprocessing
 # Añadir ruta raíz para importar módulos
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 
 from src.models.backtest_engine import BacktestEngine
+from src.utils.logger import migrar_csv_heredado
+
+# Carpeta de segmentos Parquet del DataLogger; si no existe, el CSV heredado (ver `ruta_datos`)
+DATA_PATH = os.path.join("data", "raw", "sesion_ballenas")
+TIMEFRAMES = [1, 5, 15] # Minutos
+
+# Estudio persistente en SQLite local: se puede interrumpir, reanudar y repartir entre procesos
+STUDY_NAME = "ballenas_estrategia"
+STORAGE_PATH = os.path.join("data", "optuna", "ballenas_optuna.db")
+N_REPORTES = 10 # Puntos de control de equity por backtest (para la poda)
+ARRAYS_PATH = os.path.join("data", "optuna", "arrays") # Timeframes ya resampleados (.npy)
+
+# Motor compartido: el proceso principal parsea y resamplea UNA vez y deja los arrays en .npy.
+# Cada worker (fork o spawn, ej. Windows) los abre con mmap en vez de releer el origen.
+_motor = None
+
+def ruta_datos():
+    """Migra el CSV heredado a la carpeta de segmentos (una vez) y elige el origen de datos."""
+    migrar_csv_heredado(os.path.basename(DATA_PATH))
+    return DATA_PATH if os.path.isdir(DATA_PATH) else DATA_PATH + ".csv"
+
+def obtener_motor():
+    global _motor
+    if _motor is None:
+        # El proceso principal migra antes de crear workers: en ellos esto ya es un no-op
+        engine = BacktestEngine(ruta_datos())
+        if not engine.cargar_arrays(ARRAYS_PATH, TIMEFRAMES):
+            if not engine.cargar_datos():
+                return None
+            engine.precargar(TIMEFRAMES)
+            engine.guardar_arrays(ARRAYS_PATH, TIMEFRAMES)
+        _motor = engine
+    return _motor
 
 def objective(trial):
     # 1. Definir el espacio de búsqueda (Los parámetros que queremos optimizar)
     umbral = trial.suggest_float("umbral_ballena", 0.05, 0.30)
     sl = trial.suggest_float("stop_loss", 0.001, 0.02) # 0.1% a 2%
     tp = trial.suggest_float("take_profit", 0.002, 0.05) # 0.2% a 5%
-    tf = trial.suggest_categorical("timeframe", [1, 5, 15]) # Minutos
+    tf = trial.suggest_categorical("timeframe", TIMEFRAMES) # Minutos
     
-    # 2. Instanciar Motor
-    path = os.path.join("data", "raw", "sesion_ballenas.csv")
-    engine = BacktestEngine(path)
+    # 2. Motor compartido (datos ya cargados y resampleados)
+    engine = obtener_motor()
     
-    if not engine.cargar_datos():
+    if engine is None:
         return 0.0
     
-    # 3. Ejecutar Simulación
+    # 3. Ejecutar Simulación (reporta equity parcial; si el pruner la ve perdida, se corta)
+    def reportar(paso, balance):
+        trial.report(balance, paso)
+        if trial.should_prune():
+            raise optuna.TrialPruned()
+
     resultado = engine.ejecutar_simulacion(
         umbral_ballena=umbral,
         stop_loss_pct=sl,
         take_profit_pct=tp,
-        timeframe_min=tf
+        timeframe_min=tf,
+        reportar=reportar,
+        n_reportes=N_REPORTES
     )
     
     # 4. Definir qué queremos maximizar (Profit o ROI)
@@ -35,17 +76,83 @@ def objective(trial):
         
     return resultado["balance_final"]
 
-def ejecutar_optimizacion():
+def _storage():
+    os.makedirs(os.path.dirname(STORAGE_PATH), exist_ok=True)
+    # timeout alto: varios procesos escriben en el mismo archivo SQLite
+    return optuna.storages.RDBStorage(
+        url=f"sqlite:///{STORAGE_PATH}",
+        engine_kwargs={"connect_args": {"timeout": 60}}
+    )
+
+def crear_o_cargar_estudio(storage=None):
+    return optuna.create_study(
+        study_name=STUDY_NAME,
+        storage=storage or _storage(),
+        direction="maximize",
+        load_if_exists=True,
+        pruner=optuna.pruners.MedianPruner(n_startup_trials=5, n_warmup_steps=N_REPORTES // 3)
+    )
+
+def ejecutar_worker(n_trials_total):
+    """
+    Un worker (shard): se une al estudio compartido y toma trials hasta que el
+    estudio completo llegue a `n_trials_total` (contando los de otras corridas).
+    Se puede lanzar en otras terminales con `--worker`.
+    """
+    if obtener_motor() is None:
+        return
+    study = crear_o_cargar_estudio()
+    limite = optuna.study.MaxTrialsCallback(
+        n_trials_total, states=(optuna.trial.TrialState.COMPLETE, optuna.trial.TrialState.PRUNED)
+    )
+    study.optimize(objective, n_trials=n_trials_total, callbacks=[limite])
+
+def ejecutar_optimizacion(n_trials=100, n_procesos=None):
     print("--- 🧠 INICIANDO BÚSQUEDA DE HIPERPARÁMETROS (OPTUNA) ---")
     
-    study = optuna.create_study(direction="maximize")
-    study.optimize(objective, n_trials=100) # Probará 100 combinaciones
-    
+    # Cargar ANTES de crear procesos: deja los .npy listos para que los hijos solo los mapeen
+    if obtener_motor() is None:
+        return
+
+    n_procesos = n_procesos or os.cpu_count() or 1
+    storage = _storage()
+    previos = len(crear_o_cargar_estudio(storage).trials)
+    # El pool de SQLAlchemy no sobrevive a un fork: cerrar conexiones antes de crear los procesos.
+    # Cada worker abre su propio engine en crear_o_cargar_estudio().
+    storage.engine.dispose()
+    print(f"   Estudio: {STORAGE_PATH} ({previos} trials previos) | Procesos: {n_procesos}")
+
+    if n_procesos == 1:
+        ejecutar_worker(n_trials)
+    else:
+        procesos = [multiprocessing.Process(target=ejecutar_worker, args=(n_trials,)) for _ in range(n_procesos)]
+        for p in procesos: p.start()
+        for p in procesos: p.join()
+
+    study = crear_o_cargar_estudio()
+    podados = len([t for t in study.trials if t.state == optuna.trial.TrialState.PRUNED])
+    completos = len([t for t in study.trials if t.state == optuna.trial.TrialState.COMPLETE])
+
+    if completos == 0:
+        # best_value lanza ValueError si no hay ningún trial completo
+        print(f"\n⚠️ Ningún trial terminó ({len(study.trials)} trials, podados: {podados}). Sin mejor estrategia.")
+        return
+
     print("\n🏆 MEJOR ESTRATEGIA ENCONTRADA:")
+    print(f"   Trials: {len(study.trials)} (podados: {podados})")
     print(f"   Balance Final: ${study.best_value:.2f}")
     print("   Parámetros:")
     for key, value in study.best_params.items():
         print(f"     - {key}: {value}")
 
 if __name__ == "__main__":
-    ejecutar_optimizacion()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Optimización Optuna de la estrategia Ballenas")
+    parser.add_argument("--trials", type=int, default=100, help="Total de trials del estudio (incluye los ya hechos)")
+    parser.add_argument("--procesos", type=int, default=None, help="Procesos en paralelo (default: todos los núcleos)")
+    parser.add_argument("--worker", action="store_true", help="Solo unirse al estudio existente como un shard más")
+    args = parser.parse_args()
+
+    if args.worker:
+        ejecutar_worker(args.trials)
+    else:
+        ejecutar_optimizacion(n_trials=args.trials, n_procesos=args.procesos)
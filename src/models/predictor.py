@@ -1,14 +1,20 @@
 import joblib
 import numpy as np
 import os
+import time
+from collections import OrderedDict
 import pandas as pd # Usamos pandas para manejo rápido de dict a df en inferencia
+import polars as pl
+from src.models.compiled_forest import BosqueCompilado
 
 class MarketPredictor:
     def __init__(self, model_dir="models"):
         self.scaler_path = os.path.join(model_dir, "scaler.pkl")
         self.model_path = os.path.join(model_dir, "rf_model.pkl")
+        self.compilado_path = os.path.join(model_dir, "rf_compilado.npz")
         self.model = None
         self.scaler = None
+        self.bosque = None  # Bosque + scaler en arrays planos (ruta caliente de inferencia)
         self.loaded = False
         
         # EL ORDEN DEBE SER EXACTAMENTE EL MISMO DEL ENTRENAMIENTO
@@ -28,6 +34,7 @@ class MarketPredictor:
             if os.path.exists(self.scaler_path) and os.path.exists(self.model_path):
                 self.scaler = joblib.load(self.scaler_path)
                 self.model = joblib.load(self.model_path)
+                self.bosque = self._cargar_compilado()
                 self.loaded = True
                 print(f"[IA] Modelos cargados exitosamente desde {self.scaler_path}")
             else:
@@ -35,6 +42,23 @@ class MarketPredictor:
         except Exception as e:
             print(f"[IA CRITICAL] Error cargando cerebros: {e}")
 
+    def _cargar_compilado(self):
+        """Usa rf_compilado.npz si es más nuevo que los .pkl; si no, lo compila y lo guarda."""
+        if os.path.exists(self.compilado_path):
+            mtime_pkl = max(os.path.getmtime(self.scaler_path), os.path.getmtime(self.model_path))
+            if os.path.getmtime(self.compilado_path) >= mtime_pkl:
+                try:
+                    return BosqueCompilado.cargar(self.compilado_path)
+                except (ValueError, KeyError) as e:
+                    print(f"[IA] {e}")
+
+        bosque = BosqueCompilado.desde_sklearn(self.model, self.scaler)
+        try:
+            bosque.guardar(self.compilado_path)
+        except OSError as e:
+            print(f"[IA] No se pudo guardar el bosque compilado: {e}")
+        return bosque
+
     def predecir(self, macro_data: dict):
         """
         Recibe el diccionario de indicadores actuales y devuelve:
@@ -50,18 +74,107 @@ class MarketPredictor:
             # Si falta alguno, asumimos 0.0 para no romper el sistema
             row = [macro_data.get(f, 0.0) for f in self.features]
             
-            # 2. Convertir a numpy y reformatear (1 fila, N columnas)
-            X = np.array(row).reshape(1, -1)
-            
-            # 3. Escalar (Normalizar)
-            X_scaled = self.scaler.transform(X)
-            
-            # 4. Predecir
-            regimen = self.model.predict(X_scaled)[0]
-            probs = self.model.predict_proba(X_scaled)[0]
-            
-            return int(regimen), probs.tolist()
-            
+            # 2. Convertir a numpy (fila cruda: el scaler está plegado en los umbrales)
+            x = np.array(row, dtype=np.float64)
+            if not np.isfinite(x).all():
+                return 0, [0.0]*7
+
+            # 3. Recorrer el bosque compilado: régimen y probabilidades en una sola pasada
+            regimen, probs = self.bosque.predecir_fila(x)
+
+            return regimen, probs.tolist()
+
         except Exception as e:
             # Si pasa algo raro (ej. dato infinito), retornamos neutral
-            return 0, [0.0]*7
\ No newline at end of file
+            return 0, [0.0]*7
+
+    def predecir_lote(self, df: pl.DataFrame, tam_bloque=4096) -> pl.DataFrame:
+        """
+        Versión vectorizada de `predecir` para datasets completos (ej. simular el filtro IA en backtest).
+        Devuelve `df` con "Regimen_Actual" y "prob_regimen_0..6"; fila a fila el resultado es idéntico a `predecir`
+        (feature ausente -> 0.0, fila con nulos/inf -> régimen 0 y probabilidades 0).
+        """
+        n = df.height
+        if not self.loaded or n == 0:
+            regimenes = np.zeros(n, dtype=np.int64)
+            probs = np.zeros((n, 7), dtype=np.float64)
+        else:
+            X = df.select([
+                pl.col(f).cast(pl.Float64) if f in df.columns else pl.lit(0.0, dtype=pl.Float64).alias(f)
+                for f in self.features
+            ]).to_numpy()
+            regimenes, probs = self.bosque.predecir_lote(X, tam_bloque)
+
+        return df.with_columns(
+            [pl.Series("Regimen_Actual", regimenes, dtype=pl.Int64)] +
+            [pl.Series(f"prob_regimen_{i}", probs[:, i]) for i in range(7)]
+        )
+
+
+class PredictorConCache:
+    def __init__(self, predictor: MarketPredictor, max_entradas=256):
+        """
+        Memoización de `predecir` entre TechnicalIndicators y MarketPredictor.
+
+        Clave = (Timestamp de la vela, huella del vector de features). Si la vela y sus
+        features no cambiaron desde la última consulta, se devuelve el resultado guardado
+        sin volver a recorrer el bosque. LRU acotado a `max_entradas`.
+        """
+        self.predictor = predictor
+        self.max_entradas = max_entradas
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._seg_inferencia = 0.0
+
+    @property
+    def loaded(self):
+        return self.predictor.loaded
+
+    def _clave(self, macro_data):
+        huella = tuple(macro_data.get(f, 0.0) for f in self.predictor.features)
+        return (macro_data.get("Timestamp"), huella)
+
+    def predecir(self, macro_data: dict):
+        """Misma firma y retorno que MarketPredictor.predecir."""
+        if not macro_data:
+            return self.predictor.predecir(macro_data)
+
+        try:
+            clave = self._clave(macro_data)
+            hash(clave)
+        except TypeError:
+            # Feature no hasheable (raro): sin cache
+            return self.predictor.predecir(macro_data)
+
+        guardado = self._cache.get(clave)
+        if guardado is not None:
+            self._cache.move_to_end(clave)
+            self.hits += 1
+            regimen, probs = guardado
+            return regimen, list(probs)
+
+        t0 = time.perf_counter()
+        regimen, probs = self.predictor.predecir(macro_data)
+        self._seg_inferencia += time.perf_counter() - t0
+        self.misses += 1
+
+        self._cache[clave] = (regimen, tuple(probs))
+        if len(self._cache) > self.max_entradas:
+            self._cache.popitem(last=False)
+        return regimen, probs
+
+    def limpiar(self):
+        self._cache.clear()
+
+    def estadisticas(self):
+        """Contadores de hit/miss y CPU estimada ahorrada (hits x costo medio de una inferencia)."""
+        total = self.hits + self.misses
+        us_inferencia = (self._seg_inferencia / self.misses * 1e6) if self.misses else 0.0
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "tasa_hit": round(self.hits / total, 4) if total else 0.0,
+            "us_por_inferencia": round(us_inferencia, 1),
+            "ahorro_estimado_ms": round(self.hits * us_inferencia / 1000, 2)
+        }
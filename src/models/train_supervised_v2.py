@@ -2,10 +2,15 @@ import polars as pl
 import numpy as np
 import os
 import joblib
+import sys
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report, accuracy_score
 from sklearn.preprocessing import StandardScaler
+# Añadir ruta raíz para importar módulos
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from src.models.compiled_forest import BosqueCompilado
 
 class SupervisedTrainerV2:
     def __init__(self, data_path, model_dir):
@@ -100,6 +105,9 @@ class SupervisedTrainerV2:
         
         joblib.dump(scaler, path_scaler)
         joblib.dump(rf_model, path_model)
+
+        # Versión en arrays planos para inferencia en vivo (la usa MarketPredictor)
+        BosqueCompilado.desde_sklearn(rf_model, scaler).guardar(os.path.join(self.model_dir, "rf_compilado.npz"))
         
         print(f"    -> LISTO. Modelos guardados en {self.model_dir}")
 
@@ -1,5 +1,81 @@
-from collections import deque
-import time
+import numpy as np
+
+class VentanaTemporal:
+    # Bytes por observación: ts + precio + score (float64 cada uno)
+    BYTES_POR_OBSERVACION = 3 * 8
+
+    def __init__(self, capacidad_inicial=4096):
+        """
+        Ventana de tiempo compacta sobre arrays NumPy circulares con suma corriente.
+        Reemplaza la deque de diccionarios: 24 bytes por observación y
+        promedio en O(1) en vez de recorrer toda la ventana.
+        """
+        self._ts = np.zeros(capacidad_inicial, dtype=np.float64)
+        self._price = np.zeros(capacidad_inicial, dtype=np.float64)
+        self._score = np.zeros(capacidad_inicial, dtype=np.float64)
+        self._inicio = 0
+        self._total = 0
+        self.suma_score = 0.0
+        self._salidas = 0
+
+    def __len__(self):
+        return self._total
+
+    @property
+    def capacidad(self):
+        return len(self._ts)
+
+    def _crecer(self):
+        # Duplicamos y dejamos los datos contiguos desde 0 (amortizado O(1))
+        orden = (self._inicio + np.arange(self._total)) % self.capacidad
+        nueva = 2 * self.capacidad
+        for nombre in ("_ts", "_price", "_score"):
+            viejo = getattr(self, nombre)
+            arr = np.zeros(nueva, dtype=np.float64)
+            arr[:self._total] = viejo[orden]
+            setattr(self, nombre, arr)
+        self._inicio = 0
+
+    def agregar(self, ts, price, score):
+        if self._total == self.capacidad:
+            self._crecer()
+        i = (self._inicio + self._total) % self.capacidad
+        self._ts[i] = ts
+        self._price[i] = price
+        self._score[i] = score
+        self._total += 1
+        self.suma_score += score
+
+    def expulsar_antes_de(self, limit_time):
+        """Saca por la cola todas las observaciones con ts < limit_time."""
+        while self._total and self._ts[self._inicio] < limit_time:
+            self.suma_score -= self._score[self._inicio]
+            self._inicio = (self._inicio + 1) % self.capacidad
+            self._total -= 1
+            self._salidas += 1
+
+        # Re-sincronizar la suma cada `capacidad` salidas para que no acumule
+        # error de redondeo (coste O(n) cada n salidas -> O(1) amortizado)
+        if self._salidas >= self.capacidad:
+            self._salidas = 0
+            self.suma_score = float(np.sum(self._score[self._indices()]))
+
+    def _indices(self):
+        return (self._inicio + np.arange(self._total)) % self.capacidad
+
+    def primero_price(self):
+        return float(self._price[self._inicio])
+
+    def ultimo_price(self):
+        return float(self._price[(self._inicio + self._total - 1) % self.capacidad])
+
+    def promedio_score(self):
+        return self.suma_score / self._total
+
+    def memoria_bytes(self):
+        """Memoria reservada por los arrays (acotada por el pico de la ventana)."""
+        return self._ts.nbytes + self._price.nbytes + self._score.nbytes
+
 
 class WhaleDetector:
     def __init__(self, ventana_segundos=300):
@@ -7,24 +83,19 @@ class WhaleDetector:
         ventana_segundos: Tiempo para el análisis acumulado (default 300s = 5 min).
         """
         self.ventana_segundos = ventana_segundos
-        # Buffer: Lista de tuplas (timestamp, precio, score)
-        self.history = deque()
+        # Buffer: Arrays circulares (timestamp, precio, score) con suma corriente
+        self.history = VentanaTemporal()
 
     def detectar_estrategia(self, timestamp, micro_score, current_price):
         """
         Analiza la divergencia ACUMULADA en la ventana de tiempo.
         """
         # 1. Guardar foto del momento actual
-        self.history.append({
-            'ts': timestamp,
-            'price': current_price,
-            'score': micro_score
-        })
+        self.history.agregar(timestamp, current_price, micro_score)
 
         # 2. Limpiar datos viejos (Mantener solo la ventana deseada)
         limit_time = timestamp - self.ventana_segundos
-        while self.history and self.history[0]['ts'] < limit_time:
-            self.history.popleft()
+        self.history.expulsar_antes_de(limit_time)
 
         # Si no hay suficiente data (ej. primeros segundos), esperamos
         if len(self.history) < 10:
@@ -32,13 +103,13 @@ class WhaleDetector:
 
         # 3. Calcular Acumulados
         # Precio Inicio vs Precio Fin
-        price_start = self.history[0]['price']
-        price_end = self.history[-1]['price']
+        price_start = self.history.primero_price()
+        price_end = self.history.ultimo_price()
         price_delta = price_end - price_start
 
         # Presión Promedio en el periodo (Sustained Pressure)
-        # Sumamos todos los scores y dividimos. Nos dice la "intención promedio".
-        avg_score = sum(d['score'] for d in self.history) / len(self.history)
+        # Suma corriente / conteo. Nos dice la "intención promedio".
+        avg_score = self.history.promedio_score()
 
         # UMBRALES (Ajustados para promedios, que suelen ser más suaves)
         UMBRAL_INTENSIDAD = 0.09 
@@ -65,4 +136,40 @@ class WhaleDetector:
         elif avg_score > UMBRAL_INTENSIDAD and price_delta > 0:
             return "IMPULSO_ALCISTA", avg_score
 
-        return "RANGO_NEUTRAL", avg_score
\ No newline at end of file
+        return "RANGO_NEUTRAL", avg_score
+
+if __name__ == "__main__":
+    # Comparación rápida contra la versión original (deque + sum) y medición de memoria
+    # (la referencia lleva su propia suma corriente; cada 1000 iteraciones se verifica con fsum exacto)
+    from collections import deque
+    import math
+    import random
+    import sys
+
+    random.seed(3)
+    detector = WhaleDetector(ventana_segundos=300)
+    referencia = deque()
+    suma_ref = 0.0
+    precio = 50000.0
+
+    for n in range(200000):
+        ts = n * 0.01
+        precio += random.choice([-1.0, 0.0, 1.0])
+        score = random.uniform(-1, 1)
+
+        evento, avg = detector.detectar_estrategia(ts, score, precio)
+
+        referencia.append({'ts': ts, 'price': precio, 'score': score})
+        suma_ref += score
+        while referencia[0]['ts'] < ts - 300:
+            suma_ref -= referencia.popleft()['score']
+        if n % 1000 == 0:
+            suma_ref = math.fsum(d['score'] for d in referencia)
+        if len(referencia) >= 10:
+            avg_ref = suma_ref / len(referencia)
+            assert abs(avg - avg_ref) < 1e-9, (n, avg, avg_ref)
+
+    bytes_dict = sys.getsizeof({'ts': 0.0, 'price': 0.0, 'score': 0.0}) + 3 * sys.getsizeof(0.0)
+    print(f"Paridad OK. Ventana: {len(detector.history)} obs | "
+          f"Arrays: {detector.history.memoria_bytes() / 1024:.0f} KB "
+          f"({VentanaTemporal.BYTES_POR_OBSERVACION} B/obs vs ~{bytes_dict} B/obs con dict)")
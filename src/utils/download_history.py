@@ -1,23 +1,96 @@
 import MetaTrader5 as mt5
-import pandas as pd
+import polars as pl
+import glob
 import os
 import sys
 import time
+from datetime import datetime, timedelta, timezone
 
 # Ajusta esto si tu carpeta está en otro lado
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
-from src.features.indicators import TechnicalIndicators
-import polars as pl
 
 # CONFIGURACIÓN
 SYMBOL = "BTCUSD"
 TIMEFRAME = mt5.TIMEFRAME_M1
-BARS_COUNT = 100000  # ~70 días de datos
-OUTPUT_FILE = os.path.join("data", "raw", "historial_completo.csv")
+DIAS_HISTORIA = 730          # Desde dónde empezar si el almacén está vacío (~2 años)
+DIAS_POR_BLOQUE = 7          # Tamaño de cada página (~10.000 velas M1)
+VOL_MA = 20                  # Ventana del volumen promedio del proxy
+OUTPUT_DIR = os.path.join("data", "raw", "historial")   # Parquet particionado anio=YYYY/mes=MM
+
+def ultima_vela_guardada():
+    """Timestamp de la última vela del almacén y sus últimas filas (contexto del rolling), o (None, None)."""
+    archivos = glob.glob(os.path.join(OUTPUT_DIR, "anio=*", "mes=*", "*.parquet"))
+    if not archivos:
+        return None, None
+
+    # Solo hace falta abrir la última partición (anio/mes ordenan como texto)
+    ultima_particion = max(os.path.dirname(a) for a in archivos)
+    df_tail = (
+        pl.scan_parquet(os.path.join(ultima_particion, "*.parquet"))
+        .select(["Timestamp", "open", "high", "low", "Close_Price", "Vol"])
+        .sort("Timestamp")
+        .tail(VOL_MA - 1)
+        .collect()
+    )
+    return df_tail["Timestamp"][-1], df_tail
+
+def procesar_bloque(df_raw: pl.DataFrame, contexto: pl.DataFrame = None) -> pl.DataFrame:
+    """
+    Convierte las velas crudas de MT5 y calcula el Micro_Score proxy (vectorizado en Polars).
+    `contexto`: últimas velas ya guardadas para que el rolling no se reinicie en cada bloque.
+    """
+    df = df_raw.select([
+        pl.from_epoch("time", time_unit="s").alias("Timestamp"),
+        pl.col("open").cast(pl.Float64),
+        pl.col("high").cast(pl.Float64),
+        pl.col("low").cast(pl.Float64),
+        pl.col("close").cast(pl.Float64).alias("Close_Price"),
+        pl.col("tick_volume").cast(pl.Float64).alias("Vol"),
+    ])
+
+    n_contexto = 0
+    if contexto is not None and contexto.height > 0:
+        n_contexto = contexto.height
+        df = pl.concat([contexto.select(df.columns).cast(df.schema), df])
+
+    # ⚠️ SIMULACIÓN DE MICRO SCORE (Proxy para Backtesting)
+    # Score Proxy: (Cuerpo / Rango) * (Volumen / PromedioVolumen), recortado a [-1, 1]
+    df = df.with_columns([
+        (pl.col("Close_Price") - pl.col("open")).alias("delta"),
+        (pl.col("high") - pl.col("low")).alias("range"),
+        pl.col("Vol").rolling_mean(window_size=VOL_MA).fill_null(pl.col("Vol")).alias("vol_promedio"),
+    ]).with_columns(
+        # Evitamos división por cero
+        pl.when(pl.col("range") == 0).then(0.00001).otherwise(pl.col("range")).alias("denom")
+    ).with_columns(
+        ((pl.col("delta") / pl.col("denom")) * (pl.col("Vol") / pl.col("vol_promedio")))
+        .clip(-1, 1)
+        .fill_nan(0)
+        .fill_null(0)
+        .alias("Micro_Score")
+    ).drop(["denom", "vol_promedio"])
+
+    return df.slice(n_contexto)
+
+def guardar_bloque(df: pl.DataFrame):
+    """Agrega el bloque al almacén particionado (un archivo nuevo por partición y bloque)."""
+    df = df.with_columns([
+        pl.col("Timestamp").dt.year().alias("anio"),
+        pl.col("Timestamp").dt.month().alias("mes"),
+    ])
+    for df_part in df.partition_by(["anio", "mes"], maintain_order=True):
+        anio, mes = df_part["anio"][0], df_part["mes"][0]
+        carpeta = os.path.join(OUTPUT_DIR, f"anio={anio}", f"mes={mes:02d}")
+        os.makedirs(carpeta, exist_ok=True)
+        inicio = df_part["Timestamp"][0].strftime("%Y%m%d%H%M")
+        destino = os.path.join(carpeta, f"bloque_{inicio}.parquet")
+        # Escritura atómica: si se corta a mitad, el archivo no queda a medias
+        df_part.drop(["anio", "mes"]).write_parquet(destino + ".tmp")
+        os.replace(destino + ".tmp", destino)
 
 def descargar_y_procesar():
-    print(f"--- 📥 DESCARGANDO {BARS_COUNT} VELAS DE {SYMBOL} ---")
-    
+    print(f"--- 📥 DESCARGA INCREMENTAL DE {SYMBOL} (BLOQUES DE {DIAS_POR_BLOQUE} DÍAS) ---")
+
     # 1. Inicializar MT5
     if not mt5.initialize():
         print(f"❌ Error iniciando MT5: {mt5.last_error()}")
@@ -36,59 +109,57 @@ def descargar_y_procesar():
     print("⏳ Sincronizando símbolo con el servidor...")
     time.sleep(1)
 
-    # 3. Descargar Raw
-    # Primero probamos con pocas velas para ver si hay conexión
-    check = mt5.copy_rates_from_pos(SYMBOL, TIMEFRAME, 0, 10)
-    if check is None:
-        print("❌ Error CRÍTICO: MT5 no devuelve datos.")
-        print(f"   -> Código de error MT5: {mt5.last_error()}")
+    # 3. Límite: apertura de la vela en formación según MT5. Las velas vienen en hora del
+    #    servidor (UTC+2/+3 típico): con el reloj UTC local se perderían las últimas 2-3 h cerradas.
+    actual = mt5.copy_rates_from_pos(SYMBOL, TIMEFRAME, 0, 1)
+    if actual is None or len(actual) == 0:
+        print(f"❌ MT5 no devolvió la vela actual: {mt5.last_error()}")
         mt5.shutdown()
         return
+    limite = datetime.fromtimestamp(int(actual[0]["time"]), timezone.utc)
 
-    # Si la prueba pasó, descargamos todo el bloque
-    print(f"✅ Conexión verificada. Descargando bloque masivo ({BARS_COUNT})...")
-    rates = mt5.copy_rates_from_pos(SYMBOL, TIMEFRAME, 0, BARS_COUNT)
-    mt5.shutdown()
-    
-    if rates is None or len(rates) == 0:
-        print("❌ Falló la descarga masiva (retornó vacío). Intenta con menos velas.")
-        return
+    # 4. Punto de partida: reanudar desde la última vela guardada
+    ultimo_ts, contexto = ultima_vela_guardada()
+    if ultimo_ts is None:
+        desde = limite - timedelta(days=DIAS_HISTORIA)
+        print(f"📂 Almacén vacío. Descargando desde {desde:%Y-%m-%d}.")
+    else:
+        desde = ultimo_ts.replace(tzinfo=timezone.utc) + timedelta(minutes=1)
+        print(f"📂 Reanudando desde {desde:%Y-%m-%d %H:%M} (última vela guardada: {ultimo_ts}).")
 
-    print(f"✅ Descargados {len(rates)} registros. Procesando indicadores...")
-
-    # 4. Procesamiento (Simulación de Micro Score)
-    df = pd.DataFrame(rates)
-    df['time'] = pd.to_datetime(df['time'], unit='s')
-    
-    # Renombrar
-    df = df.rename(columns={
-        'time': 'Timestamp', 
-        'close': 'Close_Price',
-        'tick_volume': 'Vol'
-    })
-    
-    # ⚠️ SIMULACIÓN DE MICRO SCORE (Proxy para Backtesting)
-    # Usamos la relación Precio/Volumen para estimar dónde hubo ballenas en el pasado
-    df['delta'] = df['Close_Price'] - df['open']
-    df['range'] = df['high'] - df['low']
-    # Evitamos división por cero
-    denom = df['range'].replace(0, 0.00001)
-    
-    # Score Proxy: (Cuerpo / Rango) * (Volumen / PromedioVolumen)
-    vol_promedio = df['Vol'].rolling(20).mean().fillna(df['Vol'])
-    df['Micro_Score'] = (df['delta'] / denom) * (df['Vol'] / vol_promedio)
-    
-    # Normalizar entre -1 y 1
-    df['Micro_Score'] = df['Micro_Score'].clip(-1, 1)
-    
-    # Limpiar columnas no deseadas
-    df = df.fillna(0)
-    
-    # Guardar
-    os.makedirs(os.path.dirname(OUTPUT_FILE), exist_ok=True)
-    df.to_csv(OUTPUT_FILE, index=False)
-    print(f"💾 Archivo guardado: {OUTPUT_FILE}")
-    print("👉 AHORA: Ve a 'src/models/optimize_strategy.py' y asegúrate de que apunte a este archivo.")
+    # La vela actual todavía se está formando: no se guarda (time < limite)
+    total = 0
+
+    # 5. Paginación por rango de fechas
+    while desde < limite:
+        hasta = min(desde + timedelta(days=DIAS_POR_BLOQUE), limite)
+        rates = mt5.copy_rates_range(SYMBOL, TIMEFRAME, desde, hasta)
+
+        if rates is None:
+            print(f"❌ MT5 no devolvió datos para {desde:%Y-%m-%d} -> {hasta:%Y-%m-%d}: {mt5.last_error()}")
+            break
+
+        if len(rates) > 0:
+            df_raw = pl.from_numpy(rates).filter(
+                pl.col("time") < int(limite.timestamp())
+            )
+            # copy_rates_range incluye ambos extremos: evitamos repetir la vela frontera
+            if ultimo_ts is not None:
+                df_raw = df_raw.filter(pl.from_epoch("time", time_unit="s") > ultimo_ts)
+
+            if df_raw.height > 0:
+                df = procesar_bloque(df_raw, contexto)
+                guardar_bloque(df)
+                total += df.height
+                ultimo_ts = df["Timestamp"][-1]
+                contexto = df.select(["Timestamp", "open", "high", "low", "Close_Price", "Vol"]).tail(VOL_MA - 1)
+                print(f"   ✅ {desde:%Y-%m-%d} -> {hasta:%Y-%m-%d}: {df.height} velas")
+
+        desde = hasta
+
+    mt5.shutdown()
+    print(f"💾 {total} velas nuevas en {OUTPUT_DIR}")
+    print("👉 Lectura: pl.scan_parquet('data/raw/historial/**/*.parquet')")
 
 if __name__ == "__main__":
-    descargar_y_procesar()
\ No newline at end of file
+    descargar_y_procesar()
@@ -0,0 +1,58 @@
+import polars as pl
+
+def _con_cubos(df: pl.DataFrame, ancho_px: int) -> pl.DataFrame:
+    """Agrega `_idx` (fila) y `_cubo` (píxel). Int64: con UInt32, _idx * ancho_px se desborda pasado 2^32."""
+    n = df.height
+    df = df.with_row_index("_idx") if hasattr(df, "with_row_index") else df.with_row_count("_idx")
+    return df.with_columns(pl.col("_idx").cast(pl.Int64)).with_columns((pl.col("_idx") * ancho_px // n).alias("_cubo"))
+
+
+def reducir_minmax(df: pl.DataFrame, ancho_px: int, cols_y) -> pl.DataFrame:
+    """
+    Reducción visual por cubos de píxel (min/max, estilo M4).
+
+    Las filas se reparten en `ancho_px` cubos consecutivos y de cada cubo se conserva
+    la primera y la última fila, más la del mínimo y la del máximo de cada columna de
+    `cols_y`. A un píxel por cubo, la línea dibujada es la misma que con todos los puntos.
+
+    Resultado: como máximo (2 + 2 * len(cols_y)) * ancho_px filas, sin importar el largo
+    de la ventana.
+    """
+    n = df.height
+    por_cubo = 2 + 2 * len(cols_y)
+    if ancho_px <= 0 or n <= por_cubo * ancho_px:
+        return df
+
+    df = _con_cubos(df, ancho_px)
+
+    extremos = [pl.col("_idx").first().alias("_primero"), pl.col("_idx").last().alias("_ultimo")]
+    for c in cols_y:
+        extremos.append(pl.col("_idx").sort_by(pl.col(c)).first().alias(f"_min_{c}"))
+        extremos.append(pl.col("_idx").sort_by(pl.col(c)).last().alias(f"_max_{c}"))
+
+    elegidos = (
+        df.group_by("_cubo").agg(extremos)
+        .drop("_cubo")
+        .select(pl.concat_list(pl.all()).alias("_idx"))
+        .explode("_idx")
+        .unique()
+        .get_column("_idx")
+    )
+
+    return df.filter(pl.col("_idx").is_in(elegidos)).sort("_idx").drop(["_idx", "_cubo"])
+
+
+def reducir_marcadores(df: pl.DataFrame, ancho_px: int, filtro: pl.Expr) -> pl.DataFrame:
+    """
+    Filas que cumplen `filtro` (ej. estrategia == "ABSORCION"), a lo sumo una por cubo de
+    píxel: los mismos cubos que `reducir_minmax` sobre el frame completo, así que un
+    marcador descartado caería en el mismo píxel que el que se dibuja.
+    """
+    if ancho_px <= 0 or df.height <= ancho_px:
+        return df.filter(filtro)
+    return (
+        _con_cubos(df, ancho_px)
+        .filter(filtro)
+        .unique(subset=["_cubo"], keep="first", maintain_order=True)
+        .drop(["_idx", "_cubo"])
+    )
@@ -0,0 +1,85 @@
+import csv
+import os
+from collections import deque
+import polars as pl
+
+class SeguidorCSV:
+    def __init__(self, path, ventana=100, schema_overrides=None, bytes_por_linea=256):
+        """
+        Lector incremental tipo `tail -f` para un CSV que crece por el final.
+
+        Recuerda el offset en bytes y en cada lectura solo parsea las líneas nuevas,
+        manteniendo en memoria las últimas `ventana` filas. Si el archivo se rota
+        (cambia de inode) o se trunca, vuelve a empezar desde la cabecera.
+        """
+        self.path = path
+        self.ventana = ventana
+        self.schema_overrides = schema_overrides or {}
+        self.bytes_por_linea = bytes_por_linea
+
+        self.columnas = None
+        self.filas = deque(maxlen=ventana)
+        self._offset = 0
+        self._inode = None
+        self._resto = b""   # Línea final incompleta (el escritor aún no puso el salto)
+
+    def _reiniciar(self, f, st):
+        """Lee la cabecera y posiciona el offset cerca del final (no hace falta parsear todo)."""
+        self.filas.clear()
+        self._resto = b""
+        self._inode = st.st_ino
+
+        f.seek(0)
+        cabecera = f.readline()
+        if not cabecera.endswith(b"\n"):
+            self.columnas = None
+            self._offset = 0
+            return
+        self.columnas = next(csv.reader([cabecera.decode("utf-8").strip()]))
+        inicio_datos = f.tell()
+
+        # Arranque: solo el tramo final que alcanza para llenar la ventana
+        cola = self.ventana * self.bytes_por_linea * 2
+        if st.st_size - inicio_datos > cola:
+            f.seek(st.st_size - cola)
+            f.readline()  # Descartar la línea cortada por el seek
+            self._offset = f.tell()
+        else:
+            self._offset = inicio_datos
+
+    def leer(self) -> pl.DataFrame:
+        """Incorpora lo nuevo del archivo y devuelve la ventana como DataFrame (None si no hay archivo)."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self.columnas = None
+            self.filas.clear()
+            return None
+
+        with open(self.path, "rb") as f:
+            # Rotación (archivo nuevo) o truncado (más chico que lo ya leído)
+            if self.columnas is None or st.st_ino != self._inode or st.st_size < self._offset:
+                self._reiniciar(f, st)
+                if self.columnas is None:
+                    return None
+
+            if st.st_size > self._offset:
+                f.seek(self._offset)
+                nuevo = f.read(st.st_size - self._offset)
+                self._offset = st.st_size
+
+                bloque = self._resto + nuevo
+                corte = bloque.rfind(b"\n") + 1
+                self._resto = bloque[corte:]
+                if corte:
+                    lineas = bloque[:corte].decode("utf-8", errors="ignore").splitlines()
+                    for fila in csv.reader(lineas):
+                        if len(fila) == len(self.columnas):
+                            self.filas.append(fila)
+
+        return self._a_dataframe()
+
+    def _a_dataframe(self) -> pl.DataFrame:
+        df = pl.DataFrame(list(self.filas), schema={c: pl.Utf8 for c in self.columnas}, orient="row")
+        casts = [pl.col(c).cast(t, strict=False) for c, t in self.schema_overrides.items() if c in self.columnas]
+        return df.with_columns(casts) if casts else df
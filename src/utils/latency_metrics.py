@@ -0,0 +1,257 @@
+import glob
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class HistogramaLatencia:
+    # Log-lineal estilo HDR: 64 cubos exactos y luego 32 por cada potencia de 2 (error relativo <= 1/32)
+    LINEAL = 64
+    SUB = 32
+    OCTAVAS = 36          # Hasta ~2^41 us (más de 20 días): nada real se sale
+    N_CUBOS = LINEAL + OCTAVAS * SUB
+
+    def __init__(self):
+        """
+        Histograma de latencias en microsegundos con memoria fija (~1.200 contadores).
+
+        `registrar` es O(1) y sin locks: cada histograma tiene un único escritor (cada etapa
+        la mide un solo hilo) y el exportador lo reemplaza por uno nuevo en vez de leerlo
+        mientras crece.
+        """
+        self.cuentas = [0] * self.N_CUBOS
+        self.n = 0
+        self.suma = 0
+        self.maximo = 0
+
+    @classmethod
+    def _indice(cls, v):
+        if v < cls.LINEAL:
+            return v
+        e = v.bit_length() - 6
+        return min(cls.LINEAL + (e - 1) * cls.SUB + ((v >> e) - cls.SUB), cls.N_CUBOS - 1)
+
+    @classmethod
+    def _valor_superior(cls, idx):
+        """Mayor valor (us) que cae en el cubo `idx`."""
+        if idx < cls.LINEAL:
+            return idx
+        e = (idx - cls.LINEAL) // cls.SUB + 1
+        m = (idx - cls.LINEAL) % cls.SUB + cls.SUB
+        return ((m + 1) << e) - 1
+
+    def registrar(self, us):
+        v = int(us) if us > 0 else 0
+        self.cuentas[self._indice(v)] += 1
+        self.n += 1
+        self.suma += v
+        if v > self.maximo:
+            self.maximo = v
+
+    def percentil(self, p):
+        if self.n == 0:
+            return 0
+        objetivo = max(1, int(round(self.n * p / 100.0)))
+        acumulado = 0
+        for idx, c in enumerate(self.cuentas):
+            acumulado += c
+            if acumulado >= objetivo:
+                return min(self._valor_superior(idx), self.maximo)
+        return self.maximo
+
+    def resumen(self):
+        return {
+            "n": self.n,
+            "media_us": round(self.suma / self.n, 1) if self.n else 0.0,
+            "p50_us": self.percentil(50),
+            "p90_us": self.percentil(90),
+            "p99_us": self.percentil(99),
+            "p999_us": self.percentil(99.9),
+            "max_us": self.maximo
+        }
+
+
+class DesfaseServidor:
+    def __init__(self, muestras=50, redondeo_ms=15 * 60 * 1000):
+        """
+        `time_msc` viene en hora del servidor de trading, no en epoch UTC (típico UTC+2/+3).
+        Estima una vez el desfase reloj local - servidor como la mediana de las primeras
+        `muestras` diferencias, redondeada a `redondeo_ms` (los husos van de a 15 min), para
+        que la antigüedad de un tic sea `local - time_msc - desfase`.
+        """
+        self.muestras = muestras
+        self.redondeo_ms = redondeo_ms
+        self._diferencias = []
+        self.desfase_ms = None
+
+    def observar(self, local_ms, servidor_ms):
+        """Retorna el desfase (ms) una vez estimado, o None mientras junta muestras."""
+        if self.desfase_ms is None:
+            self._diferencias.append(local_ms - servidor_ms)
+            if len(self._diferencias) >= self.muestras:
+                mediana = sorted(self._diferencias)[len(self._diferencias) // 2]
+                self.desfase_ms = round(mediana / self.redondeo_ms) * self.redondeo_ms
+                self._diferencias = []
+        return self.desfase_ms
+
+
+class MetricasLatencia:
+    def __init__(self, carpeta=os.path.join("data", "metrics"), intervalo_seg=10.0, puerto=None,
+                 exportar_archivo=True, retener_archivos=48):
+        """
+        Instrumentación del camino caliente (tic -> análisis -> estrategia -> orden).
+
+        Uso en el bucle:
+            t0 = metricas.inicio()
+            ... etapa ...
+            metricas.registrar("estrategia", t0)
+            metricas.registrar_valor("staleness_feed", us)   # valores ya medidos
+
+        - Reloj monotónico (perf_counter_ns); cada medición cuesta ~1 us.
+        - Varios hilos pueden medir (detección, feed, ejecutor), pero cada etapa desde uno solo.
+        - Cada `intervalo_seg` un hilo exportador cambia cada histograma por uno vacío y
+          publica el resumen del intervalo (p50/p90/p99/p99.9/max por etapa).
+          Ventana de pérdida: una medición cuyo hilo tomó el histograma justo antes del cambio
+          cae en el ya exportado y no se cuenta (a lo sumo una por etapa y exportación).
+          Destinos:
+            * archivo JSONL rotado por hora en <carpeta>/latencias_YYYYMMDD_HH.jsonl
+              (se conservan los últimos `retener_archivos`)
+            * opcional: GET http://127.0.0.1:<puerto>/metrics con el último resumen en JSON
+        """
+        self.carpeta = carpeta
+        self.intervalo_seg = intervalo_seg
+        self.exportar_archivo = exportar_archivo
+        self.retener_archivos = retener_archivos
+        self.puerto = puerto
+
+        self._hist = {}
+        self.ultimo_reporte = {}
+        self._activo = threading.Event()
+        self._hilo = None
+        self._servidor = None
+        if exportar_archivo:
+            os.makedirs(self.carpeta, exist_ok=True)
+
+    # ------------------------------------------------------------------
+    # CAMINO CALIENTE
+    # ------------------------------------------------------------------
+    @staticmethod
+    def inicio():
+        return time.perf_counter_ns()
+
+    def registrar(self, etapa, t0_ns):
+        """Registra la duración desde `t0_ns` (de `inicio()`) hasta ahora."""
+        self.registrar_valor(etapa, (time.perf_counter_ns() - t0_ns) // 1000)
+
+    def registrar_valor(self, etapa, us):
+        h = self._hist.get(etapa)
+        if h is None:
+            h = self._hist[etapa] = HistogramaLatencia()
+        h.registrar(us)
+
+    # ------------------------------------------------------------------
+    # EXPORTACIÓN
+    # ------------------------------------------------------------------
+    def iniciar(self):
+        if self._hilo is not None and self._hilo.is_alive():
+            return
+        self._activo.set()
+        self._hilo = threading.Thread(target=self._bucle_exportador, name="LatencyExporter", daemon=True)
+        self._hilo.start()
+        if self.puerto:
+            self._iniciar_endpoint()
+
+    def detener(self):
+        """Exporta el último intervalo y apaga hilo y endpoint."""
+        if not self._activo.is_set():
+            return
+        self._activo.clear()
+        if self._hilo is not None:
+            self._hilo.join(timeout=5)
+        self._exportar()
+        if self._servidor is not None:
+            self._servidor.shutdown()
+            self._servidor = None
+
+    def _bucle_exportador(self):
+        while self._activo.is_set():
+            time.sleep(self.intervalo_seg)
+            if self._activo.is_set():
+                self._exportar()
+
+    def _exportar(self):
+        # Intercambio por histograma (el dict nunca se reemplaza: una etapa nueva que un hilo
+        # agrega mientras tanto queda en el dict vivo y sale en el próximo reporte)
+        actuales = {}
+        for nombre in list(self._hist.copy()):
+            actuales[nombre] = self._hist[nombre]
+            self._hist[nombre] = HistogramaLatencia()
+        actuales = {nombre: h for nombre, h in actuales.items() if h.n}
+        if not actuales:
+            return
+        reporte = {
+            "ts": datetime.now().isoformat(timespec="seconds"),
+            "intervalo_seg": self.intervalo_seg,
+            "etapas": {nombre: h.resumen() for nombre, h in sorted(actuales.items())}
+        }
+        self.ultimo_reporte = reporte
+
+        if self.exportar_archivo:
+            try:
+                ruta = os.path.join(self.carpeta, f"latencias_{datetime.now():%Y%m%d_%H}.jsonl")
+                with open(ruta, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(reporte) + "\n")
+                self._rotar()
+            except OSError as e:
+                print(f"[METRICAS ERROR] No se pudo escribir {self.carpeta}: {e}")
+
+    def _rotar(self):
+        archivos = sorted(glob.glob(os.path.join(self.carpeta, "latencias_*.jsonl")))
+        for viejo in archivos[:-self.retener_archivos]:
+            os.remove(viejo)
+
+    def _iniciar_endpoint(self):
+        metricas = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") != "/metrics":
+                    self.send_error(404)
+                    return
+                cuerpo = json.dumps(metricas.ultimo_reporte).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(cuerpo)))
+                self.end_headers()
+                self.wfile.write(cuerpo)
+
+            def log_message(self, *args):
+                pass  # Sin ruido en la consola del dashboard
+
+        try:
+            self._servidor = ThreadingHTTPServer(("127.0.0.1", self.puerto), _Handler)
+        except OSError as e:
+            print(f"[METRICAS ERROR] No se pudo abrir el puerto {self.puerto}: {e}")
+            return
+        threading.Thread(target=self._servidor.serve_forever, name="LatencyEndpoint", daemon=True).start()
+
+
+if __name__ == "__main__":
+    # Costo por medición y precisión de percentiles contra el cálculo exacto
+    import random
+    m = MetricasLatencia(exportar_archivo=False)
+    n = 200_000
+    t0 = time.perf_counter()
+    for _ in range(n):
+        m.registrar("vacio", m.inicio())
+    print(f"Costo por medición: {(time.perf_counter() - t0) / n * 1e6:.2f} us")
+
+    h = HistogramaLatencia()
+    valores = [int(random.lognormvariate(5, 1.5)) for _ in range(100_000)]
+    for v in valores: h.registrar(v)
+    valores.sort()
+    for p in (50, 90, 99, 99.9):
+        exacto = valores[max(0, int(round(len(valores) * p / 100.0)) - 1)]
+        print(f"p{p}: histograma {h.percentil(p)} us | exacto {exacto} us")
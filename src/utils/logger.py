@@ -1,71 +1,228 @@
+import atexit
 import csv
+import glob
 import os
+import queue
+import threading
+import time
 import polars as pl
 from datetime import datetime
 
 class DataLogger:
-    def __init__(self, filename="sesion_ballenas.csv"):
+    # DEFINICIÓN DE COLUMNAS (SCHEMA FIJO)
+    # Es vital que coincida con lo que esperamos leer luego
+    SCHEMA = {
+        "Timestamp": pl.Datetime("ms"), "timestamp_ms": pl.Int64,
+        "Close_Price": pl.Float64, "EMA_Princ": pl.Float64, "RSI_Val": pl.Float64, "ATR_Act": pl.Float64,
+        # Datos Micro
+        "Micro_Score": pl.Float64, "Micro_Buy_Vol": pl.Int64, "Micro_Sell_Vol": pl.Int64,
+        # Datos IA
+        "Regimen_Actual": pl.Int64,
+        **{f"prob_regimen_{i}": pl.Float64 for i in range(7)}
+    }
+
+    _FIN = object() # Señal de apagado para el hilo escritor
+
+    def __init__(self, filename="sesion_ballenas", formato="parquet", max_filas=60, intervalo_seg=30.0):
+        """
+        Logger con escritura en segundo plano.
+
+        guardar_snapshot solo arma la fila y la encola: el hilo escritor junta filas en
+        memoria y las vuelca cuando hay `max_filas` o pasan `intervalo_seg` segundos.
+        - formato="parquet": segmentos append-only (data/raw/<filename>/seg_*.parquet) con schema fijo.
+        - formato="csv": compatibilidad, anexa el lote entero a data/raw/<filename>.csv.
+        """
         # Asegurar directorio
         self.raw_dir = os.path.join("data", "raw")
         os.makedirs(self.raw_dir, exist_ok=True)
-        self.filepath = os.path.join(self.raw_dir, filename)
-        
-        # DEFINICIÓN DE COLUMNAS (SCHEMA)
-        # Es vital que coincida con lo que esperamos leer luego
-        self.fieldnames = [
-            "Timestamp", "timestamp_ms", 
-            "Close_Price", "EMA_Princ", "RSI_Val", "ATR_Act", 
-            # Datos Micro
-            "Micro_Score", "Micro_Buy_Vol", "Micro_Sell_Vol",
-            # Datos IA (CRUCIAL: Ahora los definimos explícitamente)
-            "Regimen_Actual", 
-            "prob_regimen_0", "prob_regimen_1", "prob_regimen_2", 
-            "prob_regimen_3", "prob_regimen_4", "prob_regimen_5", "prob_regimen_6"
-        ]
-        
-        # Si el archivo no existe, crearlo con cabeceras
-        if not os.path.exists(self.filepath):
-            with open(self.filepath, mode='w', newline='') as f:
-                writer = csv.DictWriter(f, fieldnames=self.fieldnames)
-                writer.writeheader()
-
-    def guardar_snapshot(self, ts_ms, micro_data, macro_data, df_ticks):
+        self.formato = formato
+        self.max_filas = max_filas
+        self.intervalo_seg = intervalo_seg
+        self.fieldnames = list(self.SCHEMA.keys())
+
+        nombre = filename[:-4] if filename.endswith(".csv") else filename
+        if formato == "csv":
+            self.filepath = os.path.join(self.raw_dir, f"{nombre}.csv")
+            # Si el archivo no existe, crearlo con cabeceras
+            if not os.path.exists(self.filepath):
+                with open(self.filepath, mode='w', newline='') as f:
+                    writer = csv.DictWriter(f, fieldnames=self.fieldnames)
+                    writer.writeheader()
+        else:
+            self.filepath = os.path.join(self.raw_dir, nombre)
+            os.makedirs(self.filepath, exist_ok=True)
+            # Historia previa al cambio de formato: pasa a ser un segmento más
+            migrar_csv_heredado(nombre)
+
+        # Hilo escritor
+        self._cola = queue.Queue()
+        self._segmento = 0
+        self._sesion = datetime.now().strftime('%Y%m%d_%H%M%S')
+        self._hilo = threading.Thread(target=self._bucle_escritor, name="DataLoggerWriter", daemon=True)
+        self._cerrado = False
+        self._hilo.start()
+        atexit.register(self.cerrar)
+
+    def guardar_snapshot(self, ts_ms, micro_data, macro_data):
         """
-        Guarda una fila en el CSV combinando datos Micro y Macro.
+        Encola una fila combinando datos Micro y Macro (no toca disco).
         """
         try:
-            # 1. Preparar Timestamp legible
-            ts_str = datetime.fromtimestamp(ts_ms / 1000.0).strftime('%Y-%m-%d %H:%M:%S')
-            
-            # 2. Construir la fila base
             row = {
-                "Timestamp": ts_str,
-                "timestamp_ms": ts_ms,
+                "Timestamp": datetime.fromtimestamp(ts_ms / 1000.0),
+                "timestamp_ms": int(ts_ms),
                 "Close_Price": macro_data.get("Close_Price", 0.0),
                 "EMA_Princ": macro_data.get("EMA_Princ", 0.0),
                 "RSI_Val": macro_data.get("RSI_Val", 0.0),
                 "ATR_Act": macro_data.get("ATR_Act", 0.0),
-                
+
                 "Micro_Score": micro_data.get("desbalance", 0.0),
                 "Micro_Buy_Vol": micro_data.get("compras", 0),
                 "Micro_Sell_Vol": micro_data.get("ventas", 0),
+
+                # Régimen Ganador
+                "Regimen_Actual": macro_data.get("Regimen_Actual", 0),
             }
 
-            # 3. EXTRAER DATOS IA (AQUÍ ESTABA EL ERROR)
-            # El logger anterior no buscaba estas claves explícitamente.
-            
-            # Régimen Ganador
-            row["Regimen_Actual"] = macro_data.get("Regimen_Actual", 0)
-            
             # Probabilidades (Iteramos para extraerlas si existen)
             for i in range(7):
                 key = f"prob_regimen_{i}"
                 row[key] = macro_data.get(key, 0.0)
 
-            # 4. Escribir al CSV
-            with open(self.filepath, mode='a', newline='') as f:
-                writer = csv.DictWriter(f, fieldnames=self.fieldnames, extrasaction='ignore')
-                writer.writerow(row)
-                
+            self._cola.put_nowait(row)
+
+        except Exception as e:
+            print(f"[LOGGER ERROR] No se pudo encolar fila: {e}")
+
+    def _bucle_escritor(self):
+        lote = []
+        ultimo_flush = time.monotonic()
+        while True:
+            espera = max(0.0, self.intervalo_seg - (time.monotonic() - ultimo_flush))
+            try:
+                row = self._cola.get(timeout=espera)
+            except queue.Empty:
+                row = None
+
+            fin = row is self._FIN
+            if row is not None and not fin:
+                lote.append(row)
+
+            # Política de volcado: por tamaño, por tiempo o al apagar
+            vencido = time.monotonic() - ultimo_flush >= self.intervalo_seg
+            if lote and (fin or vencido or len(lote) >= self.max_filas):
+                self._escribir_lote(lote)
+                lote = []
+            if not lote:
+                ultimo_flush = time.monotonic()
+
+            if fin:
+                return
+
+    def _escribir_lote(self, lote):
+        try:
+            if self.formato == "csv":
+                with open(self.filepath, mode='a', newline='') as f:
+                    writer = csv.DictWriter(f, fieldnames=self.fieldnames, extrasaction='ignore')
+                    for row in lote:
+                        row = dict(row, Timestamp=row["Timestamp"].strftime('%Y-%m-%d %H:%M:%S'))
+                        writer.writerow(row)
+            else:
+                # Segmento nuevo: se escribe a .tmp y se renombra (los lectores nunca ven archivos a medias)
+                df = self._lote_a_dataframe(lote)
+                if df.height == 0:
+                    return
+                destino = os.path.join(self.filepath, f"seg_{self._sesion}_{self._segmento:06d}.parquet")
+                df.write_parquet(destino + ".tmp")
+                os.replace(destino + ".tmp", destino)
+                self._segmento += 1
         except Exception as e:
-            print(f"[LOGGER ERROR] No se pudo guardar fila: {e}")
\ No newline at end of file
+            print(f"[LOGGER ERROR] No se pudo guardar lote ({len(lote)} filas): {e}")
+
+    def _lote_a_dataframe(self, lote):
+        """Lote tipado; una fila que no encaja en el schema se descarta sola, no todo el lote."""
+        try:
+            return pl.DataFrame(lote, schema=self.SCHEMA)
+        except Exception:
+            pass
+
+        validas = []
+        for row in lote:
+            try:
+                pl.DataFrame([row], schema=self.SCHEMA)
+                validas.append(row)
+            except Exception as e:
+                print(f"[LOGGER ERROR] Fila descartada ({row.get('Timestamp')}): {e}")
+        return pl.DataFrame(validas, schema=self.SCHEMA)
+
+    def cerrar(self):
+        """Vacía lo pendiente y detiene el hilo escritor (llamar al apagar el bot)."""
+        if self._cerrado:
+            return
+        self._cerrado = True
+        self._cola.put(self._FIN)
+        self._hilo.join(timeout=10)
+
+
+def migrar_csv_heredado(filename="sesion_ballenas"):
+    """
+    Convierte UNA vez data/raw/<filename>.csv (formato anterior) en un segmento Parquet de la
+    carpeta de la sesión y renombra el CSV a .csv.migrado. Así los lectores de la carpeta no
+    pierden la historia grabada antes del cambio. Solo actúa si la carpeta de segmentos existe.
+    Retorna la ruta del segmento creado, o None.
+    """
+    nombre = filename[:-4] if filename.endswith(".csv") else filename
+    carpeta = os.path.join("data", "raw", nombre)
+    archivo_csv = os.path.join("data", "raw", f"{nombre}.csv")
+    if not os.path.isdir(carpeta) or not os.path.exists(archivo_csv):
+        return None
+
+    try:
+        df = pl.read_csv(archivo_csv, ignore_errors=True, infer_schema_length=0)  # Todo como texto
+        if "Timestamp" not in df.columns:
+            print(f"[LOGGER] {archivo_csv} no tiene columna Timestamp: no se migra")
+            return None
+
+        df = df.with_columns(pl.col("Timestamp").str.to_datetime(strict=False).cast(DataLogger.SCHEMA["Timestamp"]))
+        if "timestamp_ms" not in df.columns:
+            df = df.with_columns(pl.col("Timestamp").dt.epoch(time_unit="ms").alias("timestamp_ms"))
+        df = df.select([
+            pl.col(c).cast(t, strict=False) if c in df.columns else pl.lit(None, dtype=t).alias(c)
+            for c, t in DataLogger.SCHEMA.items()
+        ]).drop_nulls(subset=["Timestamp"]).sort("Timestamp")
+
+        # Nombre que ordena antes que cualquier segmento de sesión (seg_YYYYMMDD_...)
+        destino = os.path.join(carpeta, "seg_00000000_000000_heredado.parquet")
+        df.write_parquet(destino + ".tmp")
+        os.replace(destino + ".tmp", destino)
+        os.replace(archivo_csv, archivo_csv + ".migrado")
+        print(f"[LOGGER] {archivo_csv} migrado a {destino} ({df.height} filas)")
+        return destino
+    except FileNotFoundError:
+        return None  # Otro proceso ya lo migró
+    except Exception as e:
+        print(f"[LOGGER ERROR] No se pudo migrar {archivo_csv}: {e}")
+        return None
+
+
+def leer_sesion(filename="sesion_ballenas") -> pl.DataFrame:
+    """
+    Lee la sesión grabada (segmentos Parquet o CSV heredado) y agrega la columna `datetime`.
+    Retorna None si no hay datos.
+    """
+    nombre = filename[:-4] if filename.endswith(".csv") else filename
+    carpeta = os.path.join("data", "raw", nombre)
+    archivo_csv = os.path.join("data", "raw", f"{nombre}.csv")
+    migrar_csv_heredado(nombre)
+
+    if glob.glob(os.path.join(carpeta, "*.parquet")):
+        df = pl.scan_parquet(os.path.join(carpeta, "*.parquet")).collect()
+        return df.with_columns(pl.col("Timestamp").alias("datetime"))
+
+    if os.path.exists(archivo_csv):
+        df = pl.read_csv(archivo_csv, ignore_errors=True)
+        if "Timestamp" in df.columns:
+            df = df.with_columns(pl.col("Timestamp").str.to_datetime(strict=False).alias("datetime"))
+        return df
+
+    return None
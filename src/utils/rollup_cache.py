@@ -0,0 +1,201 @@
+import glob
+import os
+import polars as pl
+from src.utils.logger import migrar_csv_heredado
+
+class RollupCache:
+    TIMEFRAMES = ("5m", "15m", "1h")
+    N_REGIMENES = 7
+    _COLUMNAS_ENTRADA = ["datetime", "Close_Price", "EMA_Princ", "Micro_Score", "Regimen_Actual"]
+
+    def __init__(self, sesion="sesion_ballenas"):
+        """
+        Agregados materializados de la sesión grabada para dashboard_history.
+
+        - "1m": filas crudas con price_delta ya calculado (igual que la vista 1m original).
+        - 5m/15m/1h: por cubo se guardan first/last close, EMA last, suma y conteo del
+          score y conteo por régimen. Las filas nuevas solo re-agregan el último cubo,
+          así que el costo de cada refresco es proporcional a lo nuevo.
+        El umbral del slider NO entra aquí: se aplica después con `clasificar`.
+        """
+        self.sesion = sesion
+        self.carpeta = os.path.join("data", "raw", sesion)
+        self.archivo_csv = os.path.join("data", "raw", f"{sesion}.csv")
+        self._segmentos_leidos = set()
+        self._firma_csv = None
+        self._reiniciar()
+
+    def _reiniciar(self):
+        self.crudo = None
+        self.rollups = {tf: None for tf in self.TIMEFRAMES}
+
+    # ------------------------------------------------------------------
+    # INGESTA
+    # ------------------------------------------------------------------
+    def sincronizar(self):
+        """Incorpora lo nuevo del disco. Retorna True si hay datos disponibles."""
+        migrar_csv_heredado(self.sesion)  # No-op salvo la primera vez que conviven CSV y carpeta
+        segmentos = sorted(glob.glob(os.path.join(self.carpeta, "*.parquet")))
+        if segmentos:
+            nuevos = [s for s in segmentos if s not in self._segmentos_leidos]
+            if nuevos:
+                self.agregar(self._normalizar(pl.read_parquet(nuevos)))
+                self._segmentos_leidos.update(nuevos)
+        elif os.path.exists(self.archivo_csv):
+            # CSV heredado: no es append-only tipado, se reconstruye solo si cambió
+            st = os.stat(self.archivo_csv)
+            firma = (st.st_size, st.st_mtime)
+            if firma != self._firma_csv:
+                self._firma_csv = firma
+                self._reiniciar()
+                df = pl.read_csv(self.archivo_csv, ignore_errors=True)
+                if "Timestamp" in df.columns:
+                    df = df.with_columns(pl.col("Timestamp").str.to_datetime(strict=False))
+                    self.agregar(self._normalizar(df))
+        return self.crudo is not None and self.crudo.height > 0
+
+    def _normalizar(self, df):
+        cols = self._COLUMNAS_ENTRADA[1:]
+        return (
+            df.with_columns(
+                [pl.col("Timestamp").alias("datetime")] +
+                [pl.col(c).cast(pl.Float64, strict=False).fill_null(0) for c in cols if c in df.columns]
+            )
+            .drop_nulls(subset=["datetime"])
+            .sort("datetime")
+            .select(["datetime"] + cols)
+        )
+
+    def agregar(self, df):
+        """Anexa filas nuevas (ordenadas) y actualiza todos los agregados."""
+        if df.height == 0:
+            return
+        # Filas más viejas que lo ya agregado (ej. cambio de horario con Timestamp local):
+        # no se pueden fusionar por la cola -> reconstruir desde las filas de entrada
+        if self.crudo is not None and df["datetime"][0] < self.crudo["datetime"][-1]:
+            df = pl.concat([self._entrada_desde_crudo(), df.select(self._COLUMNAS_ENTRADA)]).sort("datetime", maintain_order=True)
+            self._reiniciar()
+
+        self._agregar_crudo(df)
+        for tf in self.TIMEFRAMES:
+            self._agregar_rollup(tf, df)
+
+    def _entrada_desde_crudo(self):
+        # "1m" guarda una fila por fila de entrada: renombrada, devuelve lo que entró por `agregar`
+        return self.crudo.select([
+            pl.col("datetime"),
+            pl.col("close_seg").alias("Close_Price"),
+            pl.col("ema_last").alias("EMA_Princ"),
+            pl.col("score_avg").alias("Micro_Score"),
+            pl.col("regimen_mode").alias("Regimen_Actual"),
+        ])
+
+    def _agregar_crudo(self, df):
+        # price_delta contra la fila anterior (la última ya guardada para la primera nueva)
+        previo = self.crudo["close_seg"][-1] if self.crudo is not None else None
+        nuevo = df.with_columns([
+            (pl.col("Close_Price") - pl.col("Close_Price").shift(1).fill_null(previo if previo is not None else pl.col("Close_Price"))).alias("price_delta"),
+            pl.col("Micro_Score").alias("score_avg"),
+            pl.col("Close_Price").alias("close_seg"),
+            pl.col("EMA_Princ").alias("ema_last"),
+            pl.col("Regimen_Actual").alias("regimen_mode")
+        ]).select(["datetime", "close_seg", "ema_last", "score_avg", "regimen_mode", "price_delta"])
+        self.crudo = nuevo if self.crudo is None else pl.concat([self.crudo, nuevo])
+
+    def _agregar_rollup(self, tf, df):
+        reg_cols = [f"reg_{i}" for i in range(self.N_REGIMENES)]
+        parcial = (
+            df.group_by_dynamic("datetime", every=tf)
+            .agg([
+                pl.col("Close_Price").first().alias("open_seg"),
+                pl.col("Close_Price").last().alias("close_seg"),
+                pl.col("EMA_Princ").last().alias("ema_last"),
+                pl.col("Micro_Score").sum().alias("score_sum"),
+                pl.col("Micro_Score").count().cast(pl.Int64).alias("score_n"),
+            ] + [(pl.col("Regimen_Actual") == i).sum().cast(pl.Int64).alias(f"reg_{i}") for i in range(self.N_REGIMENES)])
+        )
+
+        actual = self.rollups[tf]
+        if actual is None:
+            self.rollups[tf] = parcial
+            return
+
+        # Solo el/los cubos que se solapan con lo nuevo se vuelven a combinar
+        primer_cubo = parcial["datetime"][0]
+        cabeza = actual.filter(pl.col("datetime") < primer_cubo)
+        cola = pl.concat([actual.filter(pl.col("datetime") >= primer_cubo), parcial])
+        fusion = cola.group_by("datetime", maintain_order=True).agg([
+            pl.col("open_seg").first(),
+            pl.col("close_seg").last(),
+            pl.col("ema_last").last(),
+            pl.col("score_sum").sum(),
+            pl.col("score_n").sum(),
+        ] + [pl.col(c).sum() for c in reg_cols])
+        self.rollups[tf] = pl.concat([cabeza, fusion])
+
+    # ------------------------------------------------------------------
+    # CONSULTA
+    # ------------------------------------------------------------------
+    def obtener(self, timeframe, desde=None) -> pl.DataFrame:
+        """Vista con las mismas columnas que usaba el dashboard (sin la columna `estrategia`)."""
+        if timeframe == "1m":
+            df = self.crudo
+        else:
+            df = self.rollups.get(timeframe)
+            if df is not None:
+                reg_cols = [f"reg_{i}" for i in range(self.N_REGIMENES)]
+                df = df.with_columns([
+                    (pl.col("score_sum") / pl.col("score_n")).alias("score_avg"),
+                    pl.concat_list(reg_cols).list.arg_max().cast(pl.Float64).alias("regimen_mode"),
+                    (pl.col("close_seg") - pl.col("open_seg")).alias("price_delta")
+                ])
+        if df is None:
+            return None
+        if desde is not None:
+            df = df.filter(pl.col("datetime") >= desde)
+        return df
+
+
+def clasificar(df, umbral) -> pl.DataFrame:
+    """
+    LÓGICA DE DETECCIÓN (barata, sobre el frame ya agregado)
+    Absorción: Score muy negativo (< -umbral) PERO Precio >= 0
+    Distribución: Score muy positivo (> umbral) PERO Precio <= 0
+    """
+    return df.with_columns(
+        pl.when((pl.col("score_avg") < -umbral) & (pl.col("price_delta") >= 0))
+          .then(pl.lit("ABSORCION"))
+          .when((pl.col("score_avg") > umbral) & (pl.col("price_delta") <= 0))
+          .then(pl.lit("DISTRIBUCION"))
+          .otherwise(pl.lit("NORMAL"))
+          .alias("estrategia")
+    )
+
+
+if __name__ == "__main__":
+    # Paridad: lotes desordenados (llega uno más viejo que la cola) vs todo de una vez
+    import random
+    from datetime import datetime, timedelta
+
+    random.seed(7)
+    t0 = datetime(2025, 10, 26, 0, 0)
+    filas = [{
+        "datetime": t0 + timedelta(seconds=37 * i),
+        "Close_Price": 2000 + random.gauss(0, 2),
+        "EMA_Princ": 2000 + random.gauss(0, 1),
+        "Micro_Score": random.uniform(-1, 1),
+        "Regimen_Actual": float(random.randint(0, 6)),
+    } for i in range(5000)]
+    completo = pl.DataFrame(filas)
+
+    referencia = RollupCache("paridad")
+    referencia.agregar(completo)
+
+    desordenado = RollupCache("paridad")
+    desordenado.agregar(completo.slice(0, 2000))
+    desordenado.agregar(completo.slice(3000, 2000))
+    desordenado.agregar(completo.slice(2000, 1000))   # Más viejo que la cola -> reconstrucción
+
+    for tf in ("1m",) + RollupCache.TIMEFRAMES:
+        a, b = referencia.obtener(tf), desordenado.obtener(tf)
+        print(f"{tf}: {'OK' if a.equals(b) else 'DIFIERE'} ({a.height} filas)")
@@ -0,0 +1,127 @@
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+# Secuencias ANSI (colorama las traduce en Windows)
+_IR_A = "\x1b[{};1H"        # Cursor a fila N, columna 1
+_BORRAR_LINEA = "\x1b[K"    # Borra hasta el final de la línea
+_BORRAR_RESTO = "\x1b[J"    # Borra desde el cursor hasta el final de la pantalla
+_LIMPIAR = "\x1b[2J\x1b[H"
+_OCULTAR_CURSOR = "\x1b[?25l"
+_MOSTRAR_CURSOR = "\x1b[?25h"
+
+class RenderizadorTerminal:
+    def __init__(self, componer, hz=4.0, max_avisos=5, redibujo_completo_seg=30.0, salida=None):
+        """
+        Dashboard de consola en su propio hilo, a frecuencia fija.
+
+        - El hilo de trading solo llama `publicar(snapshot)`: guarda la referencia y vuelve.
+          El snapshot no se modifica después de publicarlo (el renderizador nunca lo toca).
+        - `componer(snapshot) -> list[str]` arma las líneas; solo se reescriben las que cambiaron
+          respecto del cuadro anterior (posicionando el cursor con ANSI, sin `clear` ni subprocesos).
+        - `aviso(msg)`: mensajes sueltos (disparos, errores) que se muestran al pie del dashboard
+          en lugar de imprimirse por encima y desalinear la pantalla.
+        - Cada `redibujo_completo_seg` se repinta todo por si algo externo escribió en la consola.
+        """
+        self.componer = componer
+        self.intervalo = 1.0 / hz
+        self.redibujo_completo_seg = redibujo_completo_seg
+        self.salida = salida or sys.stdout
+
+        self._snapshot = None
+        self._avisos = deque(maxlen=max_avisos)
+        self._version = 0          # Cambia con cada publicar/aviso
+        self._version_dibujada = -1
+        self._pantalla = []        # Líneas del último cuadro dibujado
+        self._ultimo_completo = 0.0
+
+        self._activo = threading.Event()
+        self._hilo = None
+
+    # ------------------------------------------------------------------
+    # HILO DE TRADING (O(1), sin I/O)
+    # ------------------------------------------------------------------
+    def publicar(self, snapshot):
+        self._snapshot = snapshot
+        self._version += 1
+
+    def aviso(self, msg):
+        self._avisos.append(f"{datetime.now():%H:%M:%S} {msg}")
+        self._version += 1
+
+    # ------------------------------------------------------------------
+    # CICLO DE VIDA
+    # ------------------------------------------------------------------
+    def iniciar(self):
+        if self._hilo is not None and self._hilo.is_alive():
+            return
+        self._activo.set()
+        self._hilo = threading.Thread(target=self._bucle_render, name="Dashboard", daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        """Detiene el hilo y deja el cursor debajo del dashboard (para los prints de cierre)."""
+        if not self._activo.is_set():
+            return
+        self._activo.clear()
+        if self._hilo is not None:
+            self._hilo.join(timeout=2)
+        self.salida.write(_IR_A.format(len(self._pantalla) + 1) + _MOSTRAR_CURSOR)
+        self.salida.flush()
+
+    # ------------------------------------------------------------------
+    # HILO DE RENDER
+    # ------------------------------------------------------------------
+    def _bucle_render(self):
+        self.salida.write(_OCULTAR_CURSOR)
+        proximo = time.monotonic()
+        while self._activo.is_set():
+            try:
+                self._dibujar()
+            except Exception as e:
+                # Un error de formato no debe tumbar el hilo; se muestra en el pie
+                self._avisos.append(f"[RENDER ERROR] {e}")
+
+            proximo += self.intervalo
+            espera = proximo - time.monotonic()
+            if espera > 0:
+                time.sleep(espera)
+            else:
+                proximo = time.monotonic()  # Terminal lenta: no acumular cuadros atrasados
+
+    def _dibujar(self):
+        ahora = time.monotonic()
+        completo = ahora - self._ultimo_completo >= self.redibujo_completo_seg
+        version = self._version
+        if version == self._version_dibujada and not completo:
+            return
+
+        snapshot = self._snapshot
+        lineas = []
+        if snapshot is not None:
+            for linea in self.componer(snapshot):
+                lineas.extend(str(linea).split("\n"))
+        if self._avisos:
+            lineas.append("")
+            lineas.extend(list(self._avisos))
+
+        partes = []
+        if completo:
+            partes.append(_LIMPIAR)
+            self._pantalla = []
+            self._ultimo_completo = ahora
+
+        for fila, linea in enumerate(lineas):
+            if fila >= len(self._pantalla) or self._pantalla[fila] != linea:
+                partes.append(_IR_A.format(fila + 1) + linea + _BORRAR_LINEA)
+        if len(lineas) < len(self._pantalla):
+            partes.append(_IR_A.format(len(lineas) + 1) + _BORRAR_RESTO)
+
+        if partes:
+            # Una sola escritura por cuadro
+            self.salida.write("".join(partes))
+            self.salida.flush()
+        self._pantalla = lineas
+        self._version_dibujada = version
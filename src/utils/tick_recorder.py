@@ -0,0 +1,196 @@
+import json
+import os
+import queue
+import threading
+import time
+import polars as pl
+from datetime import datetime, timezone
+
+class TickRecorder:
+    SCHEMA = {"time_msc": pl.Int64, "bid": pl.Float64, "ask": pl.Float64, "flags": pl.UInt32}
+    _FIN = object() # Señal de apagado para el hilo escritor
+
+    def __init__(self, base_dir=os.path.join("data", "raw", "ticks"), max_filas=5000, intervalo_seg=10.0,
+                 intervalo_compactacion_seg=600.0, min_archivos_compactar=20):
+        """
+        Archivo histórico de tics crudos (time_msc, bid, ask, flags) particionado por día según
+        time_msc (hora del servidor de trading, no UTC).
+
+        - registrar() solo encola: un hilo en segundo plano escribe partes Parquet en
+          <base_dir>/fecha=YYYY-MM-DD/ y las compacta cuando se acumulan muchas pequeñas.
+        - indice.json guarda min/max time_msc por archivo: leer_rango() solo abre los
+          archivos que se solapan con el rango pedido.
+        """
+        self.base_dir = base_dir
+        self.max_filas = max_filas
+        self.intervalo_seg = intervalo_seg
+        self.intervalo_compactacion_seg = intervalo_compactacion_seg
+        self.min_archivos_compactar = min_archivos_compactar
+        os.makedirs(self.base_dir, exist_ok=True)
+
+        self.indice_path = os.path.join(self.base_dir, "indice.json")
+        self.indice = self._cargar_indice(self.indice_path)
+
+        self._ultimo = None   # Último tic registrado (para no guardar repetidos)
+        self._parte = 0
+        self._sesion = datetime.now().strftime('%Y%m%d_%H%M%S')
+        self._cola = queue.Queue()
+        self._cerrado = False
+        self._hilo = threading.Thread(target=self._bucle_escritor, name="TickRecorderWriter", daemon=True)
+        self._hilo.start()
+
+    # ------------------------------------------------------------------
+    # HILO DE TRADING
+    # ------------------------------------------------------------------
+    def registrar(self, time_msc, bid, ask, flags=0):
+        """Encola un tic si es distinto del último registrado (O(1), sin I/O)."""
+        tick = (int(time_msc), float(bid), float(ask), int(flags))
+        if tick == self._ultimo:
+            return
+        self._ultimo = tick
+        self._cola.put_nowait(tick)
+
+    def cerrar(self):
+        """Vuelca lo pendiente y detiene el hilo (llamar al apagar el bot)."""
+        if self._cerrado:
+            return
+        self._cerrado = True
+        self._cola.put(self._FIN)
+        self._hilo.join(timeout=30)
+
+    # ------------------------------------------------------------------
+    # HILO ESCRITOR
+    # ------------------------------------------------------------------
+    def _bucle_escritor(self):
+        lote = []
+        ultimo_flush = time.monotonic()
+        ultima_compactacion = time.monotonic()
+        while True:
+            espera = max(0.0, self.intervalo_seg - (time.monotonic() - ultimo_flush))
+            try:
+                tick = self._cola.get(timeout=espera)
+            except queue.Empty:
+                tick = None
+
+            fin = tick is self._FIN
+            if tick is not None and not fin:
+                lote.append(tick)
+
+            vencido = time.monotonic() - ultimo_flush >= self.intervalo_seg
+            if lote and (fin or vencido or len(lote) >= self.max_filas):
+                self._escribir_lote(lote)
+                lote = []
+            if not lote:
+                ultimo_flush = time.monotonic()
+
+            if fin or time.monotonic() - ultima_compactacion >= self.intervalo_compactacion_seg:
+                self.compactar()
+                ultima_compactacion = time.monotonic()
+
+            if fin:
+                return
+
+    def _escribir_lote(self, lote):
+        try:
+            df = pl.DataFrame(lote, schema=self.SCHEMA, orient="row")
+            df = df.with_columns(
+                pl.from_epoch("time_msc", time_unit="ms").dt.strftime("%Y-%m-%d").alias("fecha")
+            )
+            # Un lote puede cruzar medianoche: una parte por día
+            for df_dia in df.partition_by("fecha", maintain_order=True):
+                fecha = df_dia["fecha"][0]
+                carpeta = os.path.join(self.base_dir, f"fecha={fecha}")
+                os.makedirs(carpeta, exist_ok=True)
+                nombre = f"part_{self._sesion}_{self._parte:06d}.parquet"
+                self._parte += 1
+                self._escribir_archivo(df_dia.drop("fecha"), os.path.join(carpeta, nombre))
+            self._guardar_indice()
+        except Exception as e:
+            print(f"[TICK RECORDER ERROR] No se pudo guardar lote ({len(lote)} tics): {e}")
+
+    def _escribir_archivo(self, df, ruta):
+        df.write_parquet(ruta + ".tmp", statistics=True)
+        os.replace(ruta + ".tmp", ruta)
+        clave = os.path.relpath(ruta, self.base_dir).replace(os.sep, "/")
+        self.indice[clave] = {
+            "min_ms": int(df["time_msc"].min()),
+            "max_ms": int(df["time_msc"].max()),
+            "filas": df.height
+        }
+
+    def compactar(self):
+        """
+        Une las partes pequeñas de cada día en un solo archivo ordenado y sin duplicados.
+        - Días pasados: se compactan si tienen más de un archivo.
+        - Día en curso: solo cuando supera `min_archivos_compactar` partes.
+        El "día en curso" sale del último time_msc guardado (las particiones están en hora del
+        servidor: con el reloj local, cerca de medianoche se tomaría por cerrado y se recompactaría).
+        """
+        if not self.indice:
+            return
+        ultimo_ms = max(meta["max_ms"] for meta in self.indice.values())
+        hoy = datetime.fromtimestamp(ultimo_ms / 1000, timezone.utc).strftime("%Y-%m-%d")  # Igual que `fecha=`
+        por_dia = {}
+        for clave in self.indice:
+            por_dia.setdefault(clave.split("/")[0], []).append(clave)
+
+        for particion, claves in por_dia.items():
+            es_hoy = particion == f"fecha={hoy}"
+            if len(claves) < 2 or (es_hoy and len(claves) < self.min_archivos_compactar):
+                continue
+            try:
+                rutas = [os.path.join(self.base_dir, c) for c in claves]
+                df = (
+                    pl.concat([pl.read_parquet(r) for r in rutas])
+                    .unique(subset=["time_msc", "bid", "ask", "flags"], keep="first", maintain_order=True)
+                    .sort("time_msc")
+                )
+                nombre = f"compact_{self._sesion}_{self._parte:06d}.parquet"
+                self._parte += 1
+                self._escribir_archivo(df, os.path.join(self.base_dir, particion, nombre))
+
+                # Primero el índice nuevo, luego borrar las partes viejas
+                for c in claves:
+                    self.indice.pop(c, None)
+                self._guardar_indice()
+                for r in rutas:
+                    os.remove(r)
+            except Exception as e:
+                print(f"[TICK RECORDER ERROR] Compactación de {particion} falló: {e}")
+
+    # ------------------------------------------------------------------
+    # ÍNDICE Y LECTURA
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _cargar_indice(ruta):
+        if os.path.exists(ruta):
+            with open(ruta) as f:
+                return json.load(f)
+        return {}
+
+    def _guardar_indice(self):
+        with open(self.indice_path + ".tmp", "w") as f:
+            json.dump(self.indice, f, indent=1, sort_keys=True)
+        os.replace(self.indice_path + ".tmp", self.indice_path)
+
+
+def leer_rango(desde_ms, hasta_ms, base_dir=os.path.join("data", "raw", "ticks")) -> pl.DataFrame:
+    """
+    Tics con desde_ms <= time_msc <= hasta_ms. Usa el índice min/max para abrir
+    únicamente los archivos que se solapan con el rango.
+    """
+    indice = TickRecorder._cargar_indice(os.path.join(base_dir, "indice.json"))
+    rutas = [
+        os.path.join(base_dir, clave) for clave, meta in sorted(indice.items())
+        if meta["max_ms"] >= desde_ms and meta["min_ms"] <= hasta_ms
+    ]
+    if not rutas:
+        return pl.DataFrame(schema=TickRecorder.SCHEMA)
+
+    return (
+        pl.scan_parquet(rutas)
+        .filter(pl.col("time_msc").is_between(desde_ms, hasta_ms))
+        .unique(subset=["time_msc", "bid", "ask", "flags"], keep="first", maintain_order=True)
+        .sort("time_msc")
+        .collect()
+    )